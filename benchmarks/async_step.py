@@ -0,0 +1,90 @@
+"""
+Benchmark of the overlap between SUMO simulation and (simulated) policy
+inference achieved by step_async/step_wait.
+
+The TraCI socket backend is stepped in a background thread
+(ThreadedSumoGraphEnv), libsumo in a worker process (SumoGraphVectorEnv).
+
+Example:
+    python async_step.py --steps 100 --inference_ms 10
+"""
+
+import os, sys
+import argparse
+import importlib
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+from async_env import ThreadedSumoGraphEnv
+from vector_env import SumoGraphVectorEnv
+
+
+def inference(milliseconds):
+    # stands in for the forward pass of a policy, keeps the CPU busy like real inference would
+    end = time.perf_counter() + milliseconds / 1000.
+    while time.perf_counter() < end:
+        pass
+
+
+def run(env, actions, args, overlap):
+    """Step ``env`` while running inference either after (sequential) or during (overlap) each step.
+
+    :return: Wall time in seconds
+    :rtype: float
+    """
+    env.reset()
+    start = time.perf_counter()
+    for step in range(args.steps):
+        if overlap:
+            env.step_async(actions[step])
+            inference(args.inference_ms)
+            env.step_wait()
+        else:
+            env.step(actions[step])
+            inference(args.inference_ms)
+    return time.perf_counter() - start
+
+
+def report(name, sequential, overlapped, stats):
+    print(f"{name}: sequential {sequential:.2f}s, overlapped {overlapped:.2f}s ({sequential / overlapped:.2f}x), "
+          f"overlap ratio {stats['overlap_ratio']:.2f} ({stats['overlap_time']:.2f}s of {stats['simulation_time']:.2f}s simulation)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the overlap of simulation and inference")
+    parser.add_argument("--steps", type=int, default=100, help="Number of environment steps")
+    parser.add_argument("--start_steps", type=int, default=100, help="Warm-up simulation steps")
+    parser.add_argument("--inference_ms", type=float, default=10., help="Simulated inference time per step in milliseconds")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+    env_kwargs = dict(
+        simulation_steps=args.steps,
+        simulation_start_steps=args.start_steps,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+    )
+
+    # TraCI socket stepped in a background thread
+    gym_env_graph_rl.traci = importlib.import_module("traci")
+    threaded = ThreadedSumoGraphEnv(gym_env_graph_rl.SumoGraphEnviroment(**env_kwargs))
+    actions = np.random.default_rng(0).integers(0, threaded.env.ACTION_CNT, size=(args.steps, threaded.env.NODE_CNT))
+    sequential = run(threaded, actions, args, False)
+    threaded.stats.reset()
+    overlapped = run(threaded, actions, args, True)
+    report("traci (thread)", sequential, overlapped, threaded.stats.summary())
+    threaded.close()
+    gym_env_graph_rl.traci.close()
+
+    # libsumo (or traci, if libsumo is missing) stepped in a worker process
+    vector = SumoGraphVectorEnv(1, seed=0, **env_kwargs)
+    actions = actions[:, None, :]
+    sequential = run(vector, actions, args, False)
+    vector.stats.reset()
+    overlapped = run(vector, actions, args, True)
+    report("worker process", sequential, overlapped, vector.stats.summary())
+    vector.close()
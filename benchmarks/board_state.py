@@ -0,0 +1,106 @@
+"""
+Benchmark of the vectorized SumoBaseSimulation.getBoardState against the
+previous per-vehicle loop (kept below as reference) with 500, 5,000 and
+50,000 vehicles placed randomly on the lanes of the grid network. TraCI is
+replaced by the fake stand-in of fake_traci.py, which counts round trips.
+
+Example:
+    python board_state.py --vehicles 500,5000,50000
+"""
+
+import os, sys
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "sumobasesimulation"))
+import verify
+from fake_traci import FakeDomain, constants, exceptions
+
+
+def legacy_board_state(traci):
+    """Previous getBoardState making three or four TraCI calls per vehicle, for reference (5x5 grids only)."""
+    def parse_char(char):
+        return "ABCDE".index(char) if char in "ABCDE" else -1
+
+    junctions = np.zeros((25, 20))
+    for vehicle in traci.vehicle.getIDList():
+        next_tls = traci.vehicle.getNextTLS(vehicle)
+        signal = traci.vehicle.getSignals(vehicle)
+        if len(next_tls) >= 1 and not(traci.vehicle.getLaneID(vehicle)[0] == ':'):
+            lane_id = traci.vehicle.getLaneID(vehicle)
+            origin = (parse_char(lane_id[0]), int(lane_id[1]))
+            destination = (parse_char(lane_id[2]), int(lane_id[3]))
+            lane_index = int(lane_id[5])
+            if float(next_tls[0][2]) < 100:
+                junction_index = parse_char(next_tls[0][0][0]) + int(next_tls[0][0][1]) * 5
+                direction = 0 if origin[1] > destination[1] else 1 if origin[0] > destination[0] else 2 if origin[1] < destination[1] else 3
+                no_blinker = signal in (0, 8)
+                summand = 1 if no_blinker and lane_index == 0 else 2 if no_blinker and lane_index == 1 else 0 if signal in (1, 9) else 3 if signal in (2, 10) else -1
+                junctions[junction_index][direction * 5 + summand] += 1
+    return junctions
+
+
+class FakeBoardTraci:
+    """Vehicles on random lanes of the grid (some on internal lanes) with random signals and distances to the next tls."""
+    constants = constants
+    exceptions = exceptions
+
+    def __init__(self, net, n_vehicles, seed=0):
+        rng = np.random.default_rng(seed)
+        self.calls = Counter()
+        lanes = net.lane_ids[rng.integers(len(net.lane_ids), size=n_vehicles)].tolist()
+        next_tls = net.junction_ids[net.edge_to[net.lane_edge]].tolist()
+        lane_pos = {lane: idx for idx, lane in enumerate(net.lane_ids.tolist())}
+        internal = rng.random(n_vehicles) < 0.1
+        distances = rng.uniform(0, 300, n_vehicles)
+        signals = rng.choice([0, 8, 1, 9, 2, 10], n_vehicles)
+        self.state = {}
+        for idx, lane in enumerate(lanes):
+            tls = next_tls[lane_pos[lane]]
+            self.state[f"veh{idx}"] = {
+                constants.VAR_LANE_ID: f":{tls}_0_0" if internal[idx] else lane,
+                constants.VAR_NEXT_TLS: ((tls, 0, float(distances[idx]), "r"),),
+                constants.VAR_SIGNALS: int(signals[idx]),
+            }
+        getters = {
+            method: (variable, lambda veh, variable=variable: self.state[veh][variable])
+            for method, variable in (("getLaneID", constants.VAR_LANE_ID), ("getNextTLS", constants.VAR_NEXT_TLS), ("getSignals", constants.VAR_SIGNALS))
+        }
+        self.vehicle = FakeDomain(self, "vehicle", getters, lambda: self.state)
+
+    def round_trips(self):
+        total = sum(self.calls.values())
+        self.calls.clear()
+        return total
+
+
+def timed(fake, function, *args):
+    fake.round_trips()
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start, fake.round_trips()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark getBoardState")
+    parser.add_argument("--vehicles", default="500,5000,50000", help="Comma separated numbers of vehicles")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+
+    simulation = verify.SumoBaseSimulation(argparse.Namespace(sumo_config_path=args.cfg, sumo_cmd_env="sumo"))
+    net = verify.load_net(simulation.getNetPath())
+    print(f"{'vehicles':>9} {'legacy':>10} {'trips':>7} {'first call':>11} {'trips':>7} {'next calls':>11} {'trips':>6}")
+    for n_vehicles in (int(n) for n in args.vehicles.split(",")):
+        fake = FakeBoardTraci(net, n_vehicles)
+        verify.traci = fake
+        legacy, legacy_time, legacy_trips = timed(fake, legacy_board_state, fake)
+        # the first call subscribes every vehicle, afterwards the results arrive with each simulation step
+        first, first_time, first_trips = timed(fake, simulation.getBoardState)
+        board, board_time, board_trips = timed(fake, simulation.getBoardState)
+        assert np.array_equal(legacy, first) and np.array_equal(legacy, board)
+        print(f"{n_vehicles:9d} {legacy_time * 1000:8.1f}ms {legacy_trips:7d} {first_time * 1000:9.1f}ms {first_trips:7d} "
+              f"{board_time * 1000:9.1f}ms {board_trips:6d}")
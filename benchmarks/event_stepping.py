@@ -0,0 +1,82 @@
+"""
+Benchmark of the fixed cadence stepping of SumoGraphEnviroment against the
+event driven step mode, which advances SUMO to the next decision of any tls
+in a single simulationStep call. Both run the same simulated time with a
+random policy that keeps the current phase with probability --keep.
+
+Example:
+    python event_stepping.py --steps 100 --min_green 10 --max_green 60
+"""
+
+import os, sys
+import argparse
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+
+
+def run(env, args, rng):
+    """Run one episode and return env steps, simulationStep calls, tls decisions and wall time."""
+    simulation_step = gym_env_graph_rl.traci.simulationStep
+    calls = [0]
+
+    def counted_simulation_step(*step):
+        calls[0] += 1
+        return simulation_step(*step)
+
+    gym_env_graph_rl.traci.simulationStep = counted_simulation_step
+    try:
+        observation, _ = env.reset()
+        actions = rng.integers(0, env.ACTION_CNT, env.NODE_CNT)
+        acting = observation.get("acting", np.ones(env.NODE_CNT, dtype=bool))
+        steps = decisions = 0
+        calls[0] = 0
+        start = time.perf_counter()
+        terminated = False
+        while not terminated:
+            switch = acting & (rng.random(env.NODE_CNT) > args.keep)
+            actions[switch] = rng.integers(0, env.ACTION_CNT, switch.sum())
+            decisions += int(acting.sum())
+            observation, _, terminated, _, _ = env.step(actions)
+            acting = observation.get("acting", np.ones(env.NODE_CNT, dtype=bool))
+            steps += 1
+        return steps, calls[0], decisions, time.perf_counter() - start, gym_env_graph_rl.traci.simulation.getTime()
+    finally:
+        gym_env_graph_rl.traci.simulationStep = simulation_step
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fixed cadence against event driven stepping")
+    parser.add_argument("--steps", type=int, default=100, help="Fixed cadence steps per episode, defines the simulated time")
+    parser.add_argument("--start_steps", type=int, default=100, help="Warm-up simulation steps")
+    parser.add_argument("--yellow_steps", type=int, default=3, help="Yellow phase steps")
+    parser.add_argument("--step_size", type=int, default=5, help="Green steps per decision (fixed) / green extension (event)")
+    parser.add_argument("--min_green", type=int, default=10, help="Minimum green steps of the event mode")
+    parser.add_argument("--max_green", type=int, default=60, help="Maximum green steps of the event mode")
+    parser.add_argument("--interval", type=int, default=None, help="Decision interval steps of the event mode, defaults to --step_size")
+    parser.add_argument("--keep", type=float, default=0.8, help="Probability of keeping the current phase")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+
+    print(f"{'mode':>6} {'env steps':>10} {'simulationStep':>15} {'decisions':>10} {'sim time':>9} {'wall':>8}")
+    for mode in ("fixed", "event"):
+        env = gym_env_graph_rl.SumoGraphEnviroment(
+            args.steps,
+            simulation_start_steps=args.start_steps,
+            simulation_yellow_steps=args.yellow_steps,
+            simulation_step_size=args.step_size,
+            sumo_net_path=args.net,
+            sumo_cfg_path=args.cfg,
+            step_mode=mode,
+            min_green_steps=args.min_green,
+            max_green_steps=args.max_green,
+            decision_interval_steps=args.interval,
+        )
+        steps, calls, decisions, wall, end_time = run(env, args, np.random.default_rng(0))
+        print(f"{mode:>6} {steps:10d} {calls:15d} {decisions:10d} {end_time:8.0f}s {wall:7.2f}s")
+        gym_env_graph_rl.traci.close()
@@ -0,0 +1,170 @@
+"""
+Deterministic in-process stand-in for the parts of the TraCI API used by the
+helpers in tools/traci_helpers.py. Every call that would be a round trip to
+SUMO over the TraCI socket is counted, subscription results are delivered
+with simulationStep like in traci.
+
+Example:
+    fake = FakeTraci(n_lanes=100, n_vehicles=1000)
+    traci_helpers.traci = fake
+"""
+
+from collections import Counter
+
+import numpy as np
+from traci import constants, exceptions
+from traci.exceptions import TraCIException
+
+
+class FakeDomain:
+    """A TraCI domain whose getters read the variables of the fake simulation.
+
+    :param fake: The simulation the domain belongs to
+    :type fake: FakeTraci
+    :param name: Name of the domain, e.g. "lane"
+    :type name: str
+    :param getters: Maps the getter method names to (variable, function(object_id))
+    :type getters: dict
+    :param id_list: Function returning the IDs of all objects of the domain, used by getIDList
+    :type id_list: callable
+    :param methods: Maps the names of further methods (setters, methods without subscription variable) to functions
+    :type methods: dict
+    """
+
+    def __init__(self, fake, name, getters, id_list=None, methods=None):
+        self.fake = fake
+        self.name = name
+        self.getters = getters
+        self.id_list = id_list
+        self.methods = methods or {}
+        self.variables = {variable: function for variable, function in getters.values()}
+        self.subscriptions = {}
+        self.results = {}
+
+    def __getattr__(self, method):
+        if method in self.getters:
+            _, function = self.getters[method]
+        elif method in self.methods:
+            function = self.methods[method]
+        else:
+            raise AttributeError(f"{self.name} has no method {method}")
+
+        def getter(*args):
+            self.fake.calls[(self.name, method)] += 1
+            return function(*args)
+        return getter
+
+    def getIDList(self):
+        self.fake.calls[(self.name, "getIDList")] += 1
+        return tuple(self.id_list())
+
+    def _values(self, object_id, variables):
+        try:
+            return {variable: self.variables[variable](object_id) for variable in variables}
+        except (KeyError, IndexError):
+            raise TraCIException(f"{self.name} '{object_id}' is not known")
+
+    def subscribe(self, object_id, variables):
+        self.fake.calls[(self.name, "subscribe")] += 1
+        self.results[object_id] = self._values(object_id, variables)
+        self.subscriptions[object_id] = tuple(variables)
+
+    def getAllSubscriptionResults(self):
+        # the results arrived with the last simulationStep, no round trip
+        return self.results
+
+    def update(self):
+        """Refresh the subscription results, subscriptions of objects that left the simulation end."""
+        self.results = {}
+        for object_id, variables in list(self.subscriptions.items()):
+            try:
+                self.results[object_id] = self._values(object_id, variables)
+            except TraCIException:
+                del self.subscriptions[object_id]
+
+
+class FakeTraci:
+    """Random traffic on independent lanes: vehicles depart on a random lane, drive along it and arrive at its end.
+
+    :param n_lanes: Number of lanes
+    :type n_lanes: int
+    :param n_vehicles: Number of vehicles kept in the simulation
+    :type n_vehicles: int
+    :param seed: Seed of the random traffic
+    :type seed: int
+    """
+    constants = constants
+    exceptions = exceptions
+
+    def __init__(self, n_lanes=100, n_vehicles=1000, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.n_vehicles = n_vehicles
+        self.lane_ids = [f"lane{idx}_0" for idx in range(n_lanes)]
+        self.lane_length = dict(zip(self.lane_ids, self.rng.uniform(50, 500, n_lanes)))
+        self.vehicles = {}
+        self.departed = 0
+        self.calls = Counter()
+        emissions = {
+            "NOx": constants.VAR_NOXEMISSION, "PMx": constants.VAR_PMXEMISSION, "CO2": constants.VAR_CO2EMISSION,
+            "CO": constants.VAR_COEMISSION, "HC": constants.VAR_HCEMISSION,
+        }
+        vehicle_getters = {
+            "getLanePosition": (constants.VAR_LANEPOSITION, lambda veh: self.vehicles[veh]["pos"]),
+            "getWaitingTime": (constants.VAR_WAITING_TIME, lambda veh: self.vehicles[veh]["waiting"]),
+        }
+        lane_getters = {
+            "getLastStepVehicleIDs": (constants.LAST_STEP_VEHICLE_ID_LIST, self._lane_vehicles),
+            "getLastStepVehicleNumber": (constants.LAST_STEP_VEHICLE_NUMBER, lambda lane: len(self._lane_vehicles(lane))),
+            "getWaitingTime": (constants.VAR_WAITING_TIME, lambda lane: self._lane_sum(lane, "waiting")),
+            "getLength": (constants.VAR_LENGTH, lambda lane: self.lane_length[lane]),
+        }
+        for name, variable in emissions.items():
+            vehicle_getters[f"get{name}Emission"] = (variable, lambda veh, name=name: self.vehicles[veh][name])
+            lane_getters[f"get{name}Emission"] = (variable, lambda lane, name=name: self._lane_sum(lane, name))
+        self.vehicle = FakeDomain(self, "vehicle", vehicle_getters, lambda: self.vehicles)
+        self.lane = FakeDomain(self, "lane", lane_getters, lambda: self.lane_ids)
+        self._lanes = {}
+        self._fill()
+
+    def _lane_vehicles(self, lane):
+        if lane not in self.lane_length:
+            raise KeyError(lane)
+        return tuple(self._lanes.get(lane, ()))
+
+    def _lane_sum(self, lane, key):
+        return float(sum(self.vehicles[veh][key] for veh in self._lane_vehicles(lane)))
+
+    def _fill(self):
+        # depart vehicles until the simulation is full again
+        while len(self.vehicles) < self.n_vehicles:
+            veh = f"veh{self.departed}"
+            self.departed += 1
+            self.vehicles[veh] = {
+                "lane": self.lane_ids[self.rng.integers(len(self.lane_ids))],
+                "pos": 0., "speed": 0., "waiting": 0.,
+                "NOx": 0., "PMx": 0., "CO2": 0., "CO": 0., "HC": 0.,
+            }
+        self._lanes = {}
+        for veh, state in self.vehicles.items():
+            self._lanes.setdefault(state["lane"], []).append(veh)
+
+    def simulationStep(self):
+        self.calls[("simulation", "simulationStep")] += 1
+        for veh, state in list(self.vehicles.items()):
+            state["speed"] = max(0., min(14., state["speed"] + self.rng.normal(0., 3.)))
+            state["pos"] += state["speed"]
+            state["waiting"] = state["waiting"] + 1 if state["speed"] < 0.1 else 0.
+            state["CO2"] = 2000. + 300. * state["speed"]
+            for name, factor in (("NOx", 1e-3), ("PMx", 1e-4), ("CO", 2e-2), ("HC", 1e-3)):
+                state[name] = state["CO2"] * factor
+            if state["pos"] > self.lane_length[state["lane"]]:
+                del self.vehicles[veh]
+        self._fill()
+        self.lane.update()
+        self.vehicle.update()
+
+    def round_trips(self):
+        """Return the number of counted round trips and reset the counter."""
+        total = sum(self.calls.values())
+        self.calls.clear()
+        return total
@@ -0,0 +1,66 @@
+"""
+Benchmark of the streaming FCD reader against xml.etree on the bundled
+xml/scenario1/grid.output200.xml, plus loading the converted binary files.
+
+Example:
+    python fcd_conversion.py --repeat 3
+"""
+
+import os, sys
+import argparse
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+from fcd_reader import read_fcd, convert_fcd, load_fcd
+
+
+def read_etree(fcd_xml_path):
+    """DOM based reading as done so far: parse the whole tree, then walk all vehicles."""
+    root = ET.parse(fcd_xml_path).getroot()
+    records = []
+    for timestep in root.iter("timestep"):
+        time_value = float(timestep.get("time"))
+        for vehicle in timestep.iter("vehicle"):
+            records.append((
+                time_value, vehicle.get("id"), float(vehicle.get("x")), float(vehicle.get("y")),
+                float(vehicle.get("speed")), float(vehicle.get("angle")), vehicle.get("lane"), float(vehicle.get("pos")),
+            ))
+    return records
+
+
+def best_of(repeat, function, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FCD reading")
+    parser.add_argument("--fcd", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.output200.xml"), help="Path of the FCD xml file")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    records, etree_time = best_of(args.repeat, read_etree, args.fcd)
+    fcd, stream_time = best_of(args.repeat, read_fcd, args.fcd)
+    assert len(records) == len(fcd["time"])
+    assert np.allclose([record[4] for record in records], fcd["speed"], atol=1e-3)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        _, convert_time = best_of(1, convert_fcd, args.fcd, out_dir)
+        loaded, load_time = best_of(args.repeat, load_fcd, out_dir)
+        # touch the data so the memory-mapped columns are actually read
+        _, scan_time = best_of(args.repeat, lambda: float(np.mean(loaded["speed"])))
+
+    print(f"records:            {len(records)}")
+    print(f"xml.etree:          {etree_time * 1000:8.1f} ms")
+    print(f"streaming reader:   {stream_time * 1000:8.1f} ms ({etree_time / stream_time:.1f}x)")
+    print(f"convert to binary:  {convert_time * 1000:8.1f} ms (once)")
+    print(f"load binary + scan: {(load_time + scan_time) * 1000:8.1f} ms ({etree_time / (load_time + scan_time):.0f}x)")
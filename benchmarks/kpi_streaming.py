@@ -0,0 +1,100 @@
+"""
+Benchmark of per-step KPIs of xml/scenario1/grid.sumocfg: polling every
+vehicle and lane with the TraCI helpers (per call and batch) against reading
+SUMO's emission output incrementally with tools/kpi_stream.py. The values of
+the stream are checked against the polled ones of the same step. The total
+wall time includes the simulation and, for the stream, writing its outputs.
+Polling pays a round trip per call over the TraCI socket, with libsumo the
+calls are cheap and writing the emission output costs about as much.
+
+Example:
+    python kpi_streaming.py --steps 300 --backend traci
+"""
+
+import os, sys
+import argparse
+import importlib
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+import traci
+import traci_helpers
+from kpi_stream import KPIStream
+
+SUMO_CFG = os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg")
+
+
+def poll(lanes):
+    vehicles = traci.vehicle.getIDList()
+    if not vehicles:
+        return None
+    return (traci_helpers.get_emissions(vehicles), traci_helpers.getnetworkwaitingtime(vehicles),
+            traci_helpers.get_waiting_time(lanes))
+
+
+def poll_batch(lanes):
+    vehicles = traci.vehicle.getIDList()
+    if not vehicles:
+        return None
+    return (tuple(traci_helpers.get_emissions_batch(vehicles).mean(axis=0)),
+            float(traci_helpers.getnetworkwaitingtime_batch(vehicles).mean()),
+            float(traci_helpers.get_waiting_time_batch(lanes).sum()))
+
+
+def run(steps, mode, out_dir):
+    """Simulate ``steps`` steps computing the KPIs with ``mode`` after every step.
+
+    :return: KPIs by step time, time spent computing KPIs and total wall time
+    :rtype: dict, float, float
+    """
+    stream = KPIStream(out_dir, outputs=("emission",))
+    sumo_args = stream.sumo_args() if mode == "stream" else []
+    start = time.perf_counter()
+    traci.start(["sumo", "-c", SUMO_CFG, "--no-step-log", "--fcd-output", os.devnull] + sumo_args)
+    lanes = traci.lane.getIDList()
+    kpis = {}
+    kpi_time = 0.
+    for _ in range(steps):
+        traci.simulationStep()
+        # outputs carry the time the step started at
+        step_time = traci.simulation.getTime() - traci.simulation.getDeltaT()
+        kpi_start = time.perf_counter()
+        if mode == "stream":
+            stream.update()
+            if stream.time is not None and stream.vehicle_ids:
+                kpis[stream.time] = (stream.get_emissions(), stream.get_network_waiting_time(), stream.get_waiting_time(lanes))
+        else:
+            kpis[step_time] = poll(lanes) if mode == "poll" else poll_batch(lanes)
+        kpi_time += time.perf_counter() - kpi_start
+    traci.close()
+    stream.close()
+    return kpis, kpi_time, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare polled and streamed KPIs")
+    parser.add_argument("--steps", type=int, default=300, help="Number of simulation steps")
+    parser.add_argument("--backend", choices=("traci", "libsumo"), default="traci", help="TraCI implementation")
+    args = parser.parse_args()
+    # the helpers look traci up in their own module
+    traci = traci_helpers.traci = importlib.import_module(args.backend)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for mode in ("poll", "poll_batch", "stream"):
+            results[mode] = run(args.steps, mode, os.path.join(out_dir, mode))
+
+    polled = results["poll"][0]
+    streamed = results["stream"][0]
+    for step_time, (emissions, network_waiting_time, waiting_time) in streamed.items():
+        expected = polled[step_time]
+        # the emission output is written with 2 decimals
+        assert np.allclose(emissions, expected[0], rtol=1e-3, atol=5e-3), (step_time, emissions, expected[0])
+        assert np.isclose(network_waiting_time, expected[1]) and np.isclose(waiting_time, expected[2]), step_time
+    print(f"steps checked:   {len(streamed)} of {args.steps}")
+    for mode, (_, kpi_time, wall_time) in results.items():
+        print(f"{mode + ':':16} {kpi_time / args.steps * 1000:7.2f} ms KPIs per step, {wall_time:6.2f} s total")
@@ -0,0 +1,70 @@
+"""
+Benchmark of reading colour and width measures of a meandata file: two
+WeightsReader passes (dict of dicts, one attribute each) against one pass of
+the columnar meandata reader and loading its memory-mapped cache. The file is
+xml/scenario1/meandata.xml repeated with perturbed values to get many intervals.
+
+Example:
+    python meandata_columns.py --intervals 500 --repeat 3
+"""
+
+import os, sys
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import sumolib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+from meandata_reader import read_meandata, load_meandata
+from render_net_dump import MEANDATA, plot_net_dump, write_intervals
+
+
+def read_weights(dump_path, measures):
+    """Reading as plot_net_dump.main does: one SAX pass per measure into dictionaries."""
+    readers = []
+    for measure in measures:
+        reader = plot_net_dump.WeightsReader(measure)
+        sumolib.output.parse_sax(dump_path, reader)
+        readers.append(reader)
+    return readers
+
+
+def best_of(repeat, function, *args, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark meandata reading")
+    parser.add_argument("--intervals", type=int, default=200, help="Number of intervals of the benchmark file")
+    parser.add_argument("--measures", default="speed,entered", help="Comma separated attributes to read")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions, the best time is reported")
+    args = parser.parse_args()
+    measures = args.measures.split(",")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        dump_path = os.path.join(out_dir, "meandata.xml")
+        write_intervals(MEANDATA, dump_path, args.intervals)
+        readers, weights_time = best_of(args.repeat, read_weights, dump_path, measures)
+        meandata, read_time = best_of(args.repeat, read_meandata, dump_path, attributes=measures)
+        for reader, column in zip(readers, range(len(measures))):
+            edge = meandata["ids"][0]
+            assert np.isclose(reader._edge2value[meandata["begin"][-1]][edge], meandata["data"][-1, 0, column], rtol=1e-6)
+        cache_dir = os.path.join(out_dir, "cache")
+        _, convert_time = best_of(1, load_meandata, dump_path, cache_dir=cache_dir)
+        loaded, load_time = best_of(args.repeat, load_meandata, dump_path, attributes=measures, cache_dir=cache_dir)
+        # touch the data so the memory-mapped array is actually read
+        _, scan_time = best_of(args.repeat, lambda: float(np.nanmean(loaded["data"])))
+
+    print(f"array shape:          {meandata['data'].shape} (intervals x edges x attributes)")
+    print(f"WeightsReader passes: {weights_time * 1000:8.1f} ms")
+    print(f"columnar reader:      {read_time * 1000:8.1f} ms ({weights_time / read_time:.1f}x)")
+    print(f"parse into cache:     {convert_time * 1000:8.1f} ms (once)")
+    print(f"load cache + scan:    {(load_time + scan_time) * 1000:8.1f} ms ({weights_time / (load_time + scan_time):.0f}x)")
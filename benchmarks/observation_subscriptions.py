@@ -0,0 +1,65 @@
+"""
+Benchmark of the SumoGraphEnviroment step throughput with the per-call
+observation path versus the subscription based observation engine.
+
+Example:
+    python observation_subscriptions.py --backend traci --steps 200
+"""
+
+import os, sys
+import argparse
+import importlib
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+
+
+def run(use_subscriptions, args):
+    """Run one episode and return the achieved environment steps per second.
+
+    :param use_subscriptions: Whether the environment should use the observation engine
+    :type use_subscriptions: bool
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :return: Steps per second
+    :rtype: float
+    """
+    env = gym_env_graph_rl.SumoGraphEnviroment(
+        args.steps,
+        simulation_start_steps=args.start_steps,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+        use_subscriptions=use_subscriptions,
+    )
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, env.ACTION_CNT, size=(args.steps, env.NODE_CNT))
+    start = time.perf_counter()
+    for step in range(args.steps):
+        env.step(actions[step])
+    duration = time.perf_counter() - start
+    gym_env_graph_rl.traci.close()
+    return args.steps / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-call against subscription based observations")
+    parser.add_argument("--backend", choices=["traci", "libsumo"], default="traci", help="SUMO interface to benchmark")
+    parser.add_argument("--steps", type=int, default=200, help="Number of environment steps")
+    parser.add_argument("--start_steps", type=int, default=100, help="Warm-up simulation steps")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+
+    # the environment module picks libsumo if available, swap in the requested backend
+    gym_env_graph_rl.traci = importlib.import_module(args.backend)
+
+    per_call = run(False, args)
+    subscribed = run(True, args)
+    print(f"backend: {args.backend}")
+    print(f"per-call observations:     {per_call:8.1f} steps/s")
+    print(f"subscription observations: {subscribed:8.1f} steps/s ({subscribed / per_call:.2f}x)")
@@ -0,0 +1,106 @@
+"""
+Benchmark of rendering one frame per dump interval: the per-edge loop of
+plot_net_dump.main (sumolib net, dictionaries, helpers.plotNet) against the
+vectorized renderer of plot_net_dump.py --fast with 1 and n processes.
+The dump is xml/scenario1/meandata.xml, repeated with perturbed values to
+get many intervals.
+
+Example:
+    python render_net_dump.py --intervals 200 --processes 4
+"""
+
+import os, sys
+import argparse
+import copy
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from argparse import Namespace
+
+import numpy as np
+
+import sumolib
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# plot_net_dump requires SUMO_HOME, sumolib itself is installed
+os.environ.setdefault("SUMO_HOME", os.path.dirname(os.path.dirname(os.path.abspath(sumolib.__file__))))
+sys.path.insert(0, os.path.join(BASE_DIR, "sumobasesimulation"))
+import plot_net_dump
+from sumolib.visualization import helpers
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+NET = os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml")
+MEANDATA = os.path.join(BASE_DIR, "xml", "scenario1", "meandata.xml")
+
+
+def write_intervals(dump_path, out_path, intervals, seed=0):
+    """Write a dump with ``intervals`` copies of the first interval of ``dump_path``, speeds scaled randomly."""
+    rng = np.random.default_rng(seed)
+    root = ET.parse(dump_path).getroot()
+    interval = root.find("interval")
+    duration = float(interval.get("end")) - float(interval.get("begin"))
+    out = ET.Element(root.tag)
+    for idx in range(intervals):
+        element = copy.deepcopy(interval)
+        element.set("begin", f"{idx * duration:.2f}")
+        element.set("end", f"{(idx + 1) * duration:.2f}")
+        for edge in element.iter("edge"):
+            edge.set("speed", f"{float(edge.get('speed')) * rng.uniform(.5, 1.5):.2f}")
+        out.append(element)
+    ET.ElementTree(out).write(out_path)
+
+
+def render_loop(dump_path, out_dir, measure):
+    """The per-interval, per-edge rendering of plot_net_dump.main."""
+    options = Namespace(colormap="nipy_spectral", colormapCenter=None, colors=None, defaultColor="k", defaultWidth=.1,
+                        linestyle="-", minWidth=.5, maxWidth=3)
+    net = sumolib.net.readNet(NET)
+    hc = plot_net_dump.WeightsReader(measure)
+    sumolib.output.parse_sax(dump_path, hc)
+    for t in hc._edge2value:
+        colors = {}
+        for e in net._id2edge:
+            if e in hc._edge2value[t]:
+                colors[e] = hc._edge2value[t][e]
+        helpers.linNormalise(colors, min(colors.values()), max(colors.values()))
+        for e in colors:
+            colors[e] = helpers.getColor(options, colors[e], 1.)
+        widths = {}
+        fig, ax = helpers.openFigure(Namespace(size=None))
+        ax.set_aspect("equal", None, 'C')
+        helpers.plotNet(net, colors, widths, options)
+        plt.colorbar(plt.cm.ScalarMappable(cmap=matplotlib.colormaps[options.colormap], norm=plt.Normalize(vmin=0, vmax=1)), ax=ax)
+        plt.savefig(os.path.join(out_dir, f"loop-{t}.png"))
+        plt.close(fig)
+    return len(hc._edge2value)
+
+
+def render_fast(dump_path, out_dir, measure, processes):
+    plot_net_dump.render_main(["--fast", "-n", NET, "-i", dump_path, "-m", measure, "--processes", str(processes),
+                               "-o", os.path.join(out_dir, f"fast{processes}-%s.png")])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark rendering of dump intervals")
+    parser.add_argument("--intervals", type=int, default=100, help="Number of intervals of the benchmark dump")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Renderer processes of the parallel run")
+    parser.add_argument("--measure", default="speed", help="Plotted edge attribute")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        dump_path = os.path.join(out_dir, "meandata.xml")
+        write_intervals(MEANDATA, dump_path, args.intervals)
+
+        start = time.perf_counter()
+        frames = render_loop(dump_path, out_dir, args.measure)
+        loop_time = time.perf_counter() - start
+        print(f"intervals:             {frames}")
+        print(f"per-edge loop:         {loop_time:8.2f} s ({frames / loop_time:6.1f} frames/s)")
+        runs = [1] if args.processes == 1 else [1, args.processes]
+        for processes in runs:
+            start = time.perf_counter()
+            render_fast(dump_path, out_dir, args.measure, processes)
+            fast_time = time.perf_counter() - start
+            print(f"vectorized, {processes:2d} proc:  {fast_time:8.2f} s ({frames / fast_time:6.1f} frames/s, {loop_time / fast_time:.1f}x)")
@@ -0,0 +1,444 @@
+"""
+Deterministic offline stand-in for the TraCI API used by SumoGraphEnviroment,
+the helpers of tools/traci_helpers.py and SumoBaseSimulation.getBoardState.
+
+ReplayTraci serves recorded vehicle positions (lane, position, speed per
+time step) instead of running SUMO: either the FCD output recorded for
+xml/scenario1 (fcd_recording) or the traffic of a synthetic grid of any size
+(write_grid_net + synthetic_recording). Traffic lights run their static
+programs from the net file until their state is set. The replay is open
+loop, the traffic does not react to the traffic lights, and restarts from
+the first recorded step when the recording is exhausted.
+
+Example:
+    net_path = write_grid_net("grid10.net.xml", 10)
+    fake = ReplayTraci(net_path, synthetic_recording(load_net(net_path), 2000))
+    gym_env_graph_rl.traci = fake
+"""
+
+import os, sys
+import json
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+import numpy as np
+from traci import constants, exceptions, trafficlight
+
+from fake_traci import FakeDomain
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+from fcd_reader import read_fcd
+from net_cache import load_net
+
+# speed below which a vehicle counts as halting, like in SUMO
+HALTING_SPEED = 0.1
+
+
+def _grid_label(column):
+    # A, B, ..., Z, AA, AB, ... like spreadsheet columns
+    label = ""
+    column += 1
+    while column:
+        column, rest = divmod(column - 1, 26)
+        label = chr(ord("A") + rest) + label
+    return label
+
+
+def _crosses(first, second):
+    """Return whether two movements across a junction are foes.
+    Movements are (entry side, exit side) with sides 0 N, 1 E, 2 S, 3 W. Movements leaving on the same side merge,
+    movements whose chords between the sides intersect cross, movements entering on the same side never conflict.
+    """
+    (entry, exit_), (other_entry, other_exit) = first, second
+    if entry == other_entry:
+        return False
+    if exit_ == other_exit:
+        return True
+    if len({entry, exit_, other_entry, other_exit}) < 4:
+        return False
+    between = lambda side: 0 < (side - entry) % 4 < (exit_ - entry) % 4
+    return between(other_entry) != between(other_exit)
+
+
+def write_grid_net(net_xml_path: str, size: int, length: float = 200., lanes: int = 2, speed: float = 13.89):
+    """Write a synthetic ``size`` x ``size`` grid network in the SUMO net xml format, containing everything
+    :func:`net_cache.parse_net` and :class:`ReplayTraci` read: traffic light junctions with foe requests,
+    edges, lanes, connections and a two phase static program per junction.
+    Junction IDs follow netgenerate grids (A0, A1, ..., B0, ...).
+
+    :param net_xml_path: Path of the net file to write
+    :type net_xml_path: str
+    :param size: Number of junctions per row and column
+    :type size: int
+    :param length: Distance between neighbouring junctions in meters
+    :type length: float
+    :param lanes: Number of lanes per edge
+    :type lanes: int
+    :param speed: Speed limit of all lanes in m/s
+    :type speed: float
+    :return: ``net_xml_path``
+    :rtype: str
+    """
+    junction = lambda column, row: f"{_grid_label(column)}{row}"
+    # side of a junction an edge from the neighbour at offset (dx, dy) enters on
+    sides = {(0, 1): 0, (1, 0): 1, (0, -1): 2, (-1, 0): 3}
+    offsets = {side: offset for offset, side in sides.items()}
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "", '<net version="1.9">']
+    edges = []
+    connections = []
+    tl_logics = []
+    junctions = []
+    for column in range(size):
+        for row in range(size):
+            node = junction(column, row)
+            neighbours = {
+                side: junction(column + dx, row + dy) for side, (dx, dy) in offsets.items()
+                if 0 <= column + dx < size and 0 <= row + dy < size
+            }
+            for side, neighbour in neighbours.items():
+                edge = f"{neighbour}{node}"
+                dx, dy = offsets[side]
+                edges.append(f'    <edge id="{edge}" from="{neighbour}" to="{node}" priority="-1">')
+                for lane in range(lanes):
+                    edges.append(f'        <lane id="{edge}_{lane}" index="{lane}" speed="{speed:.2f}" length="{length:.2f}"/>')
+                edges.append("    </edge>")
+            # movements: entering on side, leaving on side + 1 (left), + 2 (straight) or + 3 (right)
+            links = []
+            for side, neighbour in sorted(neighbours.items()):
+                turns = {
+                    direction: (side + turn) % 4 for direction, turn in (("r", 3), ("s", 2), ("l", 1))
+                    if (side + turn) % 4 in neighbours
+                }
+                for lane in range(lanes):
+                    # rightmost lane turns right, leftmost lane turns left, all lanes go straight
+                    lane_turns = [direction for direction in ("r", "s", "l") if direction in turns and (
+                        direction == "s" or (direction == "r" and lane == 0) or (direction == "l" and lane == lanes - 1))]
+                    # dead ends of the rightmost/leftmost lane at the border take any remaining turn
+                    for direction in lane_turns or list(turns):
+                        links.append((f"{neighbour}{node}", lane, f"{node}{neighbours[turns[direction]]}", direction, side, turns[direction]))
+            requests = []
+            movements = [(link[4], link[5]) for link in links]
+            for index, movement in enumerate(movements):
+                foes = "".join("1" if _crosses(movement, other) else "0" for other in reversed(movements))
+                requests.append(f'        <request index="{index}" response="{"0" * len(links)}" foes="{foes}" cont="0"/>')
+            inc_lanes = " ".join(f"{neighbour}{node}_{lane}" for _, neighbour in sorted(neighbours.items()) for lane in range(lanes))
+            junctions.append(f'    <junction id="{node}" type="traffic_light" x="{column * length:.2f}" y="{row * length:.2f}" incLanes="{inc_lanes}" intLanes="">')
+            junctions += requests
+            junctions.append("    </junction>")
+            for index, (from_edge, lane, to_edge, direction, _, _) in enumerate(links):
+                connections.append(
+                    f'    <connection from="{from_edge}" to="{to_edge}" fromLane="{lane}" toLane="{min(lane, lanes - 1)}" '
+                    f'tl="{node}" linkIndex="{index}" dir="{direction}" state="O"/>'
+                )
+            # north/south movements and east/west movements share a green phase, left turns yield
+            tl_logics.append(f'    <tlLogic id="{node}" type="static" programID="0" offset="0">')
+            for axis in (0, 1):
+                green = "".join(("g" if link[3] == "l" else "G") if link[4] % 2 == axis else "r" for link in links)
+                yellow = green.replace("G", "y").replace("g", "y")
+                tl_logics.append(f'        <phase duration="42" state="{green}"/>')
+                tl_logics.append(f'        <phase duration="3"  state="{yellow}"/>')
+            tl_logics.append("    </tlLogic>")
+    lines += edges + tl_logics + junctions + connections + ["</net>", ""]
+    with open(net_xml_path, "w") as f:
+        f.write("\n".join(lines))
+    return net_xml_path
+
+
+def read_programs(net_xml_path: str):
+    """Read the phases of the first program of every tls of a net file.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :return: Dictionary where tls IDs are the keys and lists of ``traci.trafficlight.Phase`` are the values
+    :rtype: dict
+    """
+    programs = {}
+    for _, elem in ET.iterparse(net_xml_path):
+        if elem.tag == "tlLogic" and elem.get("id") not in programs:
+            programs[elem.get("id")] = [
+                trafficlight.Phase(float(phase.get("duration")), phase.get("state")) for phase in elem.iter("phase")
+            ]
+        if elem.tag in ("tlLogic", "edge", "junction", "connection"):
+            elem.clear()
+    return programs
+
+
+def fcd_recording(fcd_xml_path: str):
+    """Read a recording from a SUMO FCD output file, see :func:`fcd_reader.read_fcd`.
+
+    :param fcd_xml_path: Path to the FCD xml file
+    :type fcd_xml_path: str
+    :return: Columnar recording with the columns time, vehicle, lane, pos and speed and the vocabularies vehicle_ids and lane_ids
+    :rtype: dict
+    """
+    fcd = read_fcd(fcd_xml_path)
+    order = np.argsort(fcd["time"], kind="stable")
+    recording = {name: fcd[name][order] for name in ("time", "vehicle", "lane", "pos", "speed")}
+    recording["vehicle_ids"] = fcd["vehicle_ids"]
+    recording["lane_ids"] = fcd["lane_ids"]
+    return recording
+
+
+def synthetic_recording(net, n_vehicles: int, steps: int = 200, step_length: float = 1., seed: int = 0):
+    """Record random traffic on a network: vehicles drive along their lane with a randomly varying speed,
+    a part of them queues at the lane end, and at the end of a lane they continue on a random connected lane.
+
+    :param net: Topology of the network, e.g. of a grid written by :func:`write_grid_net`
+    :type net: net_cache.NetTopology
+    :param n_vehicles: Number of vehicles, all of them stay in the network
+    :type n_vehicles: int
+    :param steps: Number of recorded time steps
+    :type steps: int
+    :param step_length: Time between two recorded steps in seconds
+    :type step_length: float
+    :param seed: Seed of the random traffic
+    :type seed: int
+    :return: Columnar recording like :func:`fcd_recording`
+    :rtype: dict
+    """
+    rng = np.random.default_rng(seed)
+    n_lanes = len(net.lane_ids)
+    # lanes a vehicle can continue on: the lanes of the edges leaving the junction the lane ends at, except turning back
+    lane_to = net.edge_to[net.lane_edge]
+    lane_from = net.edge_from[net.lane_edge]
+    successors = [[] for _ in range(n_lanes)]
+    by_from = {}
+    for lane, from_junction in enumerate(lane_from.tolist()):
+        by_from.setdefault(from_junction, []).append(lane)
+    for lane in range(n_lanes):
+        candidates = by_from.get(int(lane_to[lane]), [])
+        successors[lane] = [next_lane for next_lane in candidates if lane_to[next_lane] != lane_from[lane]] or candidates or [lane]
+    successor_ptr = np.concatenate(([0], np.cumsum([len(lanes) for lanes in successors]))).astype(np.int64)
+    successor_lane = np.concatenate([np.array(lanes, dtype=np.int32) for lanes in successors])
+    lengths = np.asarray(net.lane_length)
+    max_speed = np.asarray(net.lane_speed)
+
+    lane = rng.integers(n_lanes, size=n_vehicles).astype(np.int32)
+    pos = rng.uniform(0, lengths[lane])
+    speed = rng.uniform(0, max_speed[lane])
+    # vehicles queueing at the end of their lane
+    queueing = rng.random(n_vehicles) < 0.3
+    columns = {"time": [], "vehicle": [], "lane": [], "pos": [], "speed": []}
+    vehicles = np.arange(n_vehicles, dtype=np.int32)
+    for step in range(steps):
+        speed = np.clip(speed + rng.normal(0, 1.5, n_vehicles), 0, max_speed[lane])
+        stopped = queueing & (lengths[lane] - pos < 40)
+        speed[stopped] = 0.
+        pos = np.minimum(pos + speed * step_length, lengths[lane] + speed * step_length)
+        leaving = pos >= lengths[lane]
+        if leaving.any():
+            offset = rng.integers(0, successor_ptr[lane[leaving] + 1] - successor_ptr[lane[leaving]])
+            pos[leaving] -= lengths[lane[leaving]]
+            lane[leaving] = successor_lane[successor_ptr[lane[leaving]] + offset]
+            queueing[leaving] = rng.random(int(leaving.sum())) < 0.3
+            pos = np.minimum(pos, lengths[lane])
+        columns["time"].append(np.full(n_vehicles, step * step_length))
+        columns["vehicle"].append(vehicles)
+        columns["lane"].append(lane.copy())
+        columns["pos"].append(pos.astype(np.float32))
+        columns["speed"].append(speed.astype(np.float32))
+    recording = {name: np.concatenate(values) for name, values in columns.items()}
+    recording["vehicle_ids"] = np.array([f"veh{idx}" for idx in range(n_vehicles)], dtype=str)
+    recording["lane_ids"] = np.asarray(net.lane_ids)
+    return recording
+
+
+class ReplayTraci:
+    """Replays a recording through the TraCI API of lanes, vehicles, traffic lights and the simulation.
+    Calls that would be a round trip to SUMO are counted in :attr:`calls`, subscription results are delivered with
+    ``simulationStep`` like in traci.
+
+    :param net_xml_path: Path to the SUMO net xml file the recording belongs to
+    :type net_xml_path: str
+    :param recording: Columnar recording as returned by :func:`fcd_recording` or :func:`synthetic_recording`
+    :type recording: dict
+    :param seed: Seed of the blinker signals of the vehicles
+    :type seed: int
+    """
+    constants = constants
+    exceptions = exceptions
+
+    def __init__(self, net_xml_path: str, recording: dict, seed: int = 0):
+        self.net = load_net(net_xml_path)
+        self.calls = Counter()
+        self.programs = read_programs(net_xml_path)
+        self.tls_ids = self.net.tls_ids.tolist()
+        self.lane_ids = self.net.lane_ids.tolist()
+        self.lane_lengths = self.net.get_lane_lengths()
+        self.lane_pos = self.net.lane_pos
+
+        # recorded lanes that are not part of the net (internal lanes) map to -1
+        self.time = recording["time"]
+        self.record_vehicle = recording["vehicle"]
+        self.pos = recording["pos"]
+        self.speed = recording["speed"]
+        self.lane_names = recording["lane_ids"].tolist()
+        self.record_lane = np.array([self.lane_pos.get(lane, -1) for lane in self.lane_names] + [-1], dtype=np.int64)[recording["lane"]]
+        self.record_lane_name = recording["lane"]
+        self.vehicle_ids = recording["vehicle_ids"].tolist()
+        self.vehicle_pos = {vehicle: idx for idx, vehicle in enumerate(self.vehicle_ids)}
+        self.steps, self.step_start = np.unique(self.time, return_index=True)
+        self.step_start = np.append(self.step_start, len(self.time))
+        self.step_length = float(np.diff(self.steps).min()) if len(self.steps) > 1 else 1.
+        # blinker of every vehicle: none 0, right 1, left 2, brake lights add 8 while halting
+        self.blinker = np.random.default_rng(seed).choice([0, 1, 2], size=len(self.vehicle_ids), p=[0.5, 0.25, 0.25])
+
+        # next tls of the lanes: tls, link index and junction row, -1 for lanes not ending at a tls
+        tls_pos = {tls: idx for idx, tls in enumerate(self.tls_ids)}
+        self.lane_tls = np.full(len(self.lane_ids), -1, dtype=np.int64)
+        self.lane_link = np.zeros(len(self.lane_ids), dtype=np.int64)
+        for idx, tls in enumerate(self.tls_ids):
+            begin, end = self.net.tls_lane_ptr[idx], self.net.tls_lane_ptr[idx + 1]
+            for lane, link in zip(self.net.tls_lane[begin:end][::-1].tolist(), self.net.tls_link_index[begin:end][::-1].tolist()):
+                # reversed, so the lowest link index of a lane wins
+                self.lane_tls[lane] = tls_pos[tls]
+                self.lane_link[lane] = link
+
+        vehicle_getters = {
+            "getLaneID": (constants.VAR_LANE_ID, lambda veh: self.lane_names[self.record_lane_name[self._row(veh)]]),
+            "getLanePosition": (constants.VAR_LANEPOSITION, lambda veh: float(self.pos[self._row(veh)])),
+            "getSpeed": (constants.VAR_SPEED, lambda veh: float(self.speed[self._row(veh)])),
+            "getWaitingTime": (constants.VAR_WAITING_TIME, lambda veh: float(self.waiting[self.vehicle_pos[veh]])),
+            "getSignals": (constants.VAR_SIGNALS, self._signals),
+            "getNextTLS": (constants.VAR_NEXT_TLS, self._next_tls),
+        }
+        lane_getters = {
+            "getLastStepVehicleIDs": (constants.LAST_STEP_VEHICLE_ID_LIST, self._lane_vehicles),
+            "getLastStepVehicleNumber": (constants.LAST_STEP_VEHICLE_NUMBER, lambda lane: int(self.lane_count[self.lane_pos[lane]])),
+            "getLastStepHaltingNumber": (constants.LAST_STEP_VEHICLE_HALTING_NUMBER, lambda lane: int(self.lane_halting[self.lane_pos[lane]])),
+            "getWaitingTime": (constants.VAR_WAITING_TIME, lambda lane: float(self.lane_waiting[self.lane_pos[lane]])),
+            "getLength": (constants.VAR_LENGTH, lambda lane: self.lane_lengths[lane]),
+        }
+        tls_getters = {
+            "getRedYellowGreenState": (constants.TL_RED_YELLOW_GREEN_STATE, self._tls_state),
+            "getPhase": (constants.TL_CURRENT_PHASE, lambda tls: self.tls[tls]["phase"]),
+            "getControlledLanes": (constants.TL_CONTROLLED_LANES, lambda tls: tuple(self.net.get_controlled_lanes(tls))),
+        }
+        tls_methods = {
+            "getAllProgramLogics": lambda tls: (trafficlight.Logic("0", 0, 0, self.programs[tls]),),
+            "setRedYellowGreenState": self._set_tls_state,
+            "setPhaseDuration": self._set_phase_duration,
+        }
+        simulation_getters = {
+            "getTime": (constants.VAR_TIME, lambda: self.now),
+            "getDeltaT": (constants.VAR_DELTA_T, lambda: self.step_length),
+        }
+        simulation_methods = {"saveState": self._save_state, "loadState": self._load_state}
+        self.vehicle = FakeDomain(self, "vehicle", vehicle_getters, lambda: self._vehicle_rows)
+        self.lane = FakeDomain(self, "lane", lane_getters, lambda: self.lane_ids)
+        self.trafficlight = FakeDomain(self, "trafficlight", tls_getters, lambda: self.tls_ids, tls_methods)
+        self.simulation = FakeDomain(self, "simulation", simulation_getters, methods=simulation_methods)
+        self.start()
+
+    def start(self, cmd=None, **kwargs):
+        """Restart the replay at the first recorded step, all subscriptions end like with a new SUMO instance."""
+        self.calls[("traci", "start")] += 1
+        for domain in (self.vehicle, self.lane, self.trafficlight):
+            domain.subscriptions = {}
+            domain.results = {}
+        self.tls = {tls: {"phase": 0, "remaining": self.programs[tls][0].duration, "state": None} for tls in self.tls_ids}
+        self.waiting = np.zeros(len(self.vehicle_ids))
+        self.step = -1
+        self.now = float(self.steps[0]) - self.step_length
+        self._advance()
+
+    def close(self, wait=True):
+        self.calls[("traci", "close")] += 1
+
+    def simulationStep(self, step=0.):
+        self.calls[("simulation", "simulationStep")] += 1
+        target = self.now + self.step_length if step <= 0 else step
+        while self.now < target - 1e-6:
+            self._advance()
+        self.lane.update()
+        self.vehicle.update()
+        self.trafficlight.update()
+
+    def round_trips(self):
+        """Return the number of counted round trips and reset the counter."""
+        total = sum(self.calls.values())
+        self.calls.clear()
+        return total
+
+    def _advance(self):
+        self.now += self.step_length
+        # continue with the first recorded step when the recording is exhausted
+        self.step = (self.step + 1) % len(self.steps)
+        rows = slice(self.step_start[self.step], self.step_start[self.step + 1])
+        vehicles = self.record_vehicle[rows]
+        if self.step == 0:
+            self.waiting.fill(0.)
+        self.waiting[vehicles] = np.where(self.speed[rows] < HALTING_SPEED, self.waiting[vehicles] + self.step_length, 0.)
+        for tls, program in self.tls.items():
+            if program["state"] is not None:
+                continue
+            program["remaining"] -= self.step_length
+            phases = self.programs[tls]
+            while program["remaining"] <= 1e-6:
+                program["phase"] = (program["phase"] + 1) % len(phases)
+                program["remaining"] += phases[program["phase"]].duration
+        self._load_step()
+
+    def _load_step(self):
+        # lookup tables and lane aggregates of the current step
+        rows = slice(self.step_start[self.step], self.step_start[self.step + 1])
+        vehicles = self.record_vehicle[rows]
+        self._first_row = rows.start
+        self._vehicle_rows = dict(zip(map(self.vehicle_ids.__getitem__, vehicles.tolist()), range(len(vehicles))))
+        lanes = self.record_lane[rows]
+        halting = self.speed[rows] < HALTING_SPEED
+        on_net = lanes >= 0
+        self.lane_count = np.bincount(lanes[on_net], minlength=len(self.lane_ids))
+        self.lane_halting = np.bincount(lanes[on_net], weights=halting[on_net], minlength=len(self.lane_ids))
+        self.lane_waiting = np.bincount(lanes[on_net], weights=self.waiting[vehicles][on_net], minlength=len(self.lane_ids))
+        self._lane_vehicle_cache = None
+
+    def _row(self, veh):
+        return self._first_row + self._vehicle_rows[veh]
+
+    def _lane_vehicles(self, lane):
+        if self._lane_vehicle_cache is None:
+            self._lane_vehicle_cache = {}
+            rows = slice(self._first_row, self._first_row + len(self._vehicle_rows))
+            for vehicle, lane_idx in zip(self.record_vehicle[rows].tolist(), self.record_lane[rows].tolist()):
+                self._lane_vehicle_cache.setdefault(lane_idx, []).append(self.vehicle_ids[vehicle])
+        return tuple(self._lane_vehicle_cache.get(self.lane_pos[lane], ()))
+
+    def _signals(self, veh):
+        row = self._row(veh)
+        return int(self.blinker[self.record_vehicle[row]]) + (8 if self.speed[row] < HALTING_SPEED else 0)
+
+    def _next_tls(self, veh):
+        row = self._row(veh)
+        lane = self.record_lane[row]
+        if lane < 0 or self.lane_tls[lane] < 0:
+            return ()
+        tls = self.tls_ids[self.lane_tls[lane]]
+        link = int(self.lane_link[lane])
+        distance = self.lane_lengths[self.lane_ids[lane]] - float(self.pos[row])
+        return ((tls, link, distance, self._tls_state(tls)[link]),)
+
+    def _tls_state(self, tls):
+        program = self.tls[tls]
+        return program["state"] if program["state"] is not None else self.programs[tls][program["phase"]].state
+
+    def _set_tls_state(self, tls, state):
+        # like SUMO, setting a state switches to a program with this single phase
+        self.tls[tls].update(phase=0, state=state)
+
+    def _set_phase_duration(self, tls, duration):
+        self.tls[tls]["remaining"] = duration
+
+    def _save_state(self, path):
+        with open(path, "w") as f:
+            json.dump({"step": self.step, "now": self.now, "tls": self.tls, "waiting": self.waiting.tolist()}, f)
+
+    def _load_state(self, path):
+        with open(path) as f:
+            state = json.load(f)
+        self.step = state["step"]
+        self.now = state["now"]
+        self.tls = state["tls"]
+        self.waiting[:] = state["waiting"]
+        self._load_step()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the bitset based safe phase enumeration of get_safe_phases on
+synthetic foe matrices of increasing size, compared against the previous
+level-wise list implementation (kept below as reference).
+
+Example:
+    python safe_phases.py --sizes 8,12,16,20,24,32,40 --legacy_max 20
+"""
+
+import os, sys
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+from get_safe_phases import safe_phases_from_foes
+
+
+def legacy_safe_phases(foes):
+    """Previous enumeration of get_safe_phases working on intersected index lists, for reference."""
+    n_tls = foes.shape[0]
+    foes = np.ma.array(foes, mask=False)
+    for i in range(n_tls):
+        foes.mask[i][i] = True
+    non_foes_ind = [np.where(foes[i] == 0)[0] for i in range(n_tls)]
+    total_safe_phases = [[i] for i in range(n_tls)]
+    safe_phases = [[i, i2] for i in range(n_tls) for i2 in non_foes_ind[i] if i2 > i]
+    total_safe_phases += safe_phases
+    curr_non_foes = []
+    for safe_phase in safe_phases:
+        wip_non_foes = non_foes_ind[safe_phase[0]]
+        for connection in safe_phase[1:]:
+            wip_non_foes = np.intersect1d(wip_non_foes, non_foes_ind[connection])
+        curr_non_foes.append(wip_non_foes)
+    while any(non_foe.any() for non_foe in curr_non_foes):
+        dupl_safe_phases = [safe_phases[i].copy() + [c] for i in range(len(safe_phases)) for c in curr_non_foes[i]]
+        for safe_phase in dupl_safe_phases:
+            safe_phase.sort()
+        dupl_safe_phases.sort()
+        safe_phases = list(k for k, _ in itertools.groupby(dupl_safe_phases))
+        curr_non_foes = []
+        for safe_phase in safe_phases:
+            wip_non_foes = non_foes_ind[safe_phase[0]]
+            for connection in safe_phase[1:]:
+                wip_non_foes = np.intersect1d(wip_non_foes, non_foes_ind[connection])
+            curr_non_foes.append(wip_non_foes)
+        total_safe_phases += safe_phases
+    return [[int(connection) for connection in safe_phase] for safe_phase in total_safe_phases]
+
+
+def synthetic_foes(n_tls, density, rng):
+    """Return a random symmetric foe matrix with an empty diagonal."""
+    foes = np.triu(rng.random((n_tls, n_tls)) < density, 1)
+    return (foes | foes.T).astype(np.uint8)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the safe phase enumeration")
+    parser.add_argument("--sizes", default="8,12,16,20,24,32,40", help="Comma separated numbers of connections")
+    parser.add_argument("--density", type=float, default=0.5, help="Probability of two connections being foes")
+    parser.add_argument("--legacy_max", type=int, default=20, help="Largest size the legacy implementation is run for")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>5} {'combinations':>13} {'bitset all':>11} {'maximal':>8} {'bitset max':>11} {'legacy':>9}")
+    for n_tls in (int(size) for size in args.sizes.split(",")):
+        foes = synthetic_foes(n_tls, args.density, rng)
+        all_phases, all_time = timed(safe_phases_from_foes, foes)
+        maximal_phases, maximal_time = timed(safe_phases_from_foes, foes, True)
+        legacy = "skipped"
+        if n_tls <= args.legacy_max:
+            legacy_phases, legacy_time = timed(legacy_safe_phases, foes)
+            assert legacy_phases == all_phases, f"results differ for {n_tls} connections"
+            legacy = f"{legacy_time:8.3f}s"
+        print(f"{n_tls:5d} {len(all_phases):13d} {all_time:10.3f}s {len(maximal_phases):8d} {maximal_time:10.4f}s {legacy:>9}")
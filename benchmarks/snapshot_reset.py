@@ -0,0 +1,49 @@
+"""
+Benchmark of cold resets (SUMO restart + warm-up) against warm resets
+(loading a saved simulation state) of SumoGraphEnviroment.
+
+Example:
+    python snapshot_reset.py --episodes 20 --start_steps 300
+"""
+
+import os, sys
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark restart against snapshot based resets")
+    parser.add_argument("--episodes", type=int, default=20, help="Number of episodes")
+    parser.add_argument("--steps", type=int, default=10, help="Environment steps per episode")
+    parser.add_argument("--start_steps", type=int, default=300, help="Warm-up simulation steps")
+    parser.add_argument("--pool_size", type=int, default=4, help="Number of snapshots in the pool")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+
+    env = gym_env_graph_rl.SumoGraphEnviroment(
+        args.steps,
+        simulation_start_steps=args.start_steps,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+        reset_mode="snapshot",
+        snapshot_pool_size=args.pool_size,
+    )
+    actions = np.zeros(env.NODE_CNT, dtype=int)
+    for episode in range(args.episodes):
+        env.reset(seed=episode if episode == 0 else None)
+        for _ in range(args.steps):
+            env.step(actions)
+    gym_env_graph_rl.traci.close()
+
+    stats = env.getResetStats()
+    cold, warm = stats["cold"], stats["warm"]
+    print(f"cold resets: {cold['count']:3d}, mean {cold['mean'] * 1000:8.1f} ms")
+    print(f"warm resets: {warm['count']:3d}, mean {warm['mean'] * 1000:8.1f} ms")
+    if cold["count"] and warm["count"]:
+        print(f"speedup: {cold['mean'] / warm['mean']:.1f}x")
@@ -0,0 +1,70 @@
+"""
+Overhead of the opt-in StepProfiler of SumoGraphEnviroment and an example of
+its output: the same episode is run without and with a profiler for the
+libsumo (if installed) and the TraCI socket backend, the profiled runs print
+a summary and write a Chrome trace and a folded stack file per backend.
+
+Example:
+    python step_profiling.py --steps 100 --out_dir /tmp/profile
+"""
+
+import os, sys
+import argparse
+import importlib
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+from instrumentation import StepProfiler
+
+
+def run(args, profiler):
+    """Run one episode with random actions.
+
+    :return: Wall time of the steps in seconds
+    :rtype: float
+    """
+    env = gym_env_graph_rl.SumoGraphEnviroment(
+        args.steps,
+        simulation_start_steps=args.start_steps,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+        profiler=profiler,
+    )
+    actions = np.random.default_rng(0).integers(0, env.ACTION_CNT, size=(args.steps, env.NODE_CNT))
+    env.reset(seed=0)
+    start = time.perf_counter()
+    for step in range(args.steps):
+        _, _, _, _, info = env.step(actions[step])
+    elapsed = time.perf_counter() - start
+    gym_env_graph_rl.traci.close()
+    if profiler is not None:
+        assert info["profile"]["traci_calls"], "no traci calls recorded"
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of the step instrumentation")
+    parser.add_argument("--steps", type=int, default=100, help="Number of environment steps")
+    parser.add_argument("--start_steps", type=int, default=100, help="Warm-up simulation steps")
+    parser.add_argument("--trace_allocations", action="store_true", help="Measure allocations with tracemalloc as well")
+    parser.add_argument("--out_dir", default=os.path.join(BASE_DIR, "benchmarks", "output"), help="Directory the traces are written to")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    backends = ["libsumo", "traci"] if gym_env_graph_rl.traci.__name__ == "libsumo" else ["traci"]
+    for backend in backends:
+        gym_env_graph_rl.traci = importlib.import_module(backend)
+        disabled = run(args, None)
+        profiler = StepProfiler(trace_allocations=args.trace_allocations)
+        enabled = run(args, profiler)
+        print(f"{backend}: disabled {disabled * 1000 / args.steps:.2f} ms/step, "
+              f"enabled {enabled * 1000 / args.steps:.2f} ms/step ({enabled / disabled - 1:+.1%})")
+        profiler.print_summary()
+        profiler.dump_trace(os.path.join(args.out_dir, f"{backend}_trace.json"))
+        profiler.dump_folded(os.path.join(args.out_dir, f"{backend}.folded"))
@@ -0,0 +1,241 @@
+"""
+Offline benchmark suite of simulation stepping, observation building and the
+tool functions. SUMO is replaced by the deterministic ReplayTraci of
+replay_traci.py, which replays the FCD output recorded for xml/scenario1
+("scenario1") or random traffic on synthetic n x n grids (a number n).
+
+For every case and grid the suite reports throughput, latency percentiles and
+the peak of memory allocated while running the case (tracemalloc, measured in
+a separate pass so it does not slow down the timed one) and stores the results
+as JSON, which --compare checks against the results of another commit.
+
+Cases:
+    env_step       SumoGraphEnviroment.step with random actions
+    node_features  SumoGraphEnviroment.getNodeFeatures
+    get_state      traci_helpers.get_state of every tls
+    board_state    SumoBaseSimulation.getBoardState
+    safe_phases    get_safe_phases.get_safe_phases_all from the net cache
+
+Example:
+    python suite.py --grids scenario1,5,10,20 --output before.json
+    python suite.py --grids scenario1,5,10,20 --output after.json --compare before.json
+"""
+
+import os, sys
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from argparse import Namespace
+
+import numpy as np
+import traci
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the environment only needs SUMO_HOME to find traci, which the replay replaces
+os.environ.setdefault("SUMO_HOME", os.path.dirname(os.path.dirname(os.path.abspath(traci.__file__))))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+sys.path.insert(0, os.path.join(BASE_DIR, "sumobasesimulation"))
+import gym_env_graph_rl
+import traci_helpers
+import verify
+from get_safe_phases import get_safe_phases_all
+from net_cache import load_net
+from replay_traci import ReplayTraci, fcd_recording, synthetic_recording, write_grid_net
+
+SCENARIO_NET = os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml")
+SCENARIO_FCD = os.path.join(BASE_DIR, "xml", "scenario1", "grid.output200.xml")
+
+
+def case_env_step(backend, net_path, rng):
+    gym_env_graph_rl.traci = backend
+    # never terminates within the benchmark
+    env = gym_env_graph_rl.SumoGraphEnviroment(10 ** 9, sumo_net_path=net_path)
+    env.reset(seed=0)
+    actions = rng.integers(0, env.ACTION_CNT, size=(64, env.NODE_CNT))
+    step = iter(range(10 ** 12))
+    return lambda: env.step(actions[next(step) % len(actions)]), None
+
+
+def case_node_features(backend, net_path, rng):
+    gym_env_graph_rl.traci = backend
+    env = gym_env_graph_rl.SumoGraphEnviroment(10 ** 9, sumo_net_path=net_path)
+    env.reset(seed=0)
+
+    def advance():
+        backend.simulationStep()
+        env.observation_engine.refresh()
+    return env.getNodeFeatures, advance
+
+
+def case_get_state(backend, net_path, rng):
+    traci_helpers.traci = backend
+    tls_ids = backend.trafficlight.getIDList()
+    return lambda: [traci_helpers.get_state(tls) for tls in tls_ids], backend.simulationStep
+
+
+def case_board_state(backend, net_path, rng):
+    verify.traci = backend
+    simulation = verify.SumoBaseSimulation(Namespace(sumo_config_path=None, sumo_cmd_env=None, sumo_net_path=net_path))
+    return simulation.getBoardState, backend.simulationStep
+
+
+def case_safe_phases(backend, net_path, rng):
+    return lambda: get_safe_phases_all(net_path, use_cache=True), None
+
+
+CASES = {
+    "env_step": case_env_step,
+    "node_features": case_node_features,
+    "get_state": case_get_state,
+    "board_state": case_board_state,
+    "safe_phases": case_safe_phases,
+}
+
+
+def prepare_grid(grid, work_dir, vehicles_per_lane, record_steps):
+    """Return the net file and the recording of a grid, synthetic grids are written into ``work_dir``.
+
+    :param grid: "scenario1" or the size of a synthetic grid
+    :type grid: str
+    :return: Path of the net file and the recording
+    :rtype: tuple
+    """
+    if grid == "scenario1":
+        return SCENARIO_NET, fcd_recording(SCENARIO_FCD)
+    net_path = write_grid_net(os.path.join(work_dir, f"grid{int(grid)}.net.xml"), int(grid))
+    net = load_net(net_path)
+    return net_path, synthetic_recording(net, int(vehicles_per_lane * len(net.lane_ids)), record_steps)
+
+
+def measure(case, backend, net_path, args):
+    """Time ``args.iterations`` calls of a case after ``args.warmup`` untimed ones, then measure its peak memory.
+
+    :return: Throughput, latency statistics in milliseconds and peak memory in bytes
+    :rtype: dict
+    """
+    backend.start()
+    backend.round_trips()
+    function, advance = CASES[case](backend, net_path, np.random.default_rng(0))
+    for _ in range(args.warmup):
+        if advance is not None:
+            advance()
+        function()
+    latencies = np.zeros(args.iterations)
+    round_trips = 0
+    for idx in range(args.iterations):
+        if advance is not None:
+            advance()
+        backend.round_trips()
+        start = time.perf_counter()
+        function()
+        latencies[idx] = time.perf_counter() - start
+        round_trips += backend.round_trips()
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(args.memory_iterations):
+        if advance is not None:
+            advance()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, (50, 90, 99)) * 1000
+    return {
+        "iterations": args.iterations,
+        "throughput": args.iterations / latencies.sum(),
+        "latency_ms": {"mean": latencies.mean() * 1000, "p50": p50, "p90": p90, "p99": p99, "max": latencies.max() * 1000},
+        "peak_memory_bytes": int(peak),
+        "round_trips": round_trips / args.iterations,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change of median latency and throughput against a previous run.
+
+    :return: Number of case/grid combinations whose median latency grew by more than ``threshold``
+    :rtype: int
+    """
+    previous = {(result["case"], result["grid"]): result for result in baseline["results"]}
+    regressions = 0
+    print(f"\ncompared to {baseline.get('commit') or 'baseline'}")
+    print(f"{'case':>14} {'grid':>10} {'p50 before':>11} {'p50 now':>10} {'ratio':>7} {'throughput':>11}")
+    for result in results:
+        before = previous.get((result["case"], result["grid"]))
+        if before is None:
+            continue
+        ratio = result["latency_ms"]["p50"] / before["latency_ms"]["p50"]
+        throughput = result["throughput"] / before["throughput"]
+        regression = ratio > threshold
+        regressions += regression
+        print(f"{result['case']:>14} {result['grid']:>10} {before['latency_ms']['p50']:10.3f}ms {result['latency_ms']['p50']:8.3f}ms "
+              f"{ratio:6.2f}x {throughput:10.2f}x{'  REGRESSION' if regression else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--grids", default="scenario1,5,10", help="Comma separated grids: scenario1 or sizes of synthetic n x n grids")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma separated cases")
+    parser.add_argument("--iterations", type=int, default=100, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed calls before timing")
+    parser.add_argument("--memory_iterations", type=int, default=5, help="Calls measured with tracemalloc")
+    parser.add_argument("--vehicles_per_lane", type=float, default=3., help="Vehicles per lane of synthetic grids")
+    parser.add_argument("--record_steps", type=int, default=200, help="Recorded steps of synthetic grids")
+    parser.add_argument("--work_dir", default=None, help="Directory for synthetic nets, defaults to a temporary directory")
+    parser.add_argument("--output", default=None, help="Path of the JSON results, defaults to benchmarks/output/suite-<commit>.json")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.1, help="Median latency ratio reported as regression")
+    args = parser.parse_args()
+
+    # a temporary work directory is removed once the grids are measured, one in --work_dir is kept
+    temporary_dir = tempfile.TemporaryDirectory(prefix="benchmark_suite_") if args.work_dir is None else None
+    work_dir = args.work_dir or temporary_dir.name
+    commit = git_commit()
+    results = []
+    print(f"{'case':>14} {'grid':>10} {'ops/s':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'peak mem':>10} {'trips':>8}")
+    for grid in args.grids.split(","):
+        net_path, recording = prepare_grid(grid, work_dir, args.vehicles_per_lane, args.record_steps)
+        backend = ReplayTraci(net_path, recording)
+        for case in args.cases.split(","):
+            result = dict(case=case, grid=grid, tls=len(backend.tls_ids), lanes=len(backend.lane_ids),
+                          vehicles=len(backend.vehicle_ids), **measure(case, backend, net_path, args))
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"{case:>14} {grid:>10} {result['throughput']:10.1f} {latency['p50']:7.3f}ms {latency['p90']:7.3f}ms "
+                  f"{latency['p99']:7.3f}ms {result['peak_memory_bytes'] / 1024:7.0f}KiB {result['round_trips']:8.1f}")
+    if temporary_dir is not None:
+        temporary_dir.cleanup()
+
+    output = args.output or os.path.join(BASE_DIR, "benchmarks", "output", f"suite-{(commit or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results, json.load(f), args.threshold) else 0)
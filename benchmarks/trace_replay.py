@@ -0,0 +1,77 @@
+"""
+Records episodes of SumoGraphEnviroment with TraceRecorder, replays them with
+TraceReplay and the same actions, checks that observations and rewards are
+identical and compares the time of the live and the replayed episodes.
+
+Example:
+    python trace_replay.py --episodes 3 --steps 30 --trace_dir /tmp/trace
+"""
+
+import os, sys
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+import gym_env_graph_rl
+from trace_backend import TraceRecorder, TraceReplay
+
+
+def run(env_kwargs, episodes, steps):
+    """Run episodes with random actions, the same ones for every call.
+
+    :return: Observed node features and rewards, wall time in seconds
+    :rtype: tuple
+    """
+    env = gym_env_graph_rl.SumoGraphEnviroment(steps, **env_kwargs)
+    actions = np.random.default_rng(0).integers(0, env.ACTION_CNT, size=(episodes, steps, env.NODE_CNT))
+    outputs = []
+    start = time.perf_counter()
+    for episode_actions in actions:
+        observation, _ = env.reset(seed=0)
+        outputs.append(observation["nodes"])
+        for action in episode_actions:
+            observation, reward, _, _, _ = env.step(action)
+            outputs += [observation["nodes"], reward]
+    elapsed = time.perf_counter() - start
+    gym_env_graph_rl.traci.close()
+    return outputs, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare live and replayed episodes")
+    parser.add_argument("--episodes", type=int, default=3, help="Number of episodes")
+    parser.add_argument("--steps", type=int, default=30, help="Environment steps per episode")
+    parser.add_argument("--start_steps", type=int, default=50, help="Warm-up simulation steps")
+    parser.add_argument("--step_mode", default="fixed", help="Step mode of the environment: fixed or event")
+    parser.add_argument("--trace_dir", default=None, help="Directory of the trace, defaults to a temporary directory")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+    # a temporary trace is removed at exit, one in --trace_dir is kept
+    temporary_dir = tempfile.TemporaryDirectory(prefix="sumo_trace_") if args.trace_dir is None else None
+    trace_dir = args.trace_dir or temporary_dir.name
+    env_kwargs = dict(
+        simulation_start_steps=args.start_steps,
+        simulation_yellow_steps=2,
+        simulation_step_size=5,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+        step_mode=args.step_mode,
+    )
+
+    live_module = gym_env_graph_rl.traci
+    gym_env_graph_rl.traci = TraceRecorder(live_module, trace_dir)
+    recorded, live_time = run(env_kwargs, args.episodes, args.steps)
+    gym_env_graph_rl.traci = TraceReplay(trace_dir)
+    replayed, replay_time = run(env_kwargs, args.episodes, args.steps)
+
+    difference = max(np.abs(a - b).max() for a, b in zip(recorded, replayed))
+    size = os.path.getsize(os.path.join(trace_dir, "trace.bin"))
+    print(f"live {live_time:.2f}s, replay {replay_time:.3f}s ({live_time / replay_time:.0f}x), "
+          f"trace {size / 1024:.0f} KiB in {trace_dir}, max difference {difference}")
+    if temporary_dir is not None:
+        temporary_dir.cleanup()
@@ -0,0 +1,72 @@
+"""
+Checks the batch variants of tools/traci_helpers.py against the per-call
+functions on a fake TraCI stand-in and reports the TraCI round trips per
+simulation step of both.
+
+Example:
+    python traci_batch.py --lanes 200 --vehicles 2000 --steps 20
+"""
+
+import os, sys
+import argparse
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tools"))
+import traci_helpers
+from fake_traci import FakeTraci
+
+
+def measure(fake, function, *args):
+    """Call ``function`` and return its result, round trips and wall time."""
+    fake.round_trips()
+    start = time.perf_counter()
+    result = function(*args)
+    return result, fake.round_trips(), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-call and batch TraCI helpers")
+    parser.add_argument("--lanes", type=int, default=200, help="Number of lanes")
+    parser.add_argument("--vehicles", type=int, default=2000, help="Number of vehicles")
+    parser.add_argument("--steps", type=int, default=20, help="Number of simulation steps")
+    args = parser.parse_args()
+
+    fake = FakeTraci(args.lanes, args.vehicles)
+    traci_helpers.traci = fake
+    lanes = fake.lane_ids
+    checks = {
+        "get_vehicle_numbers": (
+            lambda: list(traci_helpers.get_vehicle_numbers(lanes).values()),
+            lambda: traci_helpers.get_vehicle_numbers_batch(lanes).tolist(),
+        ),
+        "get_waiting_time": (
+            lambda: traci_helpers.get_waiting_time(lanes),
+            lambda: traci_helpers.get_waiting_time_batch(lanes).sum(),
+        ),
+        "get_emissions": (
+            lambda: traci_helpers.get_emissions(list(fake.vehicles)),
+            lambda: traci_helpers.get_emissions_batch(list(fake.vehicles)).mean(axis=0),
+        ),
+        "getnetworkwaitingtime": (
+            lambda: traci_helpers.getnetworkwaitingtime(list(fake.vehicles)),
+            lambda: traci_helpers.getnetworkwaitingtime_batch(list(fake.vehicles)).mean(),
+        ),
+    }
+    totals = {name: np.zeros(4) for name in checks}
+    for step in range(args.steps):
+        fake.simulationStep()
+        for name, (per_call, batch) in checks.items():
+            expected, expected_trips, expected_time = measure(fake, per_call)
+            result, trips, batch_time = measure(fake, batch)
+            assert np.allclose(expected, result), f"{name} differs in step {step}"
+            totals[name] += (expected_trips, trips, expected_time, batch_time)
+    fake.round_trips()
+
+    print(f"{args.lanes} lanes, {args.vehicles} vehicles, mean per simulation step over {args.steps} steps:")
+    print(f"{'function':>22} {'per-call trips':>15} {'batch trips':>12} {'per-call ms':>12} {'batch ms':>9}")
+    for name, (expected_trips, trips, expected_time, batch_time) in totals.items():
+        print(f"{name:>22} {expected_trips / args.steps:15.1f} {trips / args.steps:12.1f} "
+              f"{expected_time / args.steps * 1000:12.2f} {batch_time / args.steps * 1000:9.2f}")
@@ -0,0 +1,67 @@
+"""
+Benchmark of the aggregated step throughput of SumoGraphVectorEnv for an
+increasing number of worker processes on the 5x5 grid of xml/scenario1.
+
+Example:
+    python vector_step.py --envs 1,2,4,8 --steps 200
+"""
+
+import os, sys
+import argparse
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "reinforcement-learning"))
+from vector_env import SumoGraphVectorEnv
+
+
+def run(num_envs, args):
+    """Step ``num_envs`` simulations in lockstep and return the aggregated environment steps per second.
+
+    :param num_envs: Number of worker processes
+    :type num_envs: int
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :return: Steps per second summed over all environments
+    :rtype: float
+    """
+    env = SumoGraphVectorEnv(
+        num_envs,
+        seed=0,
+        observation_copy=False,
+        simulation_steps=args.steps,
+        simulation_start_steps=args.start_steps,
+        sumo_net_path=args.net,
+        sumo_cfg_path=args.cfg,
+    )
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, env.ACTION_CNT, size=(args.steps, num_envs, env.NODE_CNT))
+    start = time.perf_counter()
+    for step in range(args.steps):
+        env.step(actions[step])
+    duration = time.perf_counter() - start
+    env.close()
+    return num_envs * args.steps / duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scaling of the vectorized SUMO environment")
+    parser.add_argument("--envs", default=f"1,2,4,{os.cpu_count()}", help="Comma separated numbers of parallel environments")
+    parser.add_argument("--steps", type=int, default=200, help="Number of environment steps")
+    parser.add_argument("--start_steps", type=int, default=100, help="Warm-up simulation steps")
+    parser.add_argument("--net", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.net.xml"), help="Path for SUMO net file")
+    parser.add_argument("--cfg", default=os.path.join(BASE_DIR, "xml", "scenario1", "grid.sumocfg"), help="Path for SUMO config file")
+    args = parser.parse_args()
+
+    env_counts = sorted({int(count) for count in args.envs.split(",")})
+    baseline = None
+    print(f"cpu count: {os.cpu_count()}")
+    for num_envs in env_counts:
+        steps_per_second = run(num_envs, args)
+        if baseline is None:
+            baseline = steps_per_second / num_envs
+        efficiency = steps_per_second / (baseline * num_envs)
+        print(f"{num_envs:3d} envs: {steps_per_second:8.1f} steps/s, scaling efficiency {efficiency:.2f}")
@@ -0,0 +1,123 @@
+"""
+Asynchronous stepping for the SUMO graph RL environment
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import numpy as np
+
+
+class StepOverlapStats:
+    """Tracks how much of the simulation time was hidden behind work of the caller.
+
+    For each step the wall time the simulation needed and the time the caller
+    blocked in ``step_wait`` are recorded. Everything the caller did not have
+    to wait for overlapped with its own work (e.g. policy inference).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.simulation_time = 0.
+        self.wait_time = 0.
+
+    def add(self, simulation_time, wait_time):
+        self.steps += 1
+        self.simulation_time += simulation_time
+        # waiting includes the IPC/thread hand-over, which can exceed the simulation time itself
+        self.wait_time += min(wait_time, simulation_time)
+
+    def summary(self):
+        """Return the accumulated timings.
+
+        :return: Dictionary with the number of steps, total simulation time, total blocking time, overlapped time (all in seconds) & ratio of overlapped to simulation time
+        :rtype: dict
+        """
+        overlap_time = self.simulation_time - self.wait_time
+        return {
+            "steps": self.steps,
+            "simulation_time": self.simulation_time,
+            "wait_time": self.wait_time,
+            "overlap_time": overlap_time,
+            "overlap_ratio": overlap_time / self.simulation_time if self.simulation_time else 0.,
+        }
+
+
+class ThreadedSumoGraphEnv:
+    """Runs ``step`` of a ``SumoGraphEnviroment`` in a background thread so that the
+    simulation of the next interval overlaps with the work of the caller.
+
+    This is meant for the TraCI socket backend: while the background thread waits
+    for the SUMO process the GIL is released. libsumo runs SUMO inside the Python
+    process and holds the GIL, so use ``SumoGraphVectorEnv`` (one simulation per
+    worker process) in that case, which offers the same ``step_async``/``step_wait`` API.
+
+    :param env: Environment to step in the background
+    :type env: SumoGraphEnviroment
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.stats = StepOverlapStats()
+
+    def _timed_step(self, actions):
+        start = time.perf_counter()
+        result = self.env.step(actions)
+        return result, time.perf_counter() - start
+
+    def step_async(self, actions):
+        """Start simulating the next interval with the given actions and return immediately.
+
+        :param actions: One action per tls node
+        :type actions: np.ndarray
+        """
+        if self.future is not None:
+            raise RuntimeError("step_async was called while the previous step is still pending")
+        # the caller is free to modify its actions array while the step runs
+        actions = None if actions is None else np.array(actions, copy=True)
+        self.future = self.executor.submit(self._timed_step, actions)
+
+    def step_wait(self):
+        """Block until the step started by :meth:`step_async` is done.
+
+        :return: Observation, reward, terminated, truncated & info as returned by ``SumoGraphEnviroment.step``
+        :rtype: tuple
+        """
+        if self.future is None:
+            raise RuntimeError("step_wait was called without a pending step_async")
+        start = time.perf_counter()
+        result, simulation_time = self.future.result()
+        self.future = None
+        self.stats.add(simulation_time, time.perf_counter() - start)
+        return result
+
+    async def astep(self, actions):
+        """Awaitable version of :meth:`step_async` followed by :meth:`step_wait`.
+        The event loop keeps running other coroutines meanwhile, the recorded wait time is the time until the step finished.
+        """
+        self.step_async(actions)
+        start = time.perf_counter()
+        result, simulation_time = await asyncio.wrap_future(self.future)
+        self.future = None
+        self.stats.add(simulation_time, time.perf_counter() - start)
+        return result
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def reset(self, **kwargs):
+        if self.future is not None:
+            self.step_wait()
+        return self.env.reset(**kwargs)
+
+    def close(self):
+        if self.future is not None:
+            self.step_wait()
+        self.executor.shutdown()
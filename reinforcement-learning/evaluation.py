@@ -0,0 +1,359 @@
+"""
+Parallel evaluation of traffic light controllers over scenarios and SUMO seeds
+
+Every combination of scenario, controller and seed is one run: one episode of SumoGraphEnviroment
+with a fixed ``--seed`` whose KPIs are taken from the tripinfo and summary outputs SUMO writes (see kpi_stream).
+Runs are spread over a process pool and each finished run stores its ``result.json``,
+so an interrupted sweep continues with the runs that are still missing.
+
+Example:
+    python evaluation.py --scenarios ../xml/scenario1/grid.sumocfg --controllers fixed_time,random --seeds 1-10 --steps 100
+"""
+
+import os, sys
+import argparse
+import csv
+import importlib
+import itertools
+import json
+import multiprocessing as mp
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from kpi_stream import KPIStream
+
+# KPIs of a run, aggregated over the seeds of each scenario and controller
+KPIS = ("mean_waiting_time", "mean_time_loss", "mean_queue_length", "throughput", "co2_kg", "reward")
+
+# two-sided 95% quantiles of the t-distribution by degrees of freedom, larger ones use the normal quantile
+T_QUANTILES = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+               12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+
+def fixed_time_controller(env, seed):
+    """Baseline: never sets a state, so every tls runs its own program (``getAllProgramLogics``)."""
+    return lambda observation: None
+
+
+def random_controller(env, seed):
+    """Chooses a random valid phase for every tls in every step."""
+    rng = np.random.default_rng(seed)
+    action_cnt = np.array([env.tls_to_action_cnt[tls] for tls in env.tls_ids])
+    return lambda observation: (rng.random(len(action_cnt)) * action_cnt).astype(int)
+
+
+CONTROLLERS = {
+    "fixed_time": fixed_time_controller,
+    "random": random_controller,
+}
+
+
+def load_controller(name: str):
+    """Return the factory of a controller.
+
+    :param name: Name in ``CONTROLLERS`` or ``module:attribute`` of a function ``factory(env, seed)`` that returns
+        a policy mapping observations to actions, e.g. of a trained model
+    :type name: str
+    :return: The controller factory
+    :rtype: callable
+    """
+    if name in CONTROLLERS:
+        return CONTROLLERS[name]
+    if ":" not in name:
+        raise ValueError(f"Unknown controller '{name}', expected one of {sorted(CONTROLLERS)} or 'module:attribute'")
+    module, attribute = name.split(":", 1)
+    return getattr(importlib.import_module(module), attribute)
+
+
+def scenario_net_path(sumo_cfg_path: str):
+    """Return the net file of a SUMO config, relative paths are resolved against the config directory."""
+    net_file = ET.parse(sumo_cfg_path).getroot().find("input/net-file").get("value")
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(sumo_cfg_path)), net_file))
+
+
+def run_additional_files(sumo_cfg_path: str, run_dir: str):
+    """Return the additional files of a SUMO config with the meandata outputs (edgeData, laneData) written into ``run_dir``.
+    Additional files defining meandata are copied into ``run_dir`` with their ``file`` attributes pointing there,
+    so runs in parallel do not write into the same file of the scenario directory. All other files are kept.
+
+    :param sumo_cfg_path: Path to the SUMO config
+    :type sumo_cfg_path: str
+    :param run_dir: Output directory of the run
+    :type run_dir: str
+    :return: Absolute paths of the additional files
+    :rtype: list
+    """
+    cfg_dir = os.path.dirname(os.path.abspath(sumo_cfg_path))
+    additional = ET.parse(sumo_cfg_path).getroot().find("input/additional-files")
+    paths = []
+    for name in (additional.get("value").split(",") if additional is not None else []):
+        path = os.path.normpath(os.path.join(cfg_dir, name.strip()))
+        tree = ET.parse(path)
+        meandata = [elem for elem in tree.getroot() if elem.tag in ("edgeData", "laneData")]
+        if meandata:
+            for elem in meandata:
+                elem.set("file", os.path.join(os.path.abspath(run_dir), f"{elem.tag}_{elem.get('id')}.xml"))
+            path = os.path.join(run_dir, os.path.basename(path))
+            tree.write(path)
+        paths.append(path)
+    return paths
+
+
+def scenario_name(sumo_cfg_path: str):
+    """Return a name for a SUMO config: its directory and file name, e.g. ``scenario1_grid``."""
+    path = os.path.abspath(sumo_cfg_path)
+    return f"{os.path.basename(os.path.dirname(path))}_{os.path.splitext(os.path.basename(path))[0]}"
+
+
+def stream_kpis(stream: KPIStream):
+    """Return the KPIs of a run from its summary and tripinfo outputs (including unfinished trips).
+
+    :param stream: Stream reading the outputs of the run, after SUMO has been closed
+    :type stream: KPIStream
+    :return: Mean waiting time and time loss in seconds, mean queue length in vehicles, number of arrived vehicles and CO2 in kg
+    :rtype: dict
+    """
+    stream.update()
+    trip_means = stream.trip_means()
+    return {
+        "mean_waiting_time": trip_means["waiting_time"],
+        "mean_time_loss": trip_means["time_loss"],
+        "mean_queue_length": stream.mean_queue_length(),
+        "throughput": stream.arrived,
+        # CO2_abs is in mg
+        "co2_kg": stream.trip_sums["co2"] / 1e6,
+    }
+
+
+def make_runs(scenarios: list, controllers: list, seeds: list):
+    """Return the runs of a sweep: every combination of scenario, controller and seed."""
+    return [
+        {"name": f"{scenario_name(scenario)}__{controller.replace(':', '.')}__seed{seed}",
+         "scenario": scenario_name(scenario), "sumo_cfg_path": scenario, "controller": controller, "seed": seed}
+        for scenario, controller, seed in itertools.product(scenarios, controllers, seeds)
+    ]
+
+
+def evaluate_run(run: dict, out_dir: str, env_kwargs: dict):
+    """Run one episode and return its KPIs, or the stored result if the run finished before.
+
+    :param run: Run as returned by :func:`make_runs`
+    :type run: dict
+    :param out_dir: Directory of the sweep, the run writes its SUMO outputs and result into ``runs/<name>``
+    :type out_dir: str
+    :param env_kwargs: Further arguments of SumoGraphEnviroment, e.g. ``simulation_steps``
+    :type env_kwargs: dict
+    :return: The run with its KPIs, number of steps and wall time
+    :rtype: dict
+    """
+    run_dir = os.path.join(out_dir, "runs", run["name"])
+    result_path = os.path.join(run_dir, "result.json")
+    if os.path.exists(result_path):
+        with open(result_path) as f:
+            return json.load(f)
+    os.makedirs(run_dir, exist_ok=True)
+    # every worker process owns its own traci/libsumo connection
+    import gym_env_graph_rl
+
+    start = time.perf_counter()
+    stream = KPIStream(run_dir, outputs=("summary", "tripinfo"), write_unfinished=True)
+    env = gym_env_graph_rl.SumoGraphEnviroment(
+        sumo_cfg_path=run["sumo_cfg_path"],
+        sumo_net_path=scenario_net_path(run["sumo_cfg_path"]),
+        sumo_seed=run["seed"],
+        # runs in parallel must not write the FCD and meandata outputs of the scenario config into the same files
+        sumo_args=stream.sumo_args() + ["--fcd-output", os.devnull, "--additional-files",
+                                        ",".join(run_additional_files(run["sumo_cfg_path"], run_dir))],
+        **env_kwargs,
+    )
+    policy = load_controller(run["controller"])(env, run["seed"])
+    observation, _ = env.reset(seed=run["seed"])
+    terminated = truncated = False
+    steps = 0
+    reward = 0.
+    while not (terminated or truncated):
+        observation, rewards, terminated, truncated, _ = env.step(policy(observation))
+        reward += float(np.sum(rewards))
+        steps += 1
+    # closing flushes the outputs
+    env.traci.close()
+
+    result = dict(run, **stream_kpis(stream),
+                  reward=reward, steps=steps, wall_time=time.perf_counter() - start)
+    stream.close()
+    # the result marks the run as finished, so it must never be partially written
+    with open(result_path + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(result_path + ".tmp", result_path)
+    return result
+
+
+def _evaluate_run_task(args):
+    return evaluate_run(*args)
+
+
+def confidence_interval(values):
+    """Return mean and half width of the 95% confidence interval (t-distribution) of the mean of ``values``."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return float(values.mean()) if len(values) else np.nan, np.nan
+    df = len(values) - 1
+    quantile = T_QUANTILES[max(key for key in T_QUANTILES if key <= df)] if df <= 30 else 1.96
+    return float(values.mean()), float(quantile * values.std(ddof=1) / np.sqrt(len(values)))
+
+
+def aggregate(results: list):
+    """Aggregate the KPIs of all seeds of each scenario and controller.
+
+    :param results: Results of :func:`evaluate_run`
+    :type results: list
+    :return: One row per scenario and controller with the number of runs and mean, lower and upper bound of the
+        95% confidence interval of every KPI
+    :rtype: list
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["scenario"], result["controller"]), []).append(result)
+    rows = []
+    for (scenario, controller), group in sorted(groups.items()):
+        row = {"scenario": scenario, "controller": controller, "runs": len(group)}
+        for kpi in KPIS:
+            mean, half_width = confidence_interval([result[kpi] for result in group])
+            row.update({kpi: mean, f"{kpi}_ci_low": mean - half_width, f"{kpi}_ci_high": mean + half_width})
+        rows.append(row)
+    return rows
+
+
+def write_csv(rows: list, path: str):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def check_sweep(out_dir: str, env_kwargs: dict):
+    """Store the environment arguments of a sweep in ``sweep.json``, or check them against the stored ones.
+    Results of a sweep with other arguments (e.g. other ``simulation_steps``) must not be resumed.
+
+    :param out_dir: Directory of the sweep
+    :type out_dir: str
+    :param env_kwargs: Further arguments of SumoGraphEnviroment
+    :type env_kwargs: dict
+    """
+    manifest_path = os.path.join(out_dir, "sweep.json")
+    # compare in their JSON form, e.g. tuples are stored as lists
+    env_kwargs = json.loads(json.dumps(env_kwargs))
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            stored = json.load(f)["env_kwargs"]
+        if stored != env_kwargs:
+            changed = sorted(key for key in set(stored) | set(env_kwargs) if stored.get(key) != env_kwargs.get(key))
+            raise ValueError(f"{out_dir} holds a sweep with other environment arguments ({', '.join(changed)}), "
+                             f"use another out_dir or remove it")
+        return
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"env_kwargs": env_kwargs}, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def run_sweep(scenarios: list, controllers: list, seeds: list, out_dir: str, env_kwargs: dict, processes: int = None):
+    """Evaluate every combination of scenario, controller and seed in a process pool and write the results.
+
+    Runs that finished in an earlier, interrupted sweep into the same ``out_dir`` are not repeated,
+    the environment arguments have to be the same as in that sweep, see :func:`check_sweep`.
+    Writes ``runs.csv`` with the KPIs of every run and ``results.csv`` with the aggregates of :func:`aggregate`.
+
+    :param scenarios: Paths of SUMO configs
+    :type scenarios: list
+    :param controllers: Controller names, see :func:`load_controller`
+    :type controllers: list
+    :param seeds: SUMO seeds
+    :type seeds: list
+    :param out_dir: Directory of the sweep
+    :type out_dir: str
+    :param env_kwargs: Further arguments of SumoGraphEnviroment
+    :type env_kwargs: dict
+    :param processes: Number of worker processes, defaults to the number of cores, 1 runs everything in this process
+    :type processes: int
+    :return: Aggregated rows as returned by :func:`aggregate`
+    :rtype: list
+    """
+    processes = processes or os.cpu_count()
+    os.makedirs(out_dir, exist_ok=True)
+    check_sweep(out_dir, env_kwargs)
+    runs = make_runs(scenarios, controllers, seeds)
+    finished = [run for run in runs if os.path.exists(os.path.join(out_dir, "runs", run["name"], "result.json"))]
+    print(f"{len(runs)} runs, {len(finished)} finished before, {processes} processes")
+    tasks = [(run, out_dir, env_kwargs) for run in runs]
+    results = []
+    if processes == 1:
+        outcomes = map(_evaluate_run_task, tasks)
+        pool = None
+    else:
+        # one run per worker process, so no SUMO connection or module state is shared between runs;
+        # chunksize 1 keeps all cores busy until the last run
+        pool = mp.Pool(processes, maxtasksperchild=1)
+        outcomes = pool.imap_unordered(_evaluate_run_task, tasks, chunksize=1)
+    try:
+        for result in outcomes:
+            results.append(result)
+            print(f"[{len(results)}/{len(runs)}] {result['name']}: waiting {result['mean_waiting_time']:.1f}s, "
+                  f"queue {result['mean_queue_length']:.1f}, throughput {result['throughput']}, "
+                  f"CO2 {result['co2_kg']:.1f}kg ({result['wall_time']:.1f}s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    results.sort(key=lambda result: result["name"])
+    rows = aggregate(results)
+    write_csv(results, os.path.join(out_dir, "runs.csv"))
+    write_csv(rows, os.path.join(out_dir, "results.csv"))
+    return rows
+
+
+def parse_seeds(seeds: str):
+    """Parse seeds like ``1-10`` or ``1,5,7``."""
+    parsed = []
+    for part in seeds.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            parsed += list(range(int(first), int(last) + 1))
+        else:
+            parsed.append(int(part))
+    return parsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate controllers over scenarios and SUMO seeds in parallel")
+    parser.add_argument("--scenarios", default="../xml/scenario1/grid.sumocfg", help="Comma separated SUMO configs")
+    parser.add_argument("--controllers", default="fixed_time,random",
+                        help="Comma separated controllers: " + ", ".join(CONTROLLERS) + " or module:attribute of a factory(env, seed)")
+    parser.add_argument("--seeds", default="1-5", help="SUMO seeds, e.g. 1-10 or 1,5,7")
+    parser.add_argument("--steps", type=int, default=100, help="Environment steps of each run")
+    parser.add_argument("--start_steps", type=int, default=0, help="SUMO steps before the first environment step")
+    parser.add_argument("--yellow_steps", type=int, default=0, help="SUMO steps of a yellow transition")
+    parser.add_argument("--step_size", type=int, default=1, help="SUMO steps per environment step")
+    parser.add_argument("--step_mode", default="fixed", help="Step mode of the environment: fixed or event")
+    parser.add_argument("--sumo_path", default="sumo", help="SUMO binary")
+    parser.add_argument("--out_dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluation"),
+                        help="Directory of the sweep, rerunning with it resumes the sweep, defaults to reinforcement-learning/evaluation")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    env_kwargs = {
+        "simulation_steps": args.steps,
+        "simulation_start_steps": args.start_steps,
+        "simulation_yellow_steps": args.yellow_steps,
+        "simulation_step_size": args.step_size,
+        "step_mode": args.step_mode,
+        "sumo_path": args.sumo_path,
+    }
+    rows = run_sweep([os.path.abspath(path) for path in args.scenarios.split(",")], args.controllers.split(","),
+                     parse_seeds(args.seeds), args.out_dir, env_kwargs, args.processes)
+    for row in rows:
+        print(f"{row['scenario']:>20} {row['controller']:>12} ({row['runs']} runs): " + ", ".join(
+            f"{kpi} {row[kpi]:.2f} [{row[f'{kpi}_ci_low']:.2f}, {row[f'{kpi}_ci_high']:.2f}]" for kpi in KPIS))
+    print(f"results written to {os.path.join(args.out_dir, 'results.csv')}")
@@ -1,5 +1,7 @@
 import random
-from typing import Tuple, List, Optional
+import tempfile
+import time
+from typing import Tuple, Optional
 
 from gym.core import ObsType
 
@@ -24,11 +26,17 @@ except:
 import gym
 
 import numpy as np
-import xml.etree.ElementTree as ET
+
+from observation_engine import SubscriptionObservationEngine
+from instrumentation import StepProfiler, no_phase
+
+# network cache of the tools directory of this repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from net_cache import load_net
 
 # helper function to return phases a tls program contains that do not contain yellow states and not only red states
-def getPhasesNotYellowForTls(tls):
-    phases = list(traci.trafficlight.getAllProgramLogics(tls)[0].phases)
+def getPhasesNotYellowForTls(tls, traci_module=None):
+    phases = list((traci_module or traci).trafficlight.getAllProgramLogics(tls)[0].phases)
     return_phases = []
     for phase in phases:
         if ('y' not in phase.state and 'Y' not in phase.state) and not len(str(phase.state).replace('r', '')) == 0:
@@ -36,6 +44,10 @@ def getPhasesNotYellowForTls(tls):
 
     return sorted(return_phases, key=lambda phase: phase.state)
 
+# yellow state shown while a tls switches away from the given state
+def yellowState(state):
+    return state.replace('G', 'y').replace('g', 'y')
+
 class SumoGraphEnviroment(gym.Env):
 
     def __init__(
@@ -50,9 +62,29 @@ class SumoGraphEnviroment(gym.Env):
         sumo_warning: bool = False,
         sumo_verbose: bool = False,
         sumo_routing_thread: int = 4,
-        sumo_time_to_teleport: int = -1
+        sumo_time_to_teleport: int = -1,
+        sumo_seed: Optional[int] = None,
+        sumo_args: Optional[list] = None,
+        use_subscriptions: bool = True,
+        observation_copy: bool = True,
+        reset_mode: str = "restart",
+        snapshot_pool_size: int = 4,
+        snapshot_offset_steps: int = 0,
+        snapshot_dir: Optional[str] = None,
+        net_cache_dir: Optional[str] = None,
+        adjacency_format: str = "dense",
+        step_mode: str = "fixed",
+        min_green_steps: Optional[int] = None,
+        max_green_steps: Optional[int] = None,
+        decision_interval_steps: Optional[int] = None,
+        profiler: Optional[StepProfiler] = None
     ):
         super().__init__()
+        # opt-in instrumentation, without a profiler phases are a shared no-op and traci is not wrapped;
+        # the wrapped module belongs to this environment, other environments keep their own
+        self.profiler = profiler
+        self._phase = profiler.phase if profiler is not None else no_phase
+        self.traci = profiler.wrap(traci) if profiler is not None else traci
         self.simulation_steps = simulation_steps
         self.simulation_start_steps = simulation_start_steps
         self.simulation_step_size = simulation_step_size
@@ -64,10 +96,51 @@ class SumoGraphEnviroment(gym.Env):
         self.sumo_ttt = sumo_time_to_teleport
         self.sumo_verbose = sumo_verbose
         self.sumo_warning = sumo_warning
+        # fixed seed of every SUMO run (e.g. for evaluations), otherwise a new one is drawn for each run
+        self.sumo_seed = sumo_seed
+        # additional SUMO options, e.g. outputs
+        self.sumo_args = list(sumo_args or [])
+        # if False, observations and rewards are views into buffers that are overwritten by the next step
+        self.observation_copy = observation_copy
+
+        # "restart": relaunch SUMO on every reset, "snapshot": restore one of a pool of states saved after warm-up
+        if reset_mode not in ("restart", "snapshot"):
+            raise ValueError(f"Unknown reset_mode '{reset_mode}', expected 'restart' or 'snapshot'")
+        self.reset_mode = reset_mode
+        self.snapshot_pool_size = snapshot_pool_size
+        self.snapshot_offset_steps = snapshot_offset_steps
+        if reset_mode == "snapshot" and snapshot_dir is None:
+            self._snapshot_tmp_dir = tempfile.TemporaryDirectory(prefix="sumo_snapshots_")
+            snapshot_dir = self._snapshot_tmp_dir.name
+        self.snapshot_dir = snapshot_dir
+        self.snapshots = []
+        self.reset_times = {"cold": [], "warm": []}
+
+        # "dense": NODE_CNT x NODE_CNT matrix, "coo": edge_index of shape (2, edges), "csr": indptr/indices
+        # sparse formats come with edge_attr (lane count, length) and all formats are returned by reference
+        if adjacency_format not in ("dense", "coo", "csr"):
+            raise ValueError(f"Unknown adjacency_format '{adjacency_format}', expected 'dense', 'coo' or 'csr'")
+        self.adjacency_format = adjacency_format
+
+        # "fixed": every tls decides each yellow + step size steps, "event": each tls decides when its
+        # next decision is due (min green over, green extended by step size, max green reached)
+        # and SUMO is advanced to the earliest pending event in a single call
+        if step_mode not in ("fixed", "event"):
+            raise ValueError(f"Unknown step_mode '{step_mode}', expected 'fixed' or 'event'")
+        self.step_mode = step_mode
+        self.min_green_steps = simulation_step_size if min_green_steps is None else min_green_steps
+        self.max_green_steps = max_green_steps
+        # decisions are due on a common grid of this interval, so tls whose phases end close together act in the same step
+        self.decision_interval_steps = simulation_step_size if decision_interval_steps is None else decision_interval_steps
 
         self.simulation_cur_step = 0
         self.tls_to_node = {}
-        self.adj = np.array([])
+        self.adj = None
+        self.graph = {}
+        self.observation_engine = None
+
+        # parsed once per net file and shared between instances through memory-mapped arrays
+        self.net = load_net(self.sumo_net_path, cache_dir=net_cache_dir)
 
         self.startTraci()
 
@@ -75,17 +148,15 @@ class SumoGraphEnviroment(gym.Env):
         self.create_adj()
 
         self.node_to_tls = {v: k for k, v in self.tls_to_node.items()}
-        self.tls_to_lanes = {tls: list(set(traci.trafficlight.getControlledLanes(tls))) for tls in self.tls_to_node.keys()}
-        lane_list = list(set(filter(lambda x: ":" not in str(x), traci.lane.getIDList())))
-        self.lane_last_step_halting_number = {lane: 0 for lane in lane_list}
-        self.lane_lengths = {lane: traci.lane.getLength(lane) for lane in lane_list}
+        self.tls_to_lanes = {tls: list(set(self.net.get_controlled_lanes(tls))) for tls in self.tls_to_node.keys()}
+        self.lane_lengths = self.net.get_lane_lengths()
         self.lane_idx = {}
         for tls in sorted(self.tls_to_lanes.keys(), key=str):
-            tls_lanes = set(traci.trafficlight.getControlledLanes(tls))
+            tls_lanes = set(self.tls_to_lanes[tls])
             for idx, lane in enumerate(sorted(tls_lanes, key=str)):
                 self.lane_idx[lane] = idx
         self.tls_to_phases = {
-            tls: getPhasesNotYellowForTls(tls) for tls in self.tls_to_node.keys()
+            tls: getPhasesNotYellowForTls(tls, self.traci) for tls in self.tls_to_node.keys()
         }
         self.tls_to_action_cnt = {tls: len(phases) for tls, phases in self.tls_to_phases.items()}
         self.tls_last_action = {tls: -1 for tls in self.tls_to_node.keys()}
@@ -93,132 +164,376 @@ class SumoGraphEnviroment(gym.Env):
         self.relevant_vehicle_signals = {0, 1, 2, 8, 9, 10}
 
         self.ACTION_CNT = max(self.tls_to_action_cnt.values())
+        self.createBuffers()
+        self.createTransitionTable()
+
+        # subscribe lane and tls values once instead of querying them lane by lane each step
+        if use_subscriptions:
+            self.observation_engine = SubscriptionObservationEngine(self.traci, self.tls_ids, self.lanes)
+            self.lane_values = self.observation_engine.lane_values
+            self.observation_engine.subscribe()
+
         self.NODE_FEATURES_CNT = self.getNodeFeatures().shape[1]
-        self.NODE_CNT = len(traci.trafficlight.getIDList())
+        self.NODE_CNT = len(self.traci.trafficlight.getIDList())
         self.isFirstReset = True
 
     def startTraci(self):
         # TODO: make SUMO parameters optional and add option for GUI usage
-        traci.start(
+        self.traci.start(
             [
                 self.sumo_path,
                 "-c", self.sumo_cfg_path,
                 "--time-to-teleport", str(self.sumo_ttt),
-                "--seed", str(random.randint(1, 999999)),
+                "--seed", str(self.sumo_seed if self.sumo_seed is not None else random.randint(1, 999999)),
                 "--verbose", str(self.sumo_verbose),
                 "--routing-threads", str(self.sumo_routing_threads),
                 "--max-depart-delay", str(self.simulation_start_steps),
                 "--no-warnings", str(self.sumo_warning),
-            ]
+            ] + self.sumo_args
         )
         for _ in range(self.simulation_start_steps):
-            traci.simulationStep()
+            self.traci.simulationStep()
+        if self.reset_mode == "snapshot" and len(self.snapshots) < self.snapshot_pool_size:
+            # every cold start until the pool is full contributes one snapshot with its own seed,
+            # optionally warmed up a bit longer to also vary the traffic situation
+            self.skip_steps(len(self.snapshots) * self.snapshot_offset_steps)
+            self.saveSnapshot()
+        if self.observation_engine is not None:
+            self.observation_engine.subscribe()
+
+    def saveSnapshot(self):
+        path = os.path.join(self.snapshot_dir, f"snapshot_{len(self.snapshots)}.sbx")
+        self.traci.simulation.saveState(path)
+        self.snapshots.append(path)
+
+    def loadSnapshot(self):
+        # keeps the running SUMO instance, whose random number generator continues,
+        # so episodes starting from the same snapshot still differ
+        path = self.snapshots[self.np_random.integers(len(self.snapshots))]
+        self.traci.simulation.loadState(path)
+        # subscriptions do not survive loading a state
+        if self.observation_engine is not None:
+            self.observation_engine.subscribe()
+
+    def getResetStats(self) -> dict:
+        """Return count and mean duration in seconds of cold (SUMO restart) and warm (snapshot) resets."""
+        return {
+            kind: {"count": len(times), "mean": float(np.mean(times)) if times else 0.}
+            for kind, times in self.reset_times.items()
+        }
 
     def create_adj(self):
-        root = ET.parse(self.sumo_net_path).getroot()
-        adj = np.eye(len(self.tls_to_node))
-        for edge in root.findall('edge'):
-            if 'from' in edge.keys():
-                from_tls = self.tls_to_node[edge.attrib['from']]
-                to_tls = self.tls_to_node[edge.attrib['to']]
-                adj[from_tls, to_tls] = 1
-        self.adj = adj
+        NODE_CNT = len(self.tls_to_node)
+        # node of each junction of the net, -1 for junctions without tls
+        junction_node = np.array([self.tls_to_node.get(junction, -1) for junction in self.net.junction_ids.tolist()] + [-1])
+        # edges from/to unknown junctions are stored as -1, which maps to the trailing -1 above
+        from_node = junction_node[self.net.edge_from]
+        to_node = junction_node[self.net.edge_to]
+        connects_tls = (from_node >= 0) & (to_node >= 0) & (from_node != to_node)
+
+        # self loops (no features) followed by the edges between tls, parallel edges are merged
+        nodes = np.arange(NODE_CNT)
+        rows = np.concatenate((nodes, from_node[connects_tls]))
+        cols = np.concatenate((nodes, to_node[connects_tls]))
+        lane_count = np.concatenate((np.zeros(NODE_CNT), self.net.edge_lane_count[connects_tls]))
+        length = np.concatenate((np.zeros(NODE_CNT), self.net.edge_length[connects_tls]))
+        # row-major order, so the same edge order serves COO and CSR
+        flat, edge = np.unique(rows * NODE_CNT + cols, return_inverse=True)
+        edge = edge.ravel()
+        parallel = np.bincount(edge, minlength=len(flat))
+        self.edge_index = np.stack((flat // NODE_CNT, flat % NODE_CNT)).astype(np.int64)
+        self.edge_attr = np.stack((
+            np.bincount(edge, weights=lane_count, minlength=len(flat)),
+            np.bincount(edge, weights=length, minlength=len(flat)) / parallel,
+        ), axis=1)
+        self.adj_indices = self.edge_index[1]
+        self.adj_indptr = np.concatenate(([0], np.cumsum(np.bincount(self.edge_index[0], minlength=NODE_CNT)))).astype(np.int64)
+
+        if self.adjacency_format == "dense":
+            self.adj = np.zeros((NODE_CNT, NODE_CNT))
+            self.adj[self.edge_index[0], self.edge_index[1]] = 1
+            self.graph = {"adj": self.adj}
+        elif self.adjacency_format == "coo":
+            self.graph = {"edge_index": self.edge_index, "edge_attr": self.edge_attr}
+        else:
+            self.graph = {"indptr": self.adj_indptr, "indices": self.adj_indices, "edge_attr": self.edge_attr}
+        # the graph is built once and shared by all observations, so it must not be modified
+        for array in (self.edge_index, self.edge_attr, self.adj_indptr, *self.graph.values()):
+            array.setflags(write=False)
+
+    def createBuffers(self):
+        # index layout: entry i scatters the values of lane layout_lanes[i] into
+        # row layout_rows[i] (tls node) and slot layout_slots[i] of the feature block
+        self.tls_ids = [self.node_to_tls[node] for node in range(len(self.node_to_tls))]
+        self.lanes = sorted({lane for lanes in self.tls_to_lanes.values() for lane in lanes}, key=str)
+        lane_pos = {lane: idx for idx, lane in enumerate(self.lanes)}
+        layout = [
+            (lane_pos[lane], self.tls_to_node[tls], self.lane_idx[lane])
+            for tls in self.tls_ids for lane in self.tls_to_lanes[tls]
+        ]
+        self.layout_lanes, self.layout_rows, self.layout_slots = (np.array(column, dtype=np.intp) for column in zip(*layout))
+
+        LANES = max(self.lane_idx.values()) + 1
+        FEATURES = 2
+        TLS_CNT = len(self.tls_ids)
+        # column 0: vehicle number, column 1: halting number
+        self.lane_values = np.zeros((len(self.lanes), FEATURES))
+        self.layout_values = np.zeros((len(self.layout_lanes), FEATURES))
+        # lane features followed by current phase and relative action count
+        self.node_features = np.zeros((TLS_CNT, LANES * FEATURES + 2))
+        self.lane_features = self.node_features[:, :LANES * FEATURES].reshape(TLS_CNT, LANES, FEATURES)
+        self.lane_features_maxima = np.zeros((TLS_CNT, 1, FEATURES))
+        self.node_features[:, -1] = [self.tls_to_action_cnt[tls] / self.ACTION_CNT for tls in self.tls_ids]
+        self.rewards = np.zeros(TLS_CNT)
+
+    def createTransitionTable(self):
+        # tls_transitions[node][cur][target]: yellow state shown when tls node switches from phase cur to phase
+        # target, None if both phases show the same state
+        self.tls_states = [[phase.state for phase in self.tls_to_phases[tls]] for tls in self.tls_ids]
+        self.tls_transitions = [
+            [[None if cur == target else yellowState(cur) for target in states] for cur in states]
+            for states in self.tls_states
+        ]
+        # phase each tls shows as set by the environment, -1 while it still runs its own program after a reset
+        self.tls_phase = np.full(len(self.tls_ids), -1)
 
     def fillNodeDict(self):
-        for node_id, tls_id in enumerate(traci.trafficlight.getIDList()):
+        for node_id, tls_id in enumerate(self.traci.trafficlight.getIDList()):
             self.tls_to_node[tls_id] = node_id
 
     def getNodeFeatures(self) -> np.ndarray:
-        LANES = max(self.lane_idx.values()) + 1
-        FEATURES = 2
-        TLS_CNT = len(self.node_to_tls)
-        features = np.zeros((TLS_CNT, LANES, FEATURES))
-        phases = np.zeros((TLS_CNT, 2))
-        for idx, (tls, node) in enumerate(self.tls_to_node.items()):
-            phases[idx, 0] = traci.trafficlight.getPhase(tls)
-            phases[idx, 1] = self.tls_to_action_cnt[tls] / self.ACTION_CNT
-            for lane in self.tls_to_lanes[tls]:
-                lane_idx = self.lane_idx[lane]
-                vehicles = traci.lane.getLastStepVehicleIDs(lane)
-                features[idx, lane_idx, 0] = len(vehicles)
-                features[idx, lane_idx, 1] = self.lane_last_step_halting_number[lane]
-        maxima = np.max(features, axis=-2)
-        maxima = maxima[:, None, :]
+        if self.observation_engine is not None:
+            self.node_features[:, -2] = self.observation_engine.phases
+        else:
+            for idx, tls in enumerate(self.tls_ids):
+                self.node_features[idx, -2] = self.traci.trafficlight.getPhase(tls)
+            for idx, lane in enumerate(self.lanes):
+                self.lane_values[idx, 0] = self.traci.lane.getLastStepVehicleNumber(lane)
+        features = self.lane_features
+        np.take(self.lane_values, self.layout_lanes, axis=0, out=self.layout_values)
+        features[self.layout_rows, self.layout_slots] = self.layout_values
+        maxima = self.lane_features_maxima
+        np.max(features, axis=-2, keepdims=True, out=maxima)
         EPS = 1e-8
-        features /= maxima + EPS
-        features = np.reshape(features, (TLS_CNT, LANES * FEATURES))
-        features = np.append(features, phases, axis=-1)
+        maxima += EPS
+        features /= maxima
 
-        return features
+        return self.node_features.copy() if self.observation_copy else self.node_features
 
     def _get_obs(self):
         return {
             "nodes": self.getNodeFeatures(),
-            "adj": self.adj
+            **self.graph
         }
 
     def _get_info(self):
         return {'info': "There is currently no info"}
 
     def reset(self, seed=None, options=None, sim_steps=None):
+        if self.profiler is None:
+            return self._reset(seed, options, sim_steps)
+        self.profiler.begin_step()
+        with self._phase("reset"):
+            observation, info = self._reset(seed, options, sim_steps)
+        return observation, dict(info or {}, profile=self.profiler.end_step())
+
+    def _reset(self, seed=None, options=None, sim_steps=None):
         super().reset(seed=seed)
         self.simulation_cur_step = 0
         if sim_steps is not None:
             self.simulation_steps = sim_steps
         if not self.isFirstReset:
-            traci.close()
-            self.startTraci()
+            start = time.perf_counter()
+            if self.reset_mode == "snapshot" and len(self.snapshots) >= self.snapshot_pool_size:
+                self.loadSnapshot()
+                self.reset_times["warm"].append(time.perf_counter() - start)
+            else:
+                self.traci.close()
+                self.startTraci()
+                self.reset_times["cold"].append(time.perf_counter() - start)
         else:
             self.isFirstReset = False
-        observation = self._get_obs()
+        # restarts and loaded snapshots run the tls programs again
+        self.tls_phase.fill(-1)
+        if self.step_mode == "event":
+            self.resetEventSchedule()
+            observation = self._get_obs()
+            observation["acting"] = self.acting.copy()
+        else:
+            observation = self._get_obs()
         info = None
 
         return observation, info
 
     def skip_steps(self, steps):
         for _ in range(steps):
-            traci.simulationStep()
+            self.traci.simulationStep()
+
+    def resetEventSchedule(self):
+        """Start the event schedule of the ``"event"`` step mode: all tls act at the current time and
+        the episode ends after as much simulated time as ``simulation_steps`` fixed steps would take."""
+        TLS_CNT = len(self.tls_ids)
+        self.step_length = self.traci.simulation.getDeltaT()
+        now = self.traci.simulation.getTime()
+        self.episode_start_time = now
+        fixed_step = (self.simulation_yellow_steps + self.simulation_step_size) * self.step_length
+        self.episode_end_time = now + self.simulation_steps * fixed_step
+        self.tls_action = np.full(TLS_CNT, -1)
+        self.tls_state = [self.traci.trafficlight.getRedYellowGreenState(tls) for tls in self.tls_ids]
+        self.phase_start = np.full(TLS_CNT, now)
+        self.yellow_end = np.full(TLS_CNT, np.inf)
+        self.next_decision = np.full(TLS_CNT, now)
+        self.acting = np.ones(TLS_CNT, dtype=bool)
+
+    def nextDecisionTime(self, earliest):
+        """Return the first time of the decision grid that is not before ``earliest``."""
+        interval = max(self.decision_interval_steps, 1) * self.step_length
+        # small tolerance against floating point drift of the simulation time
+        return self.episode_start_time + np.ceil((earliest - self.episode_start_time) / interval - 1e-6) * interval
+
+    def setTlsState(self, node, state):
+        if self.tls_state[node] != state:
+            self.traci.trafficlight.setRedYellowGreenState(self.tls_ids[node], state)
+            self.tls_state[node] = state
+
+    def stepEvents(self, actions: Optional[np.ndarray]) -> Tuple[ObsType, np.ndarray, bool, bool, dict]:
+        """``step`` of the ``"event"`` step mode. Only the tls flagged in ``observation["acting"]`` of the
+        previous observation decide, the actions of all other tls are ignored."""
+        self.simulation_cur_step += 1
+        now = self.traci.simulation.getTime()
+        tls_action_penalty = []
+        with self._phase("actions"):
+            self.applyEventActions(actions, now, tls_action_penalty)
+
+        with self._phase("simulation"):
+            terminated = self.advanceToNextEvent(now)
+        with self._phase("observation"):
+            if self.observation_engine is not None:
+                self.observation_engine.refresh()
+            self.fillLastStepHaltingNumber()
+        with self._phase("reward"):
+            reward = self.reward(tls_action_penalty)
+        with self._phase("observation"):
+            observation = self._get_obs()
+            observation["acting"] = self.acting.copy()
+
+        truncated = False
+        info = None
+
+        return observation, reward, terminated, truncated, info
+
+    def applyEventActions(self, actions, now, tls_action_penalty):
+        EPS = 1e-6
+        dt = self.step_length
+        for node in (np.flatnonzero(self.acting) if actions is not None else []):
+            tls = self.tls_ids[node]
+            action = int(actions[node])
+            if action >= self.tls_to_action_cnt[tls]:
+                tls_action_penalty.append(tls)
+                self.next_decision[node] = self.nextDecisionTime(now + self.simulation_step_size * dt)
+                continue
+            if (action == self.tls_action[node] and self.max_green_steps is not None
+                    and now - self.phase_start[node] >= self.max_green_steps * dt - EPS):
+                # max green reached, continue with the next phase
+                action = (action + 1) % self.tls_to_action_cnt[tls]
+            next_state = self.tls_to_phases[tls][action].state
+            if action == self.tls_action[node]:
+                # extend the green phase
+                self.next_decision[node] = self.nextDecisionTime(now + self.simulation_step_size * dt)
+                continue
+            previous = self.tls_action[node]
+            self.tls_action[node] = action
+            if self.simulation_yellow_steps > 0 and next_state != self.tls_state[node]:
+                self.setTlsState(node, self.tls_transitions[node][previous][action] if previous >= 0 else yellowState(self.tls_state[node]))
+                self.yellow_end[node] = now + self.simulation_yellow_steps * dt
+                self.next_decision[node] = np.inf
+            else:
+                # also taking over from the tls program if it currently shows the chosen phase
+                self.traci.trafficlight.setRedYellowGreenState(tls, next_state)
+                self.tls_state[node] = next_state
+                self.phase_start[node] = now
+                self.next_decision[node] = self.nextDecisionTime(now + self.min_green_steps * dt)
+
+    def advanceToNextEvent(self, now):
+        """Advance SUMO to the next step any tls acts in (or the episode ends), handling yellow ends on the way.
+
+        :return: Whether the episode ended
+        :rtype: bool
+        """
+        EPS = 1e-6
+        dt = self.step_length
+        while True:
+            # advance SUMO to the earliest pending event in one call
+            target = min(self.next_decision.min(), self.yellow_end.min(), self.episode_end_time)
+            self.traci.simulationStep(max(target, now + dt))
+            now = self.traci.simulation.getTime()
+            for node in np.flatnonzero(self.yellow_end <= now + EPS):
+                tls = self.tls_ids[node]
+                self.setTlsState(node, self.tls_to_phases[tls][self.tls_action[node]].state)
+                self.phase_start[node] = now
+                self.yellow_end[node] = np.inf
+                self.next_decision[node] = self.nextDecisionTime(now + self.min_green_steps * dt)
+            np.less_equal(self.next_decision, now + EPS, out=self.acting)
+            terminated = now >= self.episode_end_time - EPS
+            if self.acting.any() or terminated:
+                return terminated
+
+    def step(self, actions: Optional[np.ndarray]) -> Tuple[ObsType, np.ndarray, bool, bool, dict]:
+        if self.profiler is None:
+            return self._step(actions)
+        self.profiler.begin_step()
+        observation, reward, terminated, truncated, info = self._step(actions)
+        info = dict(info or {}, profile=self.profiler.end_step())
+        return observation, reward, terminated, truncated, info
 
-    def step(self, actions: Optional[np.ndarray]) -> Tuple[ObsType, List[float], bool, bool, dict]:
+    def _step(self, actions: Optional[np.ndarray]) -> Tuple[ObsType, np.ndarray, bool, bool, dict]:
+        if self.step_mode == "event":
+            return self.stepEvents(actions)
         self.simulation_cur_step += 1
         actions_is_not_none = actions is not None
 
         tls_action_penalty = []
-        if actions_is_not_none:
-            for idx, action in enumerate(actions):
-                tls = self.node_to_tls[idx]
-                if action >= self.tls_to_action_cnt[tls]:
-                    tls_action_penalty.append(tls)
-                    continue
-                cur_phase = traci.trafficlight.getRedYellowGreenState(tls)
-                next_phase = self.tls_to_phases[tls][action].state
-                if cur_phase == next_phase:
-                    continue
-                cur_phase = cur_phase.replace('G', 'y').replace('g', 'y')
-                traci.trafficlight.setRedYellowGreenState(
-                    tls,
-                    cur_phase
-                )
-        self.skip_steps(self.simulation_yellow_steps)
-        if actions_is_not_none:
-            for idx, action in enumerate(actions):
-                tls = self.node_to_tls[idx]
-                if action >= self.tls_to_action_cnt[tls]:
-                    tls_action_penalty.append(tls)
-                    continue
-                next_phase = self.tls_to_phases[tls][action].state
-                traci.trafficlight.setRedYellowGreenState(
-                    tls,
-                    next_phase
-                )
-        self.skip_steps(self.simulation_step_size)
+        # nodes switching to another phase, only these are set
+        switching = []
+        with self._phase("actions"):
+            if actions_is_not_none:
+                for node, action in enumerate(actions):
+                    tls = self.tls_ids[node]
+                    if action >= self.tls_to_action_cnt[tls]:
+                        tls_action_penalty.append(tls)
+                        continue
+                    cur = self.tls_phase[node]
+                    if cur == action:
+                        continue
+                    if cur >= 0:
+                        yellow = self.tls_transitions[node][cur][action]
+                    else:
+                        # first decision after a reset, the tls shows a state of its own program
+                        cur_state = self.traci.trafficlight.getRedYellowGreenState(tls)
+                        yellow = None if cur_state == self.tls_states[node][action] else yellowState(cur_state)
+                    if yellow is not None and self.simulation_yellow_steps > 0:
+                        self.traci.trafficlight.setRedYellowGreenState(tls, yellow)
+                    switching.append((node, action))
+        with self._phase("simulation"):
+            self.skip_steps(self.simulation_yellow_steps)
+        with self._phase("actions"):
+            for node, action in switching:
+                self.traci.trafficlight.setRedYellowGreenState(self.tls_ids[node], self.tls_states[node][action])
+                self.tls_phase[node] = action
+        with self._phase("simulation"):
+            self.skip_steps(self.simulation_step_size)
 
         terminated = self.simulation_cur_step >= self.simulation_steps
 
         # required for reward and Obs
-        self.fillLastStepHaltingNumber()
-        reward = self.reward(tls_action_penalty)
-        observation = self._get_obs()
+        with self._phase("observation"):
+            if self.observation_engine is not None:
+                self.observation_engine.refresh()
+            self.fillLastStepHaltingNumber()
+        with self._phase("reward"):
+            reward = self.reward(tls_action_penalty)
+        with self._phase("observation"):
+            observation = self._get_obs()
 
         truncated = False
         info = None
@@ -226,15 +541,17 @@ class SumoGraphEnviroment(gym.Env):
         return observation, reward, terminated, truncated, info
 
     def reward(self, tls_action_penalty):
-        queue_length = [0.] * len(self.tls_to_lanes.keys())
-        for idx, (tls, lanes) in enumerate(self.tls_to_lanes.items()):
-            for lane in lanes:
-                queue_length[idx] -= self.lane_last_step_halting_number[lane]
-            if tls in tls_action_penalty:
-                queue_length[idx] *= 2
-        return queue_length
+        queue_length = self.rewards
+        queue_length.fill(0.)
+        np.take(self.lane_values, self.layout_lanes, axis=0, out=self.layout_values)
+        np.subtract.at(queue_length, self.layout_rows, self.layout_values[:, 1])
+        if tls_action_penalty:
+            queue_length[[self.tls_to_node[tls] for tls in set(tls_action_penalty)]] *= 2
+        return queue_length.copy() if self.observation_copy else queue_length
 
     def fillLastStepHaltingNumber(self):
-        for tls, lanes in self.tls_to_lanes.items():
-            for lane in lanes:
-                self.lane_last_step_halting_number[lane] = traci.lane.getLastStepHaltingNumber(lane)
+        if self.observation_engine is not None:
+            # already part of the subscription results pulled after the last step
+            return
+        for idx, lane in enumerate(self.lanes):
+            self.lane_values[idx, 1] = self.traci.lane.getLastStepHaltingNumber(lane)
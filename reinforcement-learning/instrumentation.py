@@ -0,0 +1,281 @@
+"""
+Opt-in instrumentation of the SUMO graph RL environment
+"""
+
+import json
+import os
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+
+# attributes of traci/libsumo that are domains, calls to their methods are counted per domain
+DOMAINS = {
+    "busstop", "calibrator", "chargingstation", "edge", "gui", "inductionloop", "junction", "lane", "lanearea",
+    "meandata", "multientryexit", "overheadwire", "parkingarea", "person", "poi", "polygon", "rerouter", "route",
+    "routeprobe", "simulation", "trafficlight", "variablespeedsign", "vehicle", "vehicletype",
+}
+
+
+class _NoPhase:
+    """Context manager doing nothing, used while instrumentation is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+def no_phase(name):
+    return NO_PHASE
+
+
+class _Phase:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._pop()
+        return False
+
+
+class InstrumentedDomain:
+    """Proxy of a TraCI domain that reports every method call to the profiler."""
+
+    def __init__(self, profiler, domain, name):
+        self._profiler = profiler
+        self._domain = domain
+        self._name = name
+        self._methods = {}
+
+    def __getattr__(self, method):
+        wrapper = self._methods.get(method)
+        if wrapper is None:
+            attribute = getattr(self._domain, method)
+            if not callable(attribute):
+                return attribute
+            wrapper = self._methods[method] = self._profiler._wrap_call(attribute, self._name, method)
+        return wrapper
+
+
+class InstrumentedTraci:
+    """Proxy of the ``traci`` or ``libsumo`` module that reports every call to the profiler.
+    Constants, exceptions and other non-callable attributes are passed through.
+    """
+
+    def __init__(self, profiler, module):
+        self._profiler = profiler
+        self.module = module
+        self._attributes = {}
+
+    def __getattr__(self, name):
+        proxy = self._attributes.get(name)
+        if proxy is None:
+            attribute = getattr(self.module, name)
+            if name in DOMAINS:
+                proxy = InstrumentedDomain(self._profiler, attribute, name)
+            elif callable(attribute) and not isinstance(attribute, type):
+                # module level functions like simulationStep, start or close
+                domain = "simulation" if name.startswith("simulation") else "traci"
+                proxy = self._profiler._wrap_call(attribute, domain, name)
+            else:
+                return attribute
+            self._attributes[name] = proxy
+        return proxy
+
+
+class StepProfiler:
+    """Records per-phase wall times, TraCI calls per domain and optionally allocations of environment steps.
+
+    The environment wraps its ``traci``/``libsumo`` module with :meth:`wrap` and marks the phases of a step
+    (e.g. "actions", "simulation", "observation", "reward") with :meth:`phase`.
+    :meth:`end_step` returns the measurements of a step (put into the ``info`` dict by the environment),
+    :meth:`summary` aggregates all steps and :meth:`dump_trace`/:meth:`dump_folded` write the recorded
+    phases and calls for flame graph viewers.
+
+    :param summary_interval: Print a summary every this many steps, 0 disables it
+    :type summary_interval: int
+    :param trace_allocations: Whether to measure allocated memory per phase with tracemalloc, which slows Python down considerably
+    :type trace_allocations: bool
+    :param max_trace_events: Number of most recent phases and calls kept for :meth:`dump_trace`
+    :type max_trace_events: int
+    """
+
+    def __init__(self, summary_interval: int = 0, trace_allocations: bool = False, max_trace_events: int = 100000):
+        self.summary_interval = summary_interval
+        self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=max_trace_events)
+        self.reset()
+
+    def reset(self):
+        """Drop all measurements."""
+        self.steps = 0
+        self.phase_times = defaultdict(float)
+        self.phase_allocations = defaultdict(int)
+        self.calls = Counter()
+        self.call_times = defaultdict(float)
+        self.folded = Counter()
+        self.events.clear()
+        # entries: [name, start, time spent in children, traced memory at start]
+        self._stack = []
+        self._step = None
+
+    def wrap(self, traci_module):
+        """Return a proxy of ``traci_module`` reporting its calls to this profiler.
+
+        :param traci_module: The ``traci`` or ``libsumo`` module, or a proxy returned by this method before
+        :type traci_module: module
+        :return: The instrumented module
+        :rtype: InstrumentedTraci
+        """
+        if isinstance(traci_module, InstrumentedTraci):
+            traci_module = traci_module.module
+        return InstrumentedTraci(self, traci_module)
+
+    def phase(self, name: str):
+        """Return a context manager measuring a phase of the current step, phases can be nested.
+
+        :param name: Name of the phase
+        :type name: str
+        """
+        return _Phase(self, name)
+
+    def _path(self, name):
+        return ";".join([entry[0] for entry in self._stack] + [name])
+
+    def _push(self, name):
+        memory = tracemalloc.get_traced_memory()[0] if self.trace_allocations else 0
+        self._stack.append([name, time.perf_counter(), 0., memory])
+
+    def _pop(self):
+        end = time.perf_counter()
+        path = self._path("")[:-1]
+        name, start, children, memory = self._stack.pop()
+        duration = end - start
+        self._record(path, name, start, duration, duration - children)
+        self.phase_times[name] += duration
+        if self._step is not None:
+            self._step["phases"][name] = self._step["phases"].get(name, 0.) + duration
+        if self.trace_allocations:
+            allocated = tracemalloc.get_traced_memory()[0] - memory
+            self.phase_allocations[name] += allocated
+            if self._step is not None:
+                self._step["allocations"][name] = self._step["allocations"].get(name, 0) + allocated
+
+    def _record(self, path, name, start, duration, self_time):
+        if self._stack:
+            self._stack[-1][2] += duration
+        self.folded[path] += self_time
+        self.events.append((name, start, duration, len(self._stack)))
+
+    def _wrap_call(self, function, domain, method):
+        key = (domain, method)
+        name = f"{domain}.{method}"
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                self.calls[key] += 1
+                self.call_times[key] += duration
+                if self._step is not None:
+                    self._step["traci_calls"][domain] = self._step["traci_calls"].get(domain, 0) + 1
+                self._record(self._path(name), name, start, duration, duration)
+        return call
+
+    def begin_step(self):
+        """Start measuring a step, all phases and calls until :meth:`end_step` belong to it."""
+        self._step = {"phases": {}, "traci_calls": {}, "allocations": {}}
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+            self._step_memory = tracemalloc.get_traced_memory()[0]
+        self._push("step")
+
+    def end_step(self):
+        """Finish the current step, print a summary if one is due.
+
+        :return: Wall time per phase, TraCI calls per domain and, if traced, allocated bytes per phase and peak of the step
+        :rtype: dict
+        """
+        self._pop()
+        step = self._step
+        self._step = None
+        if self.trace_allocations:
+            step["allocations"]["peak"] = tracemalloc.get_traced_memory()[1] - self._step_memory
+        self.steps += 1
+        if self.summary_interval and self.steps % self.summary_interval == 0:
+            self.print_summary()
+        return step
+
+    def summary(self):
+        """Aggregate all steps recorded so far.
+
+        :return: Number of steps, mean wall time per phase and step, TraCI calls per domain and step,
+            the calls with the most time spent and, if traced, mean allocated bytes per phase and step
+        :rtype: dict
+        """
+        steps = max(self.steps, 1)
+        domains = Counter()
+        for (domain, _), count in self.calls.items():
+            domains[domain] += count
+        top_calls = sorted(self.call_times.items(), key=lambda item: item[1], reverse=True)[:10]
+        summary = {
+            "steps": self.steps,
+            "phase_time": {name: total / steps for name, total in self.phase_times.items()},
+            "traci_calls": {domain: count / steps for domain, count in domains.items()},
+            "top_calls": [
+                {"call": f"{domain}.{method}", "count": self.calls[(domain, method)], "time": total}
+                for (domain, method), total in top_calls
+            ],
+        }
+        if self.trace_allocations:
+            summary["allocations"] = {name: total / steps for name, total in self.phase_allocations.items()}
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"--- profile after {summary['steps']} steps (mean per step) ---")
+        for name, duration in sorted(summary["phase_time"].items(), key=lambda item: item[1], reverse=True):
+            allocated = summary.get("allocations", {}).get(name)
+            memory = f" {allocated / 1024:10.1f} KiB" if allocated is not None else ""
+            print(f"{name:>20} {duration * 1000:10.3f} ms{memory}")
+        print("traci calls: " + ", ".join(f"{domain} {count:.1f}" for domain, count in sorted(summary["traci_calls"].items())))
+
+    def dump_trace(self, path: str):
+        """Write the recorded phases and calls in the Chrome trace event format, which
+        chrome://tracing, Perfetto and speedscope show as flame chart over time.
+
+        :param path: Path of the JSON file
+        :type path: str
+        """
+        trace = [
+            {"name": name, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": duration * 1e6, "pid": os.getpid(), "tid": 0}
+            for name, start, duration, _ in self.events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    def dump_folded(self, path: str):
+        """Write the self time of every phase/call stack in microseconds in the folded stack format
+        of flamegraph.pl (``step;simulation;simulation.simulationStep 1234``), which speedscope reads as well.
+
+        :param path: Path of the text file
+        :type path: str
+        """
+        with open(path, "w") as f:
+            for stack, self_time in sorted(self.folded.items()):
+                f.write(f"{stack} {max(int(self_time * 1e6), 0)}\n")
@@ -0,0 +1,65 @@
+"""
+Subscription based observation engine for the SUMO graph RL environment
+"""
+
+import numpy as np
+
+
+class SubscriptionObservationEngine:
+    """Collects the lane and tls values that make up the node features of
+    ``SumoGraphEnviroment`` through TraCI variable subscriptions.
+
+    The subscriptions are registered once per SUMO run (:meth:`subscribe`).
+    SUMO then delivers their results together with every ``simulationStep``,
+    so a single :meth:`refresh` per step replaces one ``getPhase`` call per tls
+    and one ``getLastStepVehicleNumber``/``getLastStepHaltingNumber`` call per lane.
+    The pulled values are written into the persistent arrays :attr:`lane_values`
+    and :attr:`phases`.
+
+    :param traci_module: The ``traci`` or ``libsumo`` module used by the environment
+    :type traci_module: module
+    :param tls_ids: IDs of all tls in node order
+    :type tls_ids: list
+    :param lanes: IDs of all controlled lanes, defines the row order of :attr:`lane_values`
+    :type lanes: list
+    """
+
+    def __init__(self, traci_module, tls_ids, lanes):
+        self.traci = traci_module
+        self.tls_ids = list(tls_ids)
+        self.lanes = list(lanes)
+
+        constants = traci_module.constants
+        self.VEHICLE_NUMBER = constants.LAST_STEP_VEHICLE_NUMBER
+        self.HALTING_NUMBER = constants.LAST_STEP_VEHICLE_HALTING_NUMBER
+        self.CURRENT_PHASE = constants.TL_CURRENT_PHASE
+
+        # column 0: vehicle number, column 1: halting number
+        self.lane_values = np.zeros((len(self.lanes), 2))
+        self.phases = np.zeros(len(self.tls_ids))
+
+    def subscribe(self):
+        """Register the lane and tls subscriptions for the currently running simulation.
+        Has to be called again after every ``traci.start``.
+        """
+        lane_variables = (self.VEHICLE_NUMBER, self.HALTING_NUMBER)
+        for lane in self.lanes:
+            self.traci.lane.subscribe(lane, lane_variables)
+        for tls in self.tls_ids:
+            self.traci.trafficlight.subscribe(tls, (self.CURRENT_PHASE,))
+        self.refresh()
+
+    def refresh(self):
+        """Pull the subscription results of the last simulation step into :attr:`lane_values` and :attr:`phases`.
+        Over a TraCI socket the results already arrived with ``simulationStep``, so this does not cost a round trip.
+        """
+        lane_results = self.traci.lane.getAllSubscriptionResults()
+        tls_results = self.traci.trafficlight.getAllSubscriptionResults()
+        lane_values = self.lane_values
+        for idx, lane in enumerate(self.lanes):
+            values = lane_results[lane]
+            lane_values[idx, 0] = values[self.VEHICLE_NUMBER]
+            lane_values[idx, 1] = values[self.HALTING_NUMBER]
+        phases = self.phases
+        for idx, tls in enumerate(self.tls_ids):
+            phases[idx] = tls_results[tls][self.CURRENT_PHASE]
@@ -0,0 +1,321 @@
+"""
+Recording and replay of the TraCI values a SUMO graph RL environment episode consumes
+"""
+
+import os
+import json
+
+import numpy as np
+
+# increase whenever the trace layout changes
+TRACE_VERSION = 1
+
+
+def _row_dtype(n_lanes, n_tls, n_links):
+    # one row per recorded simulation step: time, (vehicle number, halting number) per lane,
+    # current phase and red/yellow/green state (one byte per link, concatenated in tls order) per tls
+    return np.dtype([
+        ("time", "<f8"),
+        ("lane_values", "<u2", (n_lanes, 2)),
+        ("phase", "<i2", (n_tls,)),
+        ("state", "u1", (n_links,)),
+    ])
+
+
+class _RecordingDomain:
+    """Passes all calls through to a domain of the recorded module, adds the variables the trace needs to its subscriptions."""
+
+    def __init__(self, domain, variables):
+        self._domain = domain
+        self._variables = variables
+
+    def subscribe(self, object_id, variables=None, *args, **kwargs):
+        variables = tuple(dict.fromkeys(tuple(variables or ()) + self._variables))
+        return self._domain.subscribe(object_id, variables, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._domain, name)
+
+
+class TraceRecorder:
+    """Proxy of the ``traci`` or ``libsumo`` module that records the subscription results of every simulation step
+    into a trace directory that :class:`TraceReplay` serves back.
+
+    Recorded are the vehicle and halting numbers of all (non-internal) lanes and the current phase and
+    red/yellow/green state of all tls, once after every ``start``/``loadState`` and after every ``simulationStep``.
+    Each ``start`` and ``loadState`` begins a new episode. The rows are appended to ``trace.bin``,
+    ``trace.json`` holds the lane and tls IDs, tls programs, row layout and episode boundaries.
+
+    Set it as the ``traci`` module before the environment is created, e.g. ``gym_env_graph_rl.traci = TraceRecorder(gym_env_graph_rl.traci, path)``.
+
+    :param module: The ``traci`` or ``libsumo`` module to record
+    :type module: module
+    :param out_dir: Directory the trace is written to
+    :type out_dir: str
+    """
+
+    def __init__(self, module, out_dir: str):
+        self.module = module
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        constants = module.constants
+        self.LANE_VARIABLES = (constants.LAST_STEP_VEHICLE_NUMBER, constants.LAST_STEP_VEHICLE_HALTING_NUMBER)
+        self.TLS_VARIABLES = (constants.TL_CURRENT_PHASE, constants.TL_RED_YELLOW_GREEN_STATE)
+        self.lane = _RecordingDomain(module.lane, self.LANE_VARIABLES)
+        self.trafficlight = _RecordingDomain(module.trafficlight, self.TLS_VARIABLES)
+        self.simulation = _RecordingDomain(module.simulation, ())
+        self.simulation.loadState = self._load_state
+        self.meta = None
+        self.rows = 0
+        self._file = None
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def start(self, *args, **kwargs):
+        result = self.module.start(*args, **kwargs)
+        self._begin_episode()
+        return result
+
+    def simulationStep(self, *args, **kwargs):
+        result = self.module.simulationStep(*args, **kwargs)
+        self._write_row()
+        return result
+
+    def close(self, *args, **kwargs):
+        self._flush()
+        return self.module.close(*args, **kwargs)
+
+    def _load_state(self, *args, **kwargs):
+        result = self.module.simulation.loadState(*args, **kwargs)
+        self._begin_episode()
+        return result
+
+    def _begin_episode(self):
+        if self.meta is None:
+            self._create()
+        for lane in self.meta["lanes"]:
+            self.module.lane.subscribe(lane, self.LANE_VARIABLES)
+        for tls in self.meta["tls_ids"]:
+            self.module.trafficlight.subscribe(tls, self.TLS_VARIABLES)
+        self.meta["episodes"].append(self.rows)
+        self._flush()
+        self._write_row()
+
+    def _create(self):
+        lanes = [lane for lane in self.module.lane.getIDList() if not lane.startswith(":")]
+        tls_ids = list(self.module.trafficlight.getIDList())
+        programs = {
+            tls: [(phase.duration, phase.state) for phase in self.module.trafficlight.getAllProgramLogics(tls)[0].phases]
+            for tls in tls_ids
+        }
+        links = [len(self.module.trafficlight.getRedYellowGreenState(tls)) for tls in tls_ids]
+        self.meta = {
+            "version": TRACE_VERSION,
+            "step_length": self.module.simulation.getDeltaT(),
+            "lanes": lanes,
+            "tls_ids": tls_ids,
+            "programs": programs,
+            "state_ptr": np.concatenate(([0], np.cumsum(links))).astype(int).tolist(),
+            "episodes": [],
+            "rows": 0,
+        }
+        self.row = np.zeros(1, dtype=_row_dtype(len(lanes), len(tls_ids), sum(links)))
+        self._file = open(os.path.join(self.out_dir, "trace.bin"), "wb")
+
+    def _write_row(self):
+        if self._file is None:
+            return
+        row = self.row[0]
+        row["time"] = self.module.simulation.getTime()
+        vehicle_number, halting_number = self.LANE_VARIABLES
+        lane_results = self.module.lane.getAllSubscriptionResults()
+        row["lane_values"] = [(lane_results[lane][vehicle_number], lane_results[lane][halting_number]) for lane in self.meta["lanes"]]
+        current_phase, state = self.TLS_VARIABLES
+        tls_results = self.module.trafficlight.getAllSubscriptionResults()
+        row["phase"] = [tls_results[tls][current_phase] for tls in self.meta["tls_ids"]]
+        row["state"] = np.frombuffer("".join(tls_results[tls][state] for tls in self.meta["tls_ids"]).encode(), dtype=np.uint8)
+        self._file.write(self.row.tobytes())
+        self.rows += 1
+
+    def _flush(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        self.meta["rows"] = self.rows
+        with open(os.path.join(self.out_dir, "trace.json"), "w") as f:
+            json.dump(self.meta, f)
+
+
+class _ReplayDomain:
+
+    def __init__(self, replay, name):
+        self._replay = replay
+        self._name = name
+        self.subscriptions = {}
+
+    def __getattr__(self, method):
+        raise AttributeError(f"{self._name}.{method} is not part of the recorded trace")
+
+    def subscribe(self, object_id, variables=None, *args, **kwargs):
+        if object_id not in self._replay.positions[self._name]:
+            raise self._replay.exceptions.TraCIException(f"{self._name} '{object_id}' is not known")
+        self.subscriptions[object_id] = tuple(variables or ())
+        self._replay._cache.pop(self._name, None)
+
+    def getIDList(self):
+        return tuple(self._replay.ids[self._name])
+
+    def getSubscriptionResults(self, object_id):
+        return self.getAllSubscriptionResults().get(object_id, {})
+
+    def getAllSubscriptionResults(self):
+        # built once per replayed row
+        results = self._replay._cache.get(self._name)
+        if results is None:
+            results = self._replay._cache[self._name] = {
+                object_id: self._replay.values(self._name, object_id, variables) for object_id, variables in self.subscriptions.items()
+            }
+        return results
+
+
+class _ReplayLane(_ReplayDomain):
+
+    def getLastStepVehicleNumber(self, lane):
+        return int(self._replay.row["lane_values"][self._replay.positions["lane"][lane], 0])
+
+    def getLastStepHaltingNumber(self, lane):
+        return int(self._replay.row["lane_values"][self._replay.positions["lane"][lane], 1])
+
+
+class _ReplayTrafficLight(_ReplayDomain):
+
+    def getAllProgramLogics(self, tls):
+        trafficlight = self._replay.trafficlight_module
+        phases = [trafficlight.Phase(duration, state) for duration, state in self._replay.meta["programs"][tls]]
+        return (trafficlight.Logic("0", 0, 0, phases),)
+
+    def getPhase(self, tls):
+        return int(self._replay.row["phase"][self._replay.positions["trafficlight"][tls]])
+
+    def getRedYellowGreenState(self, tls):
+        state = self._replay.set_states.get(tls)
+        return state if state is not None else self._replay.recorded_state(tls)
+
+    def setRedYellowGreenState(self, tls, state):
+        # open loop: the state is remembered for getRedYellowGreenState but does not change the replayed traffic
+        self._replay.set_states[tls] = state
+
+
+class _ReplaySimulation(_ReplayDomain):
+
+    def getTime(self):
+        return float(self._replay.row["time"])
+
+    def getDeltaT(self):
+        return self._replay.meta["step_length"]
+
+    def saveState(self, path):
+        # the states are replayed in recorded order, the file only marks the saved state
+        with open(path, "w") as f:
+            json.dump({"episode": self._replay.episode, "row": self._replay.position}, f)
+
+    def loadState(self, path):
+        self._replay._next_episode()
+
+
+class TraceReplay:
+    """Serves a trace written by :class:`TraceRecorder` through the parts of the ``traci`` API the environment uses
+    (subscriptions of lanes and tls, simulation time and steps, tls programs and states).
+
+    The trace is memory-mapped, so replays run at memory speed and processes replaying the same trace share its pages.
+    The replay is open loop: tls states set by the agent are returned by ``getRedYellowGreenState`` but the
+    replayed values are the recorded ones. Every ``start`` and ``loadState`` continues with the next recorded episode,
+    after the last episode with the first one again, so an environment configured like the recorded one
+    sees the episodes in the recorded order.
+
+    Set it as the ``traci`` module before the environment is created, e.g. ``gym_env_graph_rl.traci = TraceReplay(path)``.
+
+    :param trace_dir: Directory of the trace
+    :type trace_dir: str
+    """
+
+    def __init__(self, trace_dir: str):
+        # constants, exceptions and tls program classes of the traci package, usable without SUMO
+        import traci
+        self.constants = traci.constants
+        self.exceptions = traci.exceptions
+        self.trafficlight_module = traci.trafficlight
+
+        with open(os.path.join(trace_dir, "trace.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != TRACE_VERSION:
+            raise ValueError(f"Trace version {self.meta['version']} is not supported, expected {TRACE_VERSION}")
+        dtype = _row_dtype(len(self.meta["lanes"]), len(self.meta["tls_ids"]), self.meta["state_ptr"][-1])
+        self.rows = np.memmap(os.path.join(trace_dir, "trace.bin"), dtype=dtype, mode="r", shape=(self.meta["rows"],))
+        self.episodes = self.meta["episodes"] + [self.meta["rows"]]
+        self.ids = {"lane": self.meta["lanes"], "trafficlight": self.meta["tls_ids"], "simulation": []}
+        self.positions = {name: {object_id: idx for idx, object_id in enumerate(ids)} for name, ids in self.ids.items()}
+
+        self.lane = _ReplayLane(self, "lane")
+        self.trafficlight = _ReplayTrafficLight(self, "trafficlight")
+        self.simulation = _ReplaySimulation(self, "simulation")
+        self.episode = -1
+        self.position = 0
+        self.row = self.rows[0]
+        self.set_states = {}
+        self._cache = {}
+
+    def start(self, *args, **kwargs):
+        self._next_episode()
+
+    def close(self, *args, **kwargs):
+        pass
+
+    def simulationStep(self, step=0.):
+        """Continue with the next recorded row, or the first row at or after time ``step`` if it is given."""
+        end = self.episodes[self.episode + 1]
+        target = self.simulation.getTime() + self.meta["step_length"] if step <= 0 else step
+        position = self.position + 1
+        while position < end - 1 and self.rows[position]["time"] < target - 1e-6:
+            position += 1
+        if position >= end or self.rows[position]["time"] < target - 1e-6:
+            raise self.exceptions.FatalTraCIError(f"Episode {self.episode} of the trace ends at time {self.simulation.getTime()}")
+        self._move(position)
+
+    def _next_episode(self):
+        self.episode = (self.episode + 1) % (len(self.episodes) - 1)
+        for domain in (self.lane, self.trafficlight):
+            domain.subscriptions = {}
+        self.set_states = {}
+        self._move(self.episodes[self.episode])
+
+    def _move(self, position):
+        self.position = position
+        self.row = self.rows[position]
+        self._cache = {}
+
+    def recorded_state(self, tls):
+        idx = self.positions["trafficlight"][tls]
+        begin, end = self.meta["state_ptr"][idx], self.meta["state_ptr"][idx + 1]
+        return self.row["state"][begin:end].tobytes().decode()
+
+    def values(self, domain, object_id, variables):
+        """Return the subscription results of an object in the current row."""
+        key = (domain, object_id, variables)
+        values = self._cache.get(key)
+        if values is None:
+            constants = self.constants
+            idx = self.positions[domain][object_id]
+            if domain == "lane":
+                recorded = {
+                    constants.LAST_STEP_VEHICLE_NUMBER: int(self.row["lane_values"][idx, 0]),
+                    constants.LAST_STEP_VEHICLE_HALTING_NUMBER: int(self.row["lane_values"][idx, 1]),
+                }
+            else:
+                recorded = {
+                    constants.TL_CURRENT_PHASE: int(self.row["phase"][idx]),
+                    constants.TL_RED_YELLOW_GREEN_STATE: self.recorded_state(object_id),
+                }
+            values = self._cache[key] = {variable: recorded[variable] for variable in variables if variable in recorded}
+        return values
@@ -0,0 +1,268 @@
+"""
+Vectorized SUMO graph environment running several simulations in worker processes
+"""
+
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from async_env import StepOverlapStats
+
+# commands sent from the vector env to its workers
+RESET = "reset"
+STEP = "step"
+CLOSE = "close"
+
+
+def _attach(specs, names):
+    """Attach to shared memory blocks and wrap them as NumPy arrays.
+
+    :param specs: Array name to (shape, dtype) for every shared array
+    :type specs: dict
+    :param names: Array name to shared memory block name
+    :type names: dict
+    :return: Two values: the opened shared memory blocks & array name to NumPy array
+    :rtype: list, dict
+    """
+    blocks = []
+    arrays = {}
+    for key, (shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=names[key])
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _worker(index, pipe, env_kwargs, seed):
+    # every worker process owns its own traci/libsumo connection,
+    # so the module-global connection of the environment is safe to use here
+    import gym_env_graph_rl
+
+    # the seed of each SUMO run is drawn from `random`, forked workers would otherwise share it
+    random.seed(seed)
+    env = gym_env_graph_rl.SumoGraphEnviroment(observation_copy=False, **env_kwargs)
+    pipe.send((env.NODE_CNT, env.NODE_FEATURES_CNT, env.ACTION_CNT, env.graph, env.edge_index, env.edge_attr))
+
+    specs, names = pipe.recv()
+    blocks, shared = _attach(specs, names)
+    try:
+        while True:
+            command = pipe.recv()
+            if command == STEP:
+                start = time.perf_counter()
+                observation, reward, terminated, truncated, _ = env.step(shared["actions"][index])
+                if terminated or truncated:
+                    observation, _ = env.reset()
+                shared["rewards"][index] = reward
+                shared["terminated"][index] = terminated
+                shared["truncated"][index] = truncated
+                shared["step_time"][index] = time.perf_counter() - start
+            elif command == RESET:
+                observation, _ = env.reset()
+            elif command == CLOSE:
+                break
+            shared["nodes"][index] = observation["nodes"]
+            pipe.send(True)
+    finally:
+        del shared
+        for block in blocks:
+            block.close()
+        gym_env_graph_rl.traci.close()
+        pipe.close()
+
+
+class SumoGraphVectorEnv:
+    """Runs ``num_envs`` independent ``SumoGraphEnviroment`` instances, each in its own
+    worker process with its own SUMO instance, and steps them in lockstep.
+
+    Actions, observations, rewards and termination flags are exchanged through
+    shared memory, only a short command is sent over the pipe of each worker.
+    Environments that terminate are reset automatically, the observation returned
+    for them is the first observation of the next episode.
+    As the graph (see ``adjacency_format`` of ``SumoGraphEnviroment``) is the same for all instances it is returned once by reference.
+    With ``graph_batch`` the observations are returned as one disjoint union graph instead,
+    the format used by GNN libraries like PyTorch Geometric for mini-batches:
+    ``x`` (num_envs * NODE_CNT, NODE_FEATURES_CNT), ``edge_index`` (2, num_envs * edges) with node offsets,
+    ``edge_attr`` (num_envs * edges, 2) and ``batch`` (num_envs * NODE_CNT,) holding the environment of each node.
+
+    ``step_async``/``step_wait`` (or the awaitable ``astep``) let the caller work on
+    something else, e.g. inference for other environments, while the workers simulate.
+    :attr:`stats` records how much of the simulation time overlapped with the caller.
+
+    :param num_envs: Number of parallel simulations
+    :type num_envs: int
+    :param seed: Base seed, worker ``i`` seeds its SUMO runs with ``seed + i``
+    :type seed: int
+    :param observation_copy: If False, observations and rewards are views into shared memory that are overwritten by the next step
+    :type observation_copy: bool
+    :param context: Multiprocessing start method, e.g. ``"fork"`` or ``"spawn"``, defaults to the platform default
+    :type context: str
+    :param graph_batch: Whether to return observations as one batched sparse graph
+    :type graph_batch: bool
+    :param env_kwargs: Keyword arguments passed on to every ``SumoGraphEnviroment``
+    """
+
+    def __init__(self, num_envs: int, seed: int = None, observation_copy: bool = True, context: str = None,
+                 graph_batch: bool = False, **env_kwargs):
+        self.num_envs = num_envs
+        self.observation_copy = observation_copy
+        self.graph_batch = graph_batch
+        if seed is None:
+            seed = random.randint(1, 999999)
+
+        ctx = mp.get_context(context)
+        # workers have to share the resource tracker of this process, otherwise each
+        # of them would unlink the shared memory blocks it attached to when it exits
+        resource_tracker.ensure_running()
+        self.pipes = []
+        self.processes = []
+        for index in range(num_envs):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(index, child_pipe, env_kwargs, seed + index), daemon=True)
+            process.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(process)
+
+        # all instances share the same network, so the first one defines the shapes
+        self.NODE_CNT, self.NODE_FEATURES_CNT, self.ACTION_CNT, self.graph, edge_index, edge_attr = [pipe.recv() for pipe in self.pipes][0]
+        # the batched graph only depends on the network, so it is built once as well
+        offsets = np.repeat(np.arange(num_envs) * self.NODE_CNT, edge_index.shape[1])
+        self.batched_graph = {
+            "edge_index": np.tile(edge_index, num_envs) + offsets,
+            "edge_attr": np.tile(edge_attr, (num_envs, 1)),
+            "batch": np.repeat(np.arange(num_envs), self.NODE_CNT),
+        }
+        for array in (*self.graph.values(), *self.batched_graph.values()):
+            array.setflags(write=False)
+        specs = {
+            "nodes": ((num_envs, self.NODE_CNT, self.NODE_FEATURES_CNT), np.float64),
+            "rewards": ((num_envs, self.NODE_CNT), np.float64),
+            "actions": ((num_envs, self.NODE_CNT), np.int64),
+            "terminated": ((num_envs,), np.bool_),
+            "truncated": ((num_envs,), np.bool_),
+            "step_time": ((num_envs,), np.float64),
+        }
+        self.blocks = {
+            key: shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            for key, (shape, dtype) in specs.items()
+        }
+        self.shared = {
+            key: np.ndarray(shape, dtype=dtype, buffer=self.blocks[key].buf)
+            for key, (shape, dtype) in specs.items()
+        }
+        names = {key: block.name for key, block in self.blocks.items()}
+        for pipe in self.pipes:
+            pipe.send((specs, names))
+        self.stats = StepOverlapStats()
+        self.waiting = False
+        self.closed = False
+
+    def _send(self, command):
+        for pipe in self.pipes:
+            pipe.send(command)
+
+    def _receive(self):
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def _broadcast(self, command):
+        self._send(command)
+        self._receive()
+
+    def _output(self, array):
+        return array.copy() if self.observation_copy else array
+
+    def _get_obs(self):
+        if self.graph_batch:
+            # flattening the contiguous node array is a view
+            return {
+                "x": self._output(self.shared["nodes"].reshape(-1, self.NODE_FEATURES_CNT)),
+                **self.batched_graph
+            }
+        return {
+            "nodes": self._output(self.shared["nodes"]),
+            **self.graph
+        }
+
+    def reset(self):
+        if self.waiting:
+            self.step_wait()
+        self._broadcast(RESET)
+        return self._get_obs(), None
+
+    def step_async(self, actions: np.ndarray):
+        """Hand one action vector per environment to the workers and return while they simulate.
+
+        :param actions: Actions of shape (num_envs, NODE_CNT)
+        :type actions: np.ndarray
+        """
+        if self.waiting:
+            raise RuntimeError("step_async was called while the previous step is still pending")
+        self.shared["actions"][:] = actions
+        self._send(STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        """Block until all workers finished the step started by :meth:`step_async`.
+
+        :return: Stacked observations, rewards of shape (num_envs, NODE_CNT), terminated and truncated flags of shape (num_envs,) & info
+        :rtype: dict, np.ndarray, np.ndarray, np.ndarray, NoneType
+        """
+        if not self.waiting:
+            raise RuntimeError("step_wait was called without a pending step_async")
+        start = time.perf_counter()
+        self._receive()
+        self.waiting = False
+        self.stats.add(float(self.shared["step_time"].max()), time.perf_counter() - start)
+        return self._step_result()
+
+    async def astep(self, actions: np.ndarray):
+        """Awaitable version of :meth:`step_async` followed by :meth:`step_wait`.
+        The event loop keeps running other coroutines meanwhile, the recorded wait time is the time until the step finished.
+        """
+        self.step_async(actions)
+        return await asyncio.get_running_loop().run_in_executor(None, self.step_wait)
+
+    def step(self, actions: np.ndarray):
+        """Apply one action vector per environment and advance all simulations.
+
+        :param actions: Actions of shape (num_envs, NODE_CNT)
+        :type actions: np.ndarray
+        :return: Stacked observations, rewards of shape (num_envs, NODE_CNT), terminated and truncated flags of shape (num_envs,) & info
+        :rtype: dict, np.ndarray, np.ndarray, np.ndarray, NoneType
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def _step_result(self):
+        return (
+            self._get_obs(),
+            self._output(self.shared["rewards"]),
+            self.shared["terminated"].copy(),
+            self.shared["truncated"].copy(),
+            None
+        )
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.waiting:
+            self._receive()
+        for pipe in self.pipes:
+            pipe.send(CLOSE)
+        for process in self.processes:
+            process.join()
+        del self.shared
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+
+    def __del__(self):
+        if not getattr(self, "closed", True):
+            self.close()
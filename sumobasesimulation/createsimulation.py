@@ -1,11 +1,54 @@
 import os,sys
-import numpy as np
-import analysis
-from matplotlib import pyplot as plt
-import xml.etree.ElementTree as ET
 import argparse
-import traci
-import traci.constants as tc
+import hashlib
+import itertools
+import multiprocessing as mp
+import shutil
+import subprocess
+import time
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from artifact_cache import ArtifactCache
+
+# config the generated scenarios are derived from
+TEMPLATE_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xml", "scenario1", "grid.sumocfg")
+# directory inside each scenario holding the content hash each stage was last built from
+STAMP_DIR = ".stages"
+
+
+def file_digest(path):
+    """
+    :param path: Path of a file
+    :return: SHA-256 hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    """
+    :param tool: SUMO binary (e.g. netgenerate) or path of a SUMO python tool
+    :return: Version line of a binary, content digest of a python tool
+    """
+    if tool.endswith(".py"):
+        return file_digest(tool)
+    result = subprocess.run([tool, "--version"], capture_output=True, text=True)
+    return result.stdout.splitlines()[0] if result.stdout else tool
+
+
+def variant_name(variant):
+    """
+    :param variant: Scenario parameters as in parse_variants
+    :return: Name of the output directory of the variant
+    """
+    seed = "" if variant.get("seed") is None else f"_seed{variant['seed']}"
+    return f"grid{variant['grids']}_lanes{variant['lanes']}_len{variant['length']}_veh{variant['vehicles']}{seed}"
 
 
 class CreateSimulation:
@@ -14,60 +57,243 @@ class CreateSimulation:
 
         self.sumo_config_path = args.sumo_config_path
         self.sumo_env = args.sumo_cmd_env
-        self.sumo_home_path = ""
-        self.network_path = "../xml/scenario1/grid.net.xml"
-        self.route_path = "../xml/scenario1/route.xml"
-        self.reroute_path = "../xml/scenario1/rerouter.add.xml"
-        self.config_path = "../xml/scenario1/grid.sumocfg"
-        self.grid_route = "../xml/scenario1/grid.rou.xml"
+        self.sumo_home_path = os.path.join(os.environ['SUMO_HOME'], 'tools') if 'SUMO_HOME' in os.environ else ""
+        # every scenario is generated into its own directory, file names inside are fixed
+        self.out_dir = getattr(args, "out_dir", None) or "../xml/scenario1"
+        self.seed = getattr(args, "seed", None)
+        # generated networks, routes and rerouters are shared between scenarios through the cache, if given
+        self.artifact_cache = getattr(args, "artifact_cache", None)
+        self.network_path = os.path.join(self.out_dir, "grid.net.xml")
+        self.route_path = os.path.join(self.out_dir, "route.xml")
+        self.reroute_path = os.path.join(self.out_dir, "rerouter.add.xml")
+        self.config_path = os.path.join(self.out_dir, "grid.sumocfg")
+        self.grid_route = os.path.join(self.out_dir, "grid.rou.xml")
+        # names of the stages that were (re)built, stages with unchanged inputs are skipped
+        self.built_stages = []
 
+    def stage_key(self, command, inputs):
+        """
+        :param command: Command of the stage, file arguments relative to the output directory
+        :param inputs: Paths of the files the stage reads
+        :return: Hash of the command, the versions of the tools it runs and the content of its inputs,
+        independent of the output directory and the install location of the tools
+        """
+        digest = hashlib.sha256()
+        tools = [argument for argument in command[:2] if os.path.isfile(argument) or shutil.which(argument)]
+        digest.update("\0".join(os.path.basename(argument) if argument in tools else argument for argument in command).encode())
+        for tool in tools:
+            digest.update(tool_version(tool).encode())
+        for path in inputs:
+            digest.update(file_digest(path).encode())
+        return digest.hexdigest()
+
+    def run_stage(self, name, command, inputs, outputs):
+        """
+        Runs a generator command in the output directory, unless all its outputs exist and were built from the same
+        command, tool versions and input contents. With an artifact cache, outputs of the same key that were generated
+        for another scenario before are restored from the cache instead of running the command.
+        :param name: Name of the stage
+        :param command: Command as list, file arguments relative to the output directory
+        :param inputs: Paths of the files the stage reads
+        :param outputs: Paths of the files the stage writes
+        :return: Whether the stage ran
+        """
+        key = self.stage_key(command, inputs)
+        stamp_path = os.path.join(self.out_dir, STAMP_DIR, name)
+        if all(os.path.exists(path) for path in outputs) and os.path.exists(stamp_path):
+            with open(stamp_path) as f:
+                if f.read() == key:
+                    return False
+        if self.artifact_cache is not None and self.artifact_cache.get(key, outputs):
+            self.built_stages.append(name + " (cached)")
+        else:
+            # outputs restored from the cache are hard links, the tools must write new files instead of overwriting them
+            for path in outputs:
+                if os.path.lexists(path):
+                    os.remove(path)
+            subprocess.run(command, cwd=self.out_dir, check=True, stdout=subprocess.DEVNULL)
+            if self.artifact_cache is not None:
+                self.artifact_cache.put(key, outputs)
+            self.built_stages.append(name)
+        os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+        with open(stamp_path, "w") as f:
+            f.write(key)
+        return True
 
     def generate_network(self,grids,lanes,length):
 
-        os.system("netgenerate --grid --grid.number="+str(grids)+" -L="+str(lanes)+" --default-junction-type \"traffic_light\" --grid.length="+str(length)+" --output-file="+self.network_path)
+        self.run_stage(
+            "network",
+            ["netgenerate", "--grid", "--grid.number=" + str(grids), "-L=" + str(lanes), "--default-junction-type", "traffic_light",
+             "--grid.length=" + str(length), "--output-file=" + os.path.basename(self.network_path)],
+            [],
+            [self.network_path],
+        )
 
     def generate_vehicles(self,vehicles):
-        os.system(self.sumo_home_path + "/randomTrips.py -n "+self.network_path+" -o "+self.route_path+" --begin 0 --end 1 --period 1 --flows " + str(vehicles))
-        os.system("jtrrouter --route-files="+self.route_path+" --net-file="+self.network_path+" --output-file="+self.grid_route+" --begin 0 --end 10000 --accept-all-destinations")
-        os.system(self.sumo_home_path + "/generateContinuousRerouters.py -n "+self.network_path+" --end 10000 -o "+self.reroute_path)
-        tree = ET.parse(self.config_path)
+        net = os.path.basename(self.network_path)
+        seed = [] if self.seed is None else ["--seed", str(self.seed)]
+        self.run_stage(
+            "trips",
+            [sys.executable, os.path.join(self.sumo_home_path, "randomTrips.py"), "-n", net, "-o", os.path.basename(self.route_path),
+             "--begin", "0", "--end", "1", "--period", "1", "--flows", str(vehicles)] + seed,
+            [self.network_path],
+            [self.route_path],
+        )
+        self.run_stage(
+            "routes",
+            ["jtrrouter", "--route-files=" + os.path.basename(self.route_path), "--net-file=" + net,
+             "--output-file=" + os.path.basename(self.grid_route), "--begin", "0", "--end", "10000", "--accept-all-destinations"] + seed,
+            [self.network_path, self.route_path],
+            [self.grid_route],
+        )
+        self.run_stage(
+            "rerouters",
+            [sys.executable, os.path.join(self.sumo_home_path, "generateContinuousRerouters.py"), "-n", net, "--end", "10000",
+             "-o", os.path.basename(self.reroute_path)],
+            [self.network_path],
+            [self.reroute_path],
+        )
+        self.write_config(vehicles)
+
+    def write_config(self, vehicles):
+        """
+        Writes the SUMO config of the scenario, derived from the existing config of the output directory or the template.
+        Additional files of the template besides the rerouters are copied into the output directory.
+        :param vehicles: number of vehicles, part of the name of the fcd output
+        """
+        source = self.config_path if os.path.exists(self.config_path) else TEMPLATE_CONFIG_PATH
+        tree = ET.parse(source)
         root = tree.getroot()
         for child in root:
             if (child.tag == 'output'):
                 for child2 in child:
                     child2.attrib['value'] = 'grid.output' + str(vehicles) + '.xml'
+        input_values = {
+            "net-file": os.path.basename(self.network_path),
+            "route-files": os.path.basename(self.grid_route),
+        }
+        for element in root.iter():
+            if element.tag in input_values:
+                element.attrib['value'] = input_values[element.tag]
+            elif element.tag == "additional-files":
+                additional_files = [os.path.basename(self.reroute_path)]
+                for additional in element.attrib['value'].split(","):
+                    additional = additional.strip()
+                    if additional and additional != additional_files[0]:
+                        target = os.path.join(self.out_dir, additional)
+                        if not os.path.exists(target):
+                            shutil.copy(os.path.join(os.path.dirname(source), additional), target)
+                        additional_files.append(additional)
+                element.attrib['value'] = ", ".join(additional_files)
+        if os.path.exists(self.config_path):
+            with open(self.config_path, 'rb') as f:
+                previous = f.read()
+            if previous == ET.tostring(root):
+                return
         with open(self.config_path, 'wb') as f:
             tree.write(f)
-        os.system("sumo-gui -c "+self.config_path+" --device.fcd.period 100")
+        self.built_stages.append("config")
 
-    def build_network(self):
+    def run_simulation(self):
+        """
+        Runs the scenario with the configured SUMO binary, e.g. sumo for a headless run that writes the fcd output.
+        """
+        subprocess.run([self.sumo_env, "-c", os.path.basename(self.config_path), "--device.fcd.period", "100"],
+                       cwd=self.out_dir, check=True, stdout=subprocess.DEVNULL)
 
-        if 'SUMO_HOME' in os.environ:
-            self.sumo_home_path = os.path.join(os.environ['SUMO_HOME'], 'tools')
-            print("SUMO_PATH : ", self.sumo_home_path)
-            sys.path.append(self.sumo_home_path)
-        else:
+    def build_network(self, grids=5, lanes=2, length=500, vehicles=500, simulate=False):
+
+        if not self.sumo_home_path:
             sys.exit("please declare environment variable 'SUMO_HOME'")
+        os.makedirs(self.out_dir, exist_ok=True)
 
+        # stages whose command and input contents did not change since they were last built are skipped
+        self.generate_network(grids,lanes,length)
+        self.generate_vehicles(vehicles)
 
-        if not os.path.exists(self.network_path):
-            self.generate_network(5,2,500)
-        else:
-            self.generate_network(5,2,500)
+        if simulate:
+            self.run_simulation()
 
-        self.generate_vehicles(500)
 
+def parse_variants(args):
+    """
+    :param args: parsed arguments with comma separated grids, lanes, lengths, vehicles and seeds
+    :return: Scenario parameters of every combination
+    """
+    values = [
+        [int(value) for value in getattr(args, name).split(",")] if getattr(args, name) else [None]
+        for name in ("grids", "lanes", "lengths", "vehicles", "seeds")
+    ]
+    return [
+        {"grids": grids, "lanes": lanes, "length": length, "vehicles": vehicles, "seed": seed}
+        for grids, lanes, length, vehicles, seed in itertools.product(*values)
+    ]
 
 
+def build_variant(variant, out_root, sumo_cmd_env="sumo", simulate=False, cache_options=None):
+    """
+    Builds a scenario variant into its own directory below out_root, can run in a worker process.
+    :param variant: Scenario parameters as returned by parse_variants
+    :param cache_options: Keyword arguments of the ArtifactCache the workers share, None to not use a cache
+    :return: Name of the variant, built stages and duration in seconds
+    """
+    start = time.perf_counter()
+    artifact_cache = ArtifactCache(**cache_options) if cache_options is not None else None
+    args = argparse.Namespace(sumo_config_path=None, sumo_cmd_env=sumo_cmd_env, artifact_cache=artifact_cache,
+                              out_dir=os.path.join(out_root, variant_name(variant)), seed=variant["seed"])
+    simulator = CreateSimulation(args)
+    simulator.build_network(variant["grids"], variant["lanes"], variant["length"], variant["vehicles"], simulate)
+    return variant_name(variant), simulator.built_stages, time.perf_counter() - start
+
+
+def build_variants(variants, out_root, processes=1, sumo_cmd_env="sumo", simulate=False, cache_options=None):
+    """
+    Builds scenario variants concurrently, each SUMO tool runs in its own process anyway,
+    so the pool mainly overlaps the tool runs of different variants.
+    :param variants: Scenario parameters as returned by parse_variants
+    :param out_root: Directory the variant directories are created in
+    :param processes: Number of worker processes, 1 builds everything in the calling process
+    :param cache_options: Keyword arguments of the ArtifactCache the workers share, None to not use a cache
+    :return: List of the results of build_variant in variant order
+    """
+    args = [(variant, out_root, sumo_cmd_env, simulate, cache_options) for variant in variants]
+    if processes > 1:
+        with mp.Pool(processes) as pool:
+            return list(pool.starmap(build_variant, args))
+    return [build_variant(*arg) for arg in args]
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description="For parsing values and IDs for network/edges/lanes/vehicles/trafficlights")
+        description="Generate SUMO grid scenario variants, every combination of the given values is built into its own directory")
 
     parser.add_argument("--sumo_config_path", help="Path for SUMO config file", default="../xml/scenario1")
-    parser.add_argument("--sumo_cmd_env", help="Sumo execution environment", default="sumo-gui")
+    parser.add_argument("--sumo_cmd_env", help="Sumo execution environment used with --simulate", default="sumo")
+    parser.add_argument("--out_dir", help="Directory the scenario variants are generated in", default="../xml/scenarios")
+    parser.add_argument("--grids", help="Comma separated numbers of junctions per grid row", default="5")
+    parser.add_argument("--lanes", help="Comma separated numbers of lanes per edge", default="2")
+    parser.add_argument("--lengths", help="Comma separated edge lengths", default="500")
+    parser.add_argument("--vehicles", help="Comma separated numbers of vehicles", default="500")
+    parser.add_argument("--seeds", help="Comma separated random seeds, the tool defaults if not given", default=None)
+    parser.add_argument("--processes", type=int, help="Number of worker processes", default=os.cpu_count())
+    parser.add_argument("--simulate", action="store_true", help="Run every scenario headless to write its fcd output")
+    parser.add_argument("--cache_dir", help="Directory of the artifact cache, defaults to ~/.cache/traffic-simulation/artifacts", default=None)
+    parser.add_argument("--cache_max_mb", type=float, help="Size the artifact cache is reduced to by evicting least recently used entries", default=None)
+    parser.add_argument("--cache_read_only", action="store_true", help="Only restore artifacts from the cache, e.g. of a shared cache")
+    parser.add_argument("--no_cache", action="store_true", help="Do not use the artifact cache")
 
     args = parser.parse_args()
+    if 'SUMO_HOME' not in os.environ:
+        sys.exit("please declare environment variable 'SUMO_HOME'")
 
-    simulator = CreateSimulation(args)
-    simulator.build_network()
\ No newline at end of file
+    variants = parse_variants(args)
+    cache_options = None if args.no_cache else {
+        "cache_dir": args.cache_dir,
+        "max_bytes": int(args.cache_max_mb * 1024 ** 2) if args.cache_max_mb is not None else None,
+        "read_only": args.cache_read_only,
+    }
+    start = time.perf_counter()
+    for name, stages, duration in build_variants(variants, args.out_dir, args.processes, args.sumo_cmd_env, args.simulate, cache_options):
+        print(f"{name}: {', '.join(stages) if stages else 'up to date'} ({duration:.1f}s)")
+    print(f"{len(variants)} scenarios in {time.perf_counter() - start:.1f}s")
@@ -18,9 +18,12 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import argparse
+import multiprocessing as mp
 import subprocess
 import sys
 import random
+import time
 from xml.sax.handler import ContentHandler
 
 if 'SUMO_HOME' in os.environ:
@@ -34,6 +37,14 @@ from sumolib.visualization import helpers
 
 import matplotlib.pyplot as plt
 import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from meandata_reader import load_meandata
+from net_cache import load_net
 
 import pdb
 
@@ -59,6 +70,220 @@ class WeightsReader(ContentHandler):
                 self._edge2value[self._time][id] = float(attrs[self._value])
 
 
+def normalise(values, minValue=None, maxValue=None, log=False):
+    """
+    Array version of the normalisation of main: values are clipped to the given bounds and every interval is scaled
+    to [0, 1] by the bounds or, if not given, by its own minimum and maximum.
+    :param values: Array (intervals x edges), NaN for edges without value
+    :param log: Whether to scale logarithmically like helpers.logNormalise
+    :return: Normalised array, NaN stays NaN
+    """
+    values = np.array(values, dtype=np.float64)
+    if minValue is not None:
+        values = np.where(values < minValue, minValue, values)
+    if maxValue is not None:
+        values = np.where(values > maxValue, maxValue, values)
+    # fmin/fmax ignore NaN, rows without any value stay NaN
+    low = np.fmin.reduce(values, axis=1, keepdims=True, initial=np.inf, where=~np.isnan(values))
+    high = np.fmax.reduce(values, axis=1, keepdims=True, initial=-np.inf, where=~np.isnan(values))
+    if log:
+        scale = np.log(high if maxValue is None else np.full_like(high, maxValue))
+        scale[~np.isfinite(scale) | (scale == 0)] = 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(values != 0, np.log(values) / scale, values)
+        low = np.fmin.reduce(values, axis=1, keepdims=True, initial=np.inf, where=~np.isnan(values))
+        high = np.fmax.reduce(values, axis=1, keepdims=True, initial=-np.inf, where=~np.isnan(values))
+    else:
+        if minValue is not None:
+            low = np.full_like(low, minValue)
+        if maxValue is not None:
+            high = np.full_like(high, maxValue)
+    valueRange = high - low
+    valueRange[~np.isfinite(valueRange) | (valueRange == 0)] = 1
+    return (values - low) / valueRange
+
+
+def output_names(output, times):
+    """
+    :param output: Comma separated file names, '%s' is replaced by the interval begin
+    :return: List of the file names of every interval
+    """
+    if len(times) > 1 and output.find('%s') < 0:
+        print('Warning: multiple time intervals detected, but ' +
+              'the output filename(s) do not contain a \'%s\' placeholder. ' +
+              'Continuing by using a default placeholder.')
+        output = ','.join(os.path.splitext(name)[0] + '-%s' + os.path.splitext(name)[1] for name in output.split(','))
+    return [output.replace("%s", str(t)) for t in times]
+
+
+# figure of the renderer process, set up once by init_renderer and updated for every frame
+_renderer = {}
+
+
+def init_renderer(shapes, colors, widths, names, options):
+    """
+    Sets up the figure of a renderer process: the edge geometry becomes one LineCollection whose colors and widths
+    are replaced for every frame.
+    :param shapes: Edge shapes as returned by NetTopology.get_edge_shapes
+    :param colors: Normalised color values (intervals x edges), NaN for the default color
+    :param widths: Normalised width values (intervals x edges), NaN for the default width
+    :param names: Output file names of every interval, None to render raw frames for a video
+    """
+    colormap = matplotlib.colormaps[options.colormap]
+    figure = Figure(figsize=options.size)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    ax.set_aspect("equal", None, 'C')
+    collection = LineCollection(shapes, linestyles=options.linestyle)
+    ax.add_collection(collection)
+    ax.set_xmargin(0.1)
+    ax.set_ymargin(0.1)
+    ax.autoscale_view(True, True, True)
+    figure.colorbar(matplotlib.cm.ScalarMappable(cmap=colormap, norm=matplotlib.colors.Normalize(vmin=0, vmax=1)), ax=ax)
+    title = ax.set_title("")
+    _renderer.update(canvas=canvas, collection=collection, title=title, colormap=colormap, colors=colors, widths=widths,
+                     names=names, options=options, defaultColor=matplotlib.colors.to_rgba(options.defaultColor))
+
+
+def render_frame(idx, t):
+    """
+    Renders the interval idx, beginning at t, with the figure of init_renderer.
+    :return: Width, height and RGBA bytes of the frame if rendering for a video, else None
+    """
+    options = _renderer["options"]
+    colors = _renderer["colors"][idx]
+    rgba = _renderer["colormap"](np.nan_to_num(colors))
+    rgba[np.isnan(colors)] = _renderer["defaultColor"]
+    widths = options.minWidth + _renderer["widths"][idx] * (options.maxWidth - options.minWidth)
+    widths[np.isnan(widths)] = options.defaultWidth
+    _renderer["collection"].set_color(rgba)
+    _renderer["collection"].set_linewidth(widths)
+    m, s = divmod(int(t), 60)
+    h, m = divmod(m, 60)
+    _renderer["title"].set_text("%02d:%02d:%02d" % (h, m, s))
+    canvas = _renderer["canvas"]
+    if _renderer["names"] is None:
+        canvas.draw()
+        width, height = canvas.get_width_height()
+        return width, height, bytes(canvas.buffer_rgba())
+    for name in _renderer["names"][idx].split(","):
+        canvas.figure.savefig(name, dpi=options.dpi)
+    return None
+
+
+def render_frame_task(task):
+    return render_frame(*task)
+
+
+def render_intervals(shapes, times, colors, widths, options):
+    """
+    Renders one frame per interval in options.processes worker processes, either into the output files or piped
+    into ffmpeg in interval order to encode options.video.
+    :return: Number of rendered frames
+    """
+    names = output_names(options.output, times) if options.output else None
+    initargs = (shapes, colors, widths, None if options.video else names, options)
+    tasks = list(enumerate(times.tolist()))
+    encoder = None
+    pool = None
+    if options.processes == 1:
+        init_renderer(*initargs)
+        frames = (render_frame(idx, t) for idx, t in tasks)
+    else:
+        pool = mp.Pool(options.processes, initializer=init_renderer, initargs=initargs)
+        # imap keeps the interval order the encoder needs while frames are still rendered
+        frames = pool.imap(render_frame_task, tasks, chunksize=4)
+    try:
+        for frame in frames:
+            if frame is None:
+                continue
+            width, height, data = frame
+            if encoder is None:
+                encoder = subprocess.Popen(
+                    ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}",
+                     "-r", str(options.fps), "-i", "-", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+                     options.video], stdin=subprocess.PIPE)
+            encoder.stdin.write(data)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if encoder is not None:
+            encoder.stdin.close()
+            encoder.wait()
+    return len(tasks)
+
+
+def render_main(args=None):
+    """Vectorized rendering mode: plots every interval of a dump with array operations in a process pool"""
+    parser = argparse.ArgumentParser(description="Plot edge measures of every interval of a dump, see main for the options")
+    parser.add_argument("--fast", action="store_true", help="Use the vectorized renderer (this mode)")
+    parser.add_argument("-n", "--net", dest="net", required=True, help="Defines the network to read")
+    parser.add_argument("-i", "--dump-inputs", dest="dumps", required=True,
+                        help="Dump files for colors and widths, comma separated, the width dump may be omitted")
+    parser.add_argument("-m", "--measures", dest="measures", default="speed,speed", help="Define which measure to plot")
+    parser.add_argument("--begin", dest="begin", type=float, default=None, help="Only plot intervals beginning at or after this time")
+    parser.add_argument("--end", dest="end", type=float, default=None, help="Only plot intervals beginning before this time")
+    parser.add_argument("--min-width", dest="minWidth", type=float, default=.5, help="Defines the minimum edge width")
+    parser.add_argument("--max-width", dest="maxWidth", type=float, default=3, help="Defines the maximum edge width")
+    parser.add_argument("--log-colors", dest="logColors", action="store_true", help="If set, colors are log-scaled")
+    parser.add_argument("--log-widths", dest="logWidths", action="store_true", help="If set, widths are log-scaled")
+    parser.add_argument("--min-color-value", dest="colorMin", type=float, default=None, help="If set, defines the minimum edge color value")
+    parser.add_argument("--max-color-value", dest="colorMax", type=float, default=None, help="If set, defines the maximum edge color value")
+    parser.add_argument("--min-width-value", dest="widthMin", type=float, default=None, help="If set, defines the minimum edge width value")
+    parser.add_argument("--max-width-value", dest="widthMax", type=float, default=None, help="If set, defines the maximum edge width value")
+    parser.add_argument("-w", "--default-width", dest="defaultWidth", type=float, default=.1, help="Width of edges without value")
+    parser.add_argument("--default-color", dest="defaultColor", default="k", help="Color of edges without value")
+    parser.add_argument("--colormap", dest="colormap", default="nipy_spectral", help="Matplotlib colormap of the values")
+    parser.add_argument("--linestyle", dest="linestyle", default="-", help="Line style of the edges")
+    parser.add_argument("-s", "--size", dest="size", type=lambda size: tuple(float(x) for x in size.split(",")), default=None,
+                        help="Figure size in inches as <WIDTH>,<HEIGHT>")
+    parser.add_argument("--dpi", dest="dpi", type=float, default=None, help="Resolution of the frames")
+    parser.add_argument("-o", "--output", dest="output", default=None,
+                        help="Comma separated list of filename(s) every frame is written to, '%%s' is replaced by the interval begin")
+    parser.add_argument("--video", dest="video", default=None, help="Encode the frames with ffmpeg into this video file instead")
+    parser.add_argument("--fps", dest="fps", type=float, default=10, help="Frames per second of the video")
+    parser.add_argument("--processes", dest="processes", type=int, default=os.cpu_count(), help="Number of renderer processes")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", help="If set, the script says what it's doing")
+    options = parser.parse_args(args)
+    if not options.output and not options.video:
+        print("Error: an output or a video must be given.")
+        return 1
+
+    start = time.perf_counter()
+    net = load_net(options.net)
+    shapes = net.get_edge_shapes()
+    dumps = options.dumps.split(",") + [""]
+    measures = options.measures.split(",") + [options.measures.split(",")[0]]
+    colorDump, widthDump = dumps[0], dumps[1]
+    colorMeasure, widthMeasure = measures[0], measures[1]
+    # the dumps are parsed once into the meandata cache, later plots of the same dumps only load the arrays
+    selection = dict(begin=options.begin, end=options.end, element_ids=net.edge_ids)
+    if widthDump == colorDump:
+        meandata = load_meandata(colorDump, attributes=[colorMeasure, widthMeasure], **selection)
+        colors, widths = meandata["data"][:, :, 0], meandata["data"][:, :, 1]
+    else:
+        meandata = load_meandata(colorDump, attributes=[colorMeasure], **selection)
+        colors = meandata["data"][:, :, 0]
+        widths = np.full_like(colors, np.nan)
+        if widthDump:
+            widthData = load_meandata(widthDump, attributes=[widthMeasure], **selection)
+            rows = {t: idx for idx, t in enumerate(widthData["begin"].tolist())}
+            for idx, t in enumerate(meandata["begin"].tolist()):
+                if t in rows:
+                    widths[idx] = widthData["data"][rows[t], :, 0]
+    times = meandata["begin"]
+    colors = normalise(colors, options.colorMin, options.colorMax, options.logColors)
+    widths = normalise(np.abs(widths), options.widthMin, options.widthMax, options.logWidths)
+    if options.verbose:
+        print("Read %s intervals of %s edges in %.1fs" % (len(times), len(shapes), time.perf_counter() - start))
+
+    frames = render_intervals(shapes, times, colors, widths, options)
+    if options.verbose:
+        print("Rendered %s frames in %.1fs" % (frames, time.perf_counter() - start))
+    return 0
+
+
 def main(args=None):
     """The main function; parses options and plots"""
     # ---------- build and read options ----------
@@ -107,7 +332,6 @@ def main(args=None):
 
     # parse
     options, remaining_args = optParser.parse_args(args=args)
-    print(options.output)
 
     if options.net == None:
         print("Error: a network to load must be given.")
@@ -146,7 +370,6 @@ def main(args=None):
     if options.output:
         options.nolegend = True
         optOutputNames = options.output
-        print('hier')
         # If we have multiple intervals to be plotted, make sure we have
         # proper output filenames (with a %s as a placeholder in it)
         if len(times) > 1 and optOutputNames.find('%s') < 0:
@@ -161,7 +384,6 @@ def main(args=None):
                 filename, extension = os.path.splitext(filenames[i])
                 filenames[i] = filename + '-%s' + extension
             optOutputNames = ','.join(filenames)
-    print(times)
     # Now go through each time interval and create the figures
     for t in times:
         if options.verbose:
@@ -170,7 +392,6 @@ def main(args=None):
         maxColorValue = None
         minColorValue = None
         for e in net._id2edge:
-            print(hc._edge2value[t])
             if hc and t in hc._edge2value and e in hc._edge2value[t]:
                 if options.colorMax != None and hc._edge2value[t][e] > options.colorMax:
                     hc._edge2value[t][e] = options.colorMax
@@ -181,8 +402,6 @@ def main(args=None):
                 if minColorValue == None or minColorValue > hc._edge2value[t][e]:
                     minColorValue = hc._edge2value[t][e]
                 colors[e] = hc._edge2value[t][e]
-                print('collor')
-                print(hc._edge2value[t][e])
         if options.colorMax != None:
             maxColorValue = options.colorMax
         if options.colorMin != None:
@@ -256,4 +475,6 @@ def main(args=None):
     return 0
 
 if __name__ == "__main__":
+    if "--fast" in sys.argv:
+        sys.exit(render_main(sys.argv[1:]))
     sys.exit(main(sys.argv))
\ No newline at end of file
@@ -1,58 +1,36 @@
 import os, sys
 import argparse
+import xml.etree.ElementTree as ET
 import traci
 import numpy as np
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+from net_cache import load_net
+from traci_helpers import get_subscription_results, LaneDensityTracker
 
-def parseChar(char):
-    """
-    :param char: column index of the intersection (e.G. 'A', 'B', ...)
-    :return: Returns the converted column index of the intersection to an int
-    """
-
-    if char == 'A':
-        return 0
-    elif char == 'B':
-        return 1
-    elif char == 'C':
-        return 2
-    elif char == 'D':
-        return 3
-    elif char == 'E':
-        return 4
-    else:
-        return -1
-
+# vehicle variables the board state is built from, pulled in one subscription batch
+BOARD_VARIABLES = (traci.constants.VAR_NEXT_TLS, traci.constants.VAR_SIGNALS, traci.constants.VAR_LANE_ID)
 
-class SumoLaneID:
 
-    def __init__(self, lane_id):
-        self.originFirstCoordinate = parseChar(str(lane_id)[0])
-        self.originSecondCoordinate = int(str(lane_id)[1])
-        self.destinationFirstCoordinate = parseChar(str(lane_id)[2])
-        self.destinationSecondCoordinate = int(str(lane_id)[3])
-        self.laneIndex = int(str(lane_id)[5])
+class BoardLayout:
+    """Lookup tables of a grid network that map traffic lights to board rows and lanes to their direction and lane index.
+    Rows are ordered like the junction IDs of netgenerate grids (A0, B0, ..., A1, ...), see :meth:`net_cache.NetTopology.grid_index`.
 
+    :param net: Topology of the grid network
+    :type net: net_cache.NetTopology
+    """
+    # board columns per direction: right turn, straight ahead right lane, straight ahead left lane, left/U turn, unused
+    TL_SLOTS = 5
 
-    def upcommingWaiting(self):
-        """
-        :return: Returns the location at the next intersection
-            north: 0
-            east: 1
-            south: 2
-            west: 3
-        """
-
-        if self.originSecondCoordinate > self.destinationSecondCoordinate:
-            return 0
-        elif self.originFirstCoordinate > self.destinationFirstCoordinate:
-            return 1
-        elif self.originSecondCoordinate < self.destinationSecondCoordinate:
-            return 2
-        elif self.originFirstCoordinate < self.destinationFirstCoordinate:
-            return 3
-        else:
-            return -1
+    def __init__(self, net):
+        is_tls = net.junction_type == "traffic_light"
+        columns, rows, (n_columns, n_rows) = net.grid_index(is_tls)
+        self.shape = (n_columns * n_rows, 4 * self.TL_SLOTS)
+        self.junction_rows = dict(zip(net.junction_ids[is_tls].tolist(), (columns + rows * n_columns).tolist()))
+        # location at the next intersection: north 0, east 1, south 2, west 3, -1 for lanes leaving the grid
+        self.lane_direction = net.lane_direction.astype(np.int64)
+        self.lane_index = net.lane_index.astype(np.int64)
+        self.lane_pos = net.lane_pos
 
 
 class SumoBaseSimulation:
@@ -61,47 +39,56 @@ class SumoBaseSimulation:
 
         self.sumo_config_path = args.sumo_config_path
         self.sumo_env = args.sumo_cmd_env
-        self.all_lanes_density = []
+        self.density_tracker = None
+        net_path = getattr(args, "sumo_net_path", None) or self.getNetPath()
+        self.board_layout = BoardLayout(load_net(net_path))
 
-    def calc_lane_density(self, laneID):
-        num = traci.lane.getLastStepVehicleNumber(laneID)
-        density = num / traci.lane.getLength(laneID) / 100.
-        return density
+    def getNetPath(self):
+        """
+        :return: Path of the net file referenced by the SUMO config
+        """
+        net_file = ET.parse(self.sumo_config_path).getroot().find("input/net-file").get("value")
+        return os.path.join(os.path.dirname(self.sumo_config_path), net_file)
 
     def getBoardState(self):
         """
-        getBoardState() -> int[25][20]
+        getBoardState() -> int[junctions][20]
         :return: the board state. The lines represent the respective intersection. The columns represent the number of cars
         that are 100 meters before the intersection at the respective traffic light.
         """
 
-        junctions = np.zeros((25, 20))
-        for vehicle in traci.vehicle.getIDList():
-            next_tls = traci.vehicle.getNextTLS(vehicle)
-            signal = traci.vehicle.getSignals(vehicle)
-            # traci.vehicle.getLaneID(vehicle)[0]==':' == Vehicle is located on the intersection
-            if len(next_tls) >= 1 and not(traci.vehicle.getLaneID(vehicle)[0]==':'):
-                sumoLaneId = SumoLaneID(traci.vehicle.getLaneID(vehicle))
-                # from a distance of 100 the signal is switched on
-                if float(next_tls[0][2]) < 100:
-                    junctionIndex = self.junctionIDListToIndex(next_tls[0][0])
-                    tLIndex = sumoLaneId.upcommingWaiting() * 5 + self.getTLSummand(signal, sumoLaneId)
-                    junctions[junctionIndex][tLIndex] += 1
-        return junctions
+        layout = self.board_layout
+        next_tls_var, signals_var, lane_var = BOARD_VARIABLES
+        results = get_subscription_results(traci.vehicle, traci.vehicle.getIDList(), BOARD_VARIABLES)
+        # internal lanes (':' == vehicle is located on the intersection) are not part of the lookup table
+        lanes = np.array([layout.lane_pos.get(result[lane_var], -1) for result in results], dtype=np.int64)
+        signals = np.array([result[signals_var] for result in results], dtype=np.int64)
+        next_tls = [result[next_tls_var][0] if result[next_tls_var] else (None, -1, np.inf, "") for result in results]
+        junction_rows = np.array([layout.junction_rows.get(tls[0], -1) for tls in next_tls], dtype=np.int64)
+        distances = np.array([tls[2] for tls in next_tls], dtype=float)
+
+        # from a distance of 100 the signal is switched on
+        counted = (lanes >= 0) & (junction_rows >= 0) & (distances < 100)
+        lanes = lanes[counted]
+        directions = layout.lane_direction[lanes]
+        counted_rows = junction_rows[counted]
+        tl_index = directions * layout.TL_SLOTS + self.getTLSummand(signals[counted], layout.lane_index[lanes])
+        # negative indices wrap around within the row
+        tl_index %= layout.shape[1]
+        keep = directions >= 0
+        flat_index = counted_rows[keep] * layout.shape[1] + tl_index[keep]
+        return np.bincount(flat_index, minlength=layout.shape[0] * layout.shape[1]).reshape(layout.shape).astype(float)
 
     def junctionIDListToIndex(self, junction):
         """
         :param junction: SUMO ID der junction
         :return: 1D Index of the SUMO ID
         """
-        firstCoordinate = parseChar(junction[0])
-        secondCoordinate = int(junction[1])
-        return firstCoordinate + (secondCoordinate * 5)
-
+        return self.board_layout.junction_rows[junction]
 
-    def getTLSummand(self, signal, sumoLaneId):
+    def getTLSummand(self, signal, lane_index):
         """
-        :param signal: signal of an vehicle
+        :param signal: signals of vehicles
 
         signal == 0: no blinker Active & no brake lights active
         signal == 8: no blinker Active & brake lights active
@@ -109,25 +96,23 @@ class SumoBaseSimulation:
         signal == 9: right blinker Active & brake lights active
         signal == 2: left blinker Active & no brake lights active
         signal == 10: left blinker Active & brake lights active
-        :param sumoLaneId: SumoLaneID() of an vehicle
-        :return: the position at a traffic light
+        :param lane_index: lane indices of the vehicles
+        :return: the positions at a traffic light
 
         position == 0: right turn
         position == 1: straight ahead, right lane
         position == 2: straight ahead, left lane
         position == 3: left/U turn
         """
-        if (signal == 0 or signal == 8) and sumoLaneId.laneIndex == 0:
-            return 1
-        elif (signal == 0 or signal == 8) and sumoLaneId.laneIndex == 1:
-            return 2
-        elif signal == 1 or signal == 9:
-            return 0
-        elif signal == 2 or signal == 10:
-            return 3
-        else:
-            print(f'error in getTLSummand for Signal: {signal} and sumoLaneIndex: {sumoLaneId.laneIndex}')
-            return -1
+        no_blinker = (signal == 0) | (signal == 8)
+        summand = np.select(
+            [no_blinker & (lane_index == 0), no_blinker & (lane_index == 1), (signal == 1) | (signal == 9), (signal == 2) | (signal == 10)],
+            [1, 2, 0, 3],
+            -1,
+        )
+        for error_signal, error_index in set(zip(signal[summand < 0].tolist(), lane_index[summand < 0].tolist())):
+            print(f'error in getTLSummand for Signal: {error_signal} and sumoLaneIndex: {error_index}')
+        return summand
 
     def main(self):
 
@@ -139,16 +124,14 @@ class SumoBaseSimulation:
             sys.exit("please declare environment variable 'SUMO_HOME'")
 
         traci.start([self.sumo_env, "-c", self.sumo_config_path])
+        # lane lengths are fetched once, the vehicle numbers of all lanes arrive in one batch every step
+        self.density_tracker = LaneDensityTracker(traci.lane.getIDList())
 
         for step in range(10000):
             traci.simulationStep()
 
             # print("Time Step : ",step)
-            lanes = traci.lane.getIDList()
-            lane_density = []
-            for laneID in lanes:
-                density = self.calc_lane_density(laneID)
-                lane_density.append(density)
+            self.density_tracker.update()
 
             # trafficlights = traci.trafficlight.getIDList()
             # red_state = 'rrrrrGGyyyrrrrrGGggy'
@@ -160,14 +143,14 @@ class SumoBaseSimulation:
             #         traci.trafficlight.setRedYellowGreenState(tlsID,red_state)
             #     elif(step%90):
             #         traci.trafficlight.setRedYellowGreenState(tlsID,green_state)
-            self.all_lanes_density.append(np.mean(lane_density))
             if (step % 10 == 0):
                 print(self.getBoardState())
-                print("Average Network Density at time step " + str(step) + " : ", np.mean(self.all_lanes_density))
+                # mean lane density (vehicles per metre) divided by 100, the scale of the former per-lane calculation
+                print("Average Network Density at time step " + str(step) + " : ", self.density_tracker.network_mean / 100.)
         traci.close()
 
         # x = np.arange(1,10001,1)
-        # plt.plot(x,self.all_lanes_density)
+        # plt.plot(x,self.density_tracker.window_mean)
         # plt.show()
 
 
@@ -177,6 +160,7 @@ if __name__ == "__main__":
 
     parser.add_argument("--sumo_config_path", help="Path for SUMO config file", default="../xml/scenario1/grid.sumocfg")
     parser.add_argument("--sumo_cmd_env", help="Sumo execution environment", default="sumo-gui")
+    parser.add_argument("--sumo_net_path", help="Path for SUMO net file, defaults to the net file of the SUMO config", default=None)
 
     args = parser.parse_args()
 
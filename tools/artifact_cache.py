@@ -0,0 +1,177 @@
+"""
+Content-addressed on-disk cache of generated scenario artifacts (networks, routes, rerouters)
+"""
+
+import os
+import json
+import shutil
+import stat
+import tempfile
+import time
+
+# increase whenever the layout of the cache entries changes, older entries are then ignored
+CACHE_VERSION = 1
+
+
+def default_cache_dir():
+    """Return the default root directory of the artifact cache, ``$XDG_CACHE_HOME/traffic-simulation/artifacts`` (``~/.cache/...``).
+
+    :return: Path of the cache directory
+    :rtype: str
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser(os.path.join("~", ".cache")))
+    return os.path.join(cache_home, "traffic-simulation", "artifacts")
+
+
+class ArtifactCache:
+    """Stores the output files of generator runs under a key, e.g. a hash of the generator parameters,
+    tool versions and input contents, and restores them on later runs with the same key.
+
+    Every entry is a directory ``<cache_dir>/v<CACHE_VERSION>/<key[:2]>/<key>`` holding the files by their base name
+    and a ``meta.json``. Entries are written into a temporary directory first and renamed into place,
+    so concurrent processes never see partial entries, and their files are made read-only.
+    Restoring hard-links the files (copies them across file systems), so readers only need read access:
+    with ``read_only`` the cache is never written, which allows sharing one cache between worker processes or users.
+    The modification time of an entry is its last use, :meth:`evict` removes the least recently used entries
+    until the total size fits into ``max_bytes``.
+
+    :param cache_dir: Root directory of the cache, defaults to :func:`default_cache_dir`
+    :type cache_dir: str
+    :param max_bytes: Total size the cache is reduced to after every :meth:`put`, None for no limit
+    :type max_bytes: int
+    :param read_only: If True, :meth:`put` and :meth:`evict` do nothing and last uses are not recorded
+    :type read_only: bool
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None, read_only: bool = False):
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), f"v{CACHE_VERSION}")
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+
+    def entry_path(self, key: str):
+        """Return the directory of the entry of ``key``.
+
+        :param key: Key of the entry, a hex digest
+        :type key: str
+        :return: Path of the entry
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key: str, paths: list):
+        """Restore the files stored under ``key`` to ``paths``, matched by base name.
+        Existing files at ``paths`` are replaced.
+
+        :param key: Key of the entry
+        :type key: str
+        :param paths: Paths the files are restored to
+        :type paths: list
+        :return: Whether the entry existed and all files were restored
+        :rtype: bool
+        """
+        entry = self.entry_path(key)
+        try:
+            for path in paths:
+                source = os.path.join(entry, os.path.basename(path))
+                if not os.path.isfile(source):
+                    return False
+            for path in paths:
+                source = os.path.join(entry, os.path.basename(path))
+                if os.path.lexists(path):
+                    os.remove(path)
+                try:
+                    os.link(source, path)
+                except OSError:
+                    shutil.copyfile(source, path)
+        except OSError:
+            # the entry was evicted by another process in the meantime
+            return False
+        if not self.read_only:
+            try:
+                os.utime(entry)
+            except OSError:
+                pass
+        return True
+
+    def put(self, key: str, paths: list):
+        """Store the files at ``paths`` under ``key``, then evict least recently used entries if ``max_bytes`` is exceeded.
+
+        :param key: Key of the entry
+        :type key: str
+        :param paths: Paths of the files to store, their base names must be unique
+        :type paths: list
+        :return: Whether the entry was stored, False if it already existed or the cache is read-only
+        :rtype: bool
+        """
+        if self.read_only:
+            return False
+        entry = self.entry_path(key)
+        if os.path.isdir(entry):
+            return False
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        size = 0
+        for path in paths:
+            target = os.path.join(tmp_path, os.path.basename(path))
+            shutil.copyfile(path, target)
+            # hard links of restored files point to the cached file, they must not be modified in place
+            os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            size += os.path.getsize(target)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"key": key, "files": [os.path.basename(path) for path in paths], "size": size, "created": time.time()}, f)
+        try:
+            os.rename(tmp_path, entry)
+        except OSError:
+            # another process stored the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+        return True
+
+    def entries(self):
+        """Return all entries of the cache.
+
+        :return: List of (last use, size in bytes, path) tuples
+        :rtype: list
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for prefix in os.listdir(self.cache_dir):
+            prefix_path = os.path.join(self.cache_dir, prefix)
+            for key in os.listdir(prefix_path) if os.path.isdir(prefix_path) else []:
+                entry = os.path.join(prefix_path, key)
+                try:
+                    with open(os.path.join(entry, "meta.json")) as f:
+                        size = json.load(f)["size"]
+                    entries.append((os.path.getmtime(entry), size, entry))
+                except (OSError, ValueError, KeyError):
+                    # temporary directory of a running put or a damaged entry
+                    continue
+        return entries
+
+    def size(self):
+        """Return the total size of all entries in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes: int):
+        """Remove the least recently used entries until the total size is at most ``max_bytes``.
+
+        :param max_bytes: Total size to reduce the cache to
+        :type max_bytes: int
+        :return: Number of removed entries
+        :rtype: int
+        """
+        if self.read_only:
+            return 0
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,284 @@
+"""
+Streaming reader for SUMO FCD (floating car data) output files
+"""
+
+import os
+import re
+import json
+from xml.sax.saxutils import unescape
+
+import numpy as np
+
+# Parquet output is optional
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# column name -> dtype of the columnar FCD representation
+# vehicle and lane are integer codes into the vehicle_ids and lane_ids vocabularies
+COLUMNS = {
+    "time": np.float64,
+    "vehicle": np.int32,
+    "x": np.float64,
+    "y": np.float64,
+    "speed": np.float32,
+    "angle": np.float32,
+    "lane": np.int32,
+    "pos": np.float32,
+}
+
+
+class StringInterner:
+    """Assigns dense integer codes to strings, a string keeps its code once it has been seen."""
+
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+
+    def __call__(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = self.codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+
+# attributes of <vehicle> elements in the column order of COLUMNS (without time)
+VEHICLE_ATTRIBUTES = ("id", "x", "y", "speed", "angle", "lane", "pos")
+TIMESTEP_PATTERN = r'<timestep\s[^>]*?time="([^"]*)"'
+
+# a <timestep> (first group) or a <vehicle> element (remaining groups, in the order of VEHICLE_ATTRIBUTES)
+# the lookaheads make the attributes order independent and optional, a group is empty if its attribute is missing
+GENERIC_PATTERN = re.compile((TIMESTEP_PATTERN + r'|<vehicle(?=\s)' + "".join(
+    rf'(?=(?:[^>]*?\s{name}="([^"]*)")?)' for name in VEHICLE_ATTRIBUTES
+)).encode())
+
+
+def _ordered_pattern(element):
+    """Build a pattern for ``<vehicle>`` elements with the same attributes in the same order as ``element``.
+    SUMO writes all vehicles of a file alike and matching them positionally is about ten times faster than
+    :data:`GENERIC_PATTERN`.
+
+    :return: The compiled pattern and the order of its groups (without the timestep group) in VEHICLE_ATTRIBUTES,
+        or None if ``element`` misses attributes
+    :rtype: tuple
+    """
+    names = [name.decode() for name in re.findall(rb'([^\s=]+)\s*=\s*"', element)]
+    if not set(VEHICLE_ATTRIBUTES) <= set(names):
+        return None
+    attributes = "".join(rf'\s+{name}="([^"]*)"' if name in VEHICLE_ATTRIBUTES else rf'\s+{re.escape(name)}="[^"]*"' for name in names)
+    captured = [name for name in names if name in VEHICLE_ATTRIBUTES]
+    order = [0] + [1 + captured.index(name) for name in VEHICLE_ATTRIBUTES]
+    return re.compile((TIMESTEP_PATTERN + r'|<vehicle' + attributes).encode()), order
+
+
+def _intern(values, interner):
+    """Map an array of raw byte strings to their codes, calling the interner once per distinct string only."""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    codes = np.array([interner(unescape(value.decode())) for value in uniques.tolist()], dtype=np.int32)
+    return codes[inverse.ravel()] if len(uniques) else np.zeros(0, dtype=np.int32)
+
+
+def _parse_block(block, time, ordered=None):
+    """Parse all records of a block of complete elements, ``time`` is the current timestep before the block."""
+    fields = None
+    if ordered is not None:
+        pattern, order = ordered
+        matches = pattern.findall(block)
+        fields = np.array(matches, dtype=bytes).reshape(len(matches), pattern.groups)[:, order]
+        # fall back to the generic pattern if some vehicles are written differently
+        if np.count_nonzero(fields[:, 0] == b"") != block.count(b"<vehicle"):
+            fields = None
+    if fields is None:
+        matches = GENERIC_PATTERN.findall(block)
+        fields = np.array(matches, dtype=bytes).reshape(len(matches), GENERIC_PATTERN.groups)
+    if not len(fields):
+        return [], time
+    is_timestep = fields[:, 0] != b""
+    # forward fill the time of the last timestep onto the vehicles following it
+    timestep_times = np.where(is_timestep, fields[:, 0], b"nan").astype(np.float64)
+    last_timestep = np.maximum.accumulate(np.where(is_timestep, np.arange(len(fields)), -1))
+    times = np.where(last_timestep >= 0, timestep_times[last_timestep], time)
+    if is_timestep.any():
+        time = float(timestep_times[is_timestep][-1])
+    is_vehicle = ~is_timestep
+    fields = fields[is_vehicle, 1:]
+    # missing numeric attributes (e.g. pos of mesoscopic vehicles) become nan
+    fields[fields == b""] = b"nan"
+    return [times[is_vehicle], fields], time
+
+
+def iter_fcd_chunks(fcd_xml_path: str, chunk_size: int = 100000, block_size: int = 1 << 20,
+                    vehicle_ids: StringInterner = None, lane_ids: StringInterner = None):
+    """Stream an FCD output file and yield its ``<vehicle>`` records as columnar NumPy arrays.
+
+    The file is read block by block and all records of a block are extracted by a single regular expression
+    and converted by NumPy, so no Python code runs per record and no element tree is built.
+    Memory is bounded by ``block_size`` and ``chunk_size`` (plus the vocabularies).
+
+    :param fcd_xml_path: Path to the FCD xml file
+    :type fcd_xml_path: str
+    :param chunk_size: Number of records per yielded chunk, only the last chunk may be shorter
+    :type chunk_size: int
+    :param block_size: Number of bytes read from the file at once
+    :type block_size: int
+    :param vehicle_ids: Interner for the vehicle IDs, pass one to share codes across files
+    :type vehicle_ids: StringInterner
+    :param lane_ids: Interner for the lane IDs, pass one to share codes across files
+    :type lane_ids: StringInterner
+    :return: Generator of dictionaries mapping the names in ``COLUMNS`` to arrays of ``chunk_size`` records
+    :rtype: generator
+    """
+    vehicle_ids = StringInterner() if vehicle_ids is None else vehicle_ids
+    lane_ids = StringInterner() if lane_ids is None else lane_ids
+    pending = []
+    pending_size = 0
+    time = np.nan
+    rest = b""
+    ordered = None
+
+    def to_chunk(times, fields):
+        # vehicles of mesoscopic simulations have no lane, they get the code of ""
+        lanes = np.where(fields[:, 5] == b"nan", b"", fields[:, 5])
+        return {
+            "time": times,
+            "vehicle": _intern(fields[:, 0], vehicle_ids),
+            "x": fields[:, 1].astype(COLUMNS["x"]),
+            "y": fields[:, 2].astype(COLUMNS["y"]),
+            "speed": fields[:, 3].astype(COLUMNS["speed"]),
+            "angle": fields[:, 4].astype(COLUMNS["angle"]),
+            "lane": _intern(lanes, lane_ids),
+            "pos": fields[:, 6].astype(COLUMNS["pos"]),
+        }
+
+    with open(fcd_xml_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            data = rest + block
+            # only parse complete elements, the tail is kept for the next block
+            end = data.rfind(b">") + 1
+            if ordered is None:
+                first = re.search(rb'<vehicle\s[^>]*', data[:end])
+                ordered = _ordered_pattern(first.group()) if first else None
+            parsed, time = _parse_block(data[:end], time, ordered)
+            rest = data[end:]
+            if parsed:
+                pending.append(to_chunk(*parsed))
+                pending_size += len(parsed[0])
+            while pending_size >= chunk_size or (not block and pending_size):
+                merged = {name: np.concatenate([chunk[name] for chunk in pending]) for name in COLUMNS}
+                yield {name: values[:chunk_size] for name, values in merged.items()}
+                pending = [{name: values[chunk_size:] for name, values in merged.items()}]
+                pending_size = max(pending_size - chunk_size, 0)
+            if not block:
+                break
+
+
+def read_fcd(fcd_xml_path: str, chunk_size: int = 100000):
+    """Read a whole FCD output file into columnar NumPy arrays.
+
+    :param fcd_xml_path: Path to the FCD xml file
+    :type fcd_xml_path: str
+    :param chunk_size: Number of records parsed between two conversions to NumPy
+    :type chunk_size: int
+    :return: Dictionary mapping the names in ``COLUMNS`` to arrays plus the vocabularies ``vehicle_ids`` and ``lane_ids``
+    :rtype: dict
+    """
+    vehicle_ids = StringInterner()
+    lane_ids = StringInterner()
+    chunks = list(iter_fcd_chunks(fcd_xml_path, chunk_size, vehicle_ids=vehicle_ids, lane_ids=lane_ids))
+    fcd = {
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.zeros(0, dtype=dtype)
+        for name, dtype in COLUMNS.items()
+    }
+    fcd["vehicle_ids"] = np.array(vehicle_ids.strings, dtype=str)
+    fcd["lane_ids"] = np.array(lane_ids.strings, dtype=str)
+    return fcd
+
+
+def convert_fcd(fcd_xml_path: str, out_dir: str, chunk_size: int = 100000, file_format: str = "npy"):
+    """Convert an FCD output file into a compact binary representation with constant memory.
+
+    With ``file_format="npy"`` every column is appended chunk by chunk to a raw binary file that :func:`load_fcd`
+    memory-maps, the record count and dtypes are stored in ``fcd.json``. With ``file_format="parquet"``
+    (requires pyarrow) the columns are written to ``fcd.parquet`` instead.
+    In both cases the vocabularies are saved as ``vehicle_ids.npy`` and ``lane_ids.npy``.
+
+    :param fcd_xml_path: Path to the FCD xml file
+    :type fcd_xml_path: str
+    :param out_dir: Directory to write the converted files to
+    :type out_dir: str
+    :param chunk_size: Number of records converted at once
+    :type chunk_size: int
+    :param file_format: Either "npy" or "parquet"
+    :type file_format: str
+    :return: Number of converted records
+    :rtype: int
+    """
+    if file_format not in ("npy", "parquet"):
+        raise ValueError(f"Unknown file_format '{file_format}', expected 'npy' or 'parquet'")
+    if file_format == "parquet" and pyarrow is None:
+        raise ImportError("Writing parquet files requires pyarrow, install it or use file_format='npy'")
+    os.makedirs(out_dir, exist_ok=True)
+    vehicle_ids = StringInterner()
+    lane_ids = StringInterner()
+    chunks = iter_fcd_chunks(fcd_xml_path, chunk_size, vehicle_ids=vehicle_ids, lane_ids=lane_ids)
+    length = 0
+    if file_format == "npy":
+        files = {name: open(os.path.join(out_dir, f"{name}.bin"), "wb") for name in COLUMNS}
+        try:
+            for chunk in chunks:
+                for name, values in chunk.items():
+                    values.tofile(files[name])
+                length += len(chunk["time"])
+        finally:
+            for f in files.values():
+                f.close()
+        meta = {
+            "length": length,
+            "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+        }
+        with open(os.path.join(out_dir, "fcd.json"), "w") as f:
+            json.dump(meta, f)
+    else:
+        schema = pyarrow.schema([(name, pyarrow.from_numpy_dtype(dtype)) for name, dtype in COLUMNS.items()])
+        with pyarrow.parquet.ParquetWriter(os.path.join(out_dir, "fcd.parquet"), schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pyarrow.Table.from_pydict(chunk, schema=schema))
+                length += len(chunk["time"])
+    np.save(os.path.join(out_dir, "vehicle_ids.npy"), np.array(vehicle_ids.strings, dtype=str))
+    np.save(os.path.join(out_dir, "lane_ids.npy"), np.array(lane_ids.strings, dtype=str))
+    return length
+
+
+def load_fcd(out_dir: str, mmap: bool = True):
+    """Load FCD data converted by :func:`convert_fcd`.
+
+    :param out_dir: Directory the converted files were written to
+    :type out_dir: str
+    :param mmap: Whether to memory-map the columns of the "npy" format instead of reading them into memory
+    :type mmap: bool
+    :return: Dictionary mapping the names in ``COLUMNS`` to arrays plus the vocabularies ``vehicle_ids`` and ``lane_ids``
+    :rtype: dict
+    """
+    meta_path = os.path.join(out_dir, "fcd.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        fcd = {}
+        for name, dtype in meta["columns"].items():
+            path = os.path.join(out_dir, f"{name}.bin")
+            if mmap and meta["length"]:
+                fcd[name] = np.memmap(path, dtype=dtype, mode="r", shape=(meta["length"],))
+            else:
+                fcd[name] = np.fromfile(path, dtype=dtype)
+    else:
+        if pyarrow is None:
+            raise ImportError("Reading parquet files requires pyarrow")
+        table = pyarrow.parquet.read_table(os.path.join(out_dir, "fcd.parquet"))
+        fcd = {name: table.column(name).to_numpy() for name in COLUMNS}
+    fcd["vehicle_ids"] = np.load(os.path.join(out_dir, "vehicle_ids.npy"))
+    fcd["lane_ids"] = np.load(os.path.join(out_dir, "lane_ids.npy"))
+    return fcd
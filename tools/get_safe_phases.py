@@ -1,133 +1,223 @@
-from bs4 import BeautifulSoup
 import numpy as np
-import itertools
+import multiprocessing as mp
 import warnings
+import xml.etree.ElementTree as ET
 
-def get_safe_phases(net_xml_path: str, junction_id: str):
+def foe_matrix(requests: list):
+    """Build the foe matrix of a junction from its ``<request>`` elements.
+
+    :param requests: Pairs of request index and foes string as found in the net xml file
+    :type requests: list
+    :return: Binary foe matrix where entry [i, j] is 1 if connection j is a foe of connection i
+    :rtype: np.ndarray
+    """
+    if not requests:
+        return np.zeros((0, 0), dtype=np.uint8)
+    requests = sorted(requests, key=lambda request: request[0])
+    foes = np.array([np.frombuffer(foe.encode(), dtype=np.uint8) - ord('0') for _, foe in requests], dtype=np.uint8)
+    #! flip foes to be more intuitive, without flipping columns would be reversed i.e. last value in each row would correspond to index 0
+    return np.fliplr(foes.reshape(len(requests), -1))
+
+
+def iter_junction_foes(net_xml_path: str, tls_only: bool = True):
+    """Stream the junctions of a SUMO net xml file and yield their foe matrices.
+
+    The file is read with ``iterparse`` in a single pass, elements are discarded as soon as they are processed,
+    so memory stays bounded even for city-scale networks.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :param tls_only: If True, only junctions of type 'traffic_light' are yielded
+    :type tls_only: bool
+    :return: Generator of (junction ID, junction type, foe matrix) tuples
+    :rtype: generator
+    """
+    context = ET.iterparse(net_xml_path, events=("start", "end"))
+    _, root = next(context)
+    depth = 1
+    for event, elem in context:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        # only act on direct children of <net>, nested elements are read through their parents
+        if depth != 1:
+            continue
+        if elem.tag == 'junction' and (not tls_only or elem.get('type') == 'traffic_light'):
+            requests = [(int(request.get('index')), request.get('foes')) for request in elem.iter('request')]
+            yield elem.get('id'), elem.get('type'), foe_matrix(requests)
+        # drop everything that has been processed so far
+        root.clear()
+
+
+def read_foes(net_xml_path: str, junction_id: str):
+    """Read the foe matrix of a junction from a SUMO net xml file.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :param junction_id: SUMO junction ID
+    :type junction_id: str
+    :return: Binary foe matrix where entry [i, j] is 1 if connection j is a foe of connection i
+    :rtype: np.ndarray
+    """
+    for current_id, junction_type, foes in iter_junction_foes(net_xml_path, tls_only=False):
+        if current_id != junction_id:
+            continue
+        #! throw warning if junction type is not traffic_light i.e. it is not controlled by tls
+        if junction_type != 'traffic_light':
+            warnings.warn(f"Junction with ID: {junction_id} is not of type 'traffic_light'. Instead it is of type: '{junction_type}'. This means that the junction is not controlled by a tls.")
+        return foes
+    raise KeyError(f"Junction with ID: {junction_id} not found in {net_xml_path}")
+
+
+def _read_foes_cached(net_xml_path: str, junction_id: str):
+    # imported here as net_cache itself builds on this module
+    from net_cache import load_net
+    try:
+        return load_net(net_xml_path).get_foes(junction_id)
+    except KeyError:
+        # only traffic light junctions are cached, read_foes warns about the junction type
+        return read_foes(net_xml_path, junction_id)
+
+
+def _bit_indices(mask: int):
+    """Yield the indices of all set bits of an integer bitmask in ascending order."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def _non_foe_masks(foes: np.ndarray):
+    """Encode the non-foe relation of a foe matrix as one integer bitmask per connection.
+
+    Bit j of mask i is set if connections i and j are no foes of each other, i.e. if they can share a green phase.
+    A connection is never its own non-foe.
+
+    :param foes: Binary foe matrix as returned by :func:`read_foes`
+    :type foes: np.ndarray
+    :return: List of bitmasks, one per connection
+    :rtype: list
+    """
+    foes = np.asarray(foes) != 0
+    non_foes = ~(foes | foes.T)
+    np.fill_diagonal(non_foes, False)
+    packed = np.packbits(non_foes, axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in packed]
+
+
+def _all_safe_phases(non_foes: list):
+    # level-wise enumeration of all cliques of the non-foe relation
+    # every combination is only extended by connections with a higher index than its last one, so each
+    # combination is generated exactly once and each level is already in lexicographic order
+    n_tls = len(non_foes)
+    # non-foes of each connection restricted to higher indices
+    higher_non_foes = [non_foes[i] >> (i + 1) << (i + 1) for i in range(n_tls)]
+
+    total_safe_phases = []
+    level = [([i], higher_non_foes[i]) for i in range(n_tls)]
+    while level:
+        total_safe_phases += [safe_phase for safe_phase, _ in level]
+        next_level = []
+        for safe_phase, candidates in level:
+            for connection in _bit_indices(candidates):
+                next_level.append((safe_phase + [connection], candidates & higher_non_foes[connection]))
+        level = next_level
+    return total_safe_phases
+
+
+def _maximal_safe_phases(non_foes: list):
+    # Bron-Kerbosch with pivoting on bitmasks: r is the current combination,
+    # p the connections that can still be added and x the ones that were already tried
+    n_tls = len(non_foes)
+    if n_tls == 0:
+        return []
+    maximal = []
+    stack = [(0, (1 << n_tls) - 1, 0)]
+    while stack:
+        r, p, x = stack.pop()
+        if not p and not x:
+            maximal.append(r)
+            continue
+        pivot = max(_bit_indices(p | x), key=lambda u: bin(p & non_foes[u]).count("1"))
+        for v in _bit_indices(p & ~non_foes[pivot]):
+            stack.append((r | 1 << v, p & non_foes[v], x & non_foes[v]))
+            p &= ~(1 << v)
+            x |= 1 << v
+    safe_phases = [list(_bit_indices(r)) for r in maximal]
+    return sorted(safe_phases, key=lambda safe_phase: (len(safe_phase), safe_phase))
+
+
+def safe_phases_from_foes(foes: np.ndarray, maximal_only: bool = False):
+    """Return all connection combinations of a foe matrix that can receive a green signal at the same time.
+
+    Two connections can share a green phase if neither is a foe of the other.
+    Combinations are ordered by their size and lexicographically within the same size.
+
+    :param foes: Binary foe matrix where entry [i, j] is 1 if connection j is a foe of connection i
+    :type foes: np.ndarray
+    :param maximal_only: If True, only return combinations to which no further connection can be added
+    :type maximal_only: bool
+    :return: List of all safe phase combinations as list of lists of connection indices
+    :rtype: list
+    """
+    non_foes = _non_foe_masks(foes)
+    if maximal_only:
+        return _maximal_safe_phases(non_foes)
+    return _all_safe_phases(non_foes)
+
+
+def get_safe_phases(net_xml_path: str, junction_id: str, maximal_only: bool = False, use_cache: bool = False):
     """For a given traffic-light-controlled junction return all connection combinations that can receive a green signal at the same time without leading to collisions.
 
     :param net_xml_path: Path to SUMO net xml file
     :type net_xml_path: str
     :param junction_id: SUMO junction ID
     :type junction_id: str
+    :param maximal_only: If True, only return combinations to which no further connection can be added
+    :type maximal_only: bool
+    :param use_cache: If True, read the foe matrix from the network cache of ``net_cache.py`` instead of the net xml file
+    :type use_cache: bool
     :return: Two values: the number of connections in the junction & List of all safe phase combinations as list of lists where each inner list is a combination of connections that can share green signals without colliding
     :rtype: int, list
     """
-    
-    # read and parse SUMO net xml file
-    with open(net_xml_path, "r") as f:
-        net_data = f.read()
-    net_xml = BeautifulSoup(net_data, "xml")
-
-    # whole junction including lanes etc
-    junction_data = net_xml.find('junction', {'id': junction_id})
-    
-    #! throw warning if junction type is not traffic_light i.e. it is not controlled by tls
-    junction_type = junction_data.attrs['type']
-    if junction_type != 'traffic_light':
-        warnings.warn(f"Junction with ID: {junction_id} is not of type 'traffic_light'. Instead it is of type: '{junction_type}'. This means that the junction is not controlled by a tls.")
-        
-    # just request data including foes, cont, index, response
-    request_data = junction_data.find_all('request')
-    # just foes
-    foes = [request.attrs['foes'] for request in request_data]
-    # foes as np array
-    foes = np.ma.array([list(map(int, foe)) for foe in foes], mask=False)
-    
-    # number of tls / tls controlled connections
-    n_tls = foes.shape[0]
-    
-    #! flip foes to be more intuitive, without flipping columns would be reversed i.e. last value in each row would correspond to index 0
-    foes = np.fliplr(foes)
-    
-    # mask values corresponding to whether a connection has itself as foe or not
-    # we want to ignore those for further computations
-    for i in range(n_tls):
-        foes.mask[i][i] = True
-    
-    # non-foes as a non sparse non binary list of foe indices
-    # practically list of connection indices that don't collide i.e. that can share a green phase
-    non_foes_ind = [np.where(foes[i] == 0)[0] for i in range(n_tls)]
-    
-    # placeholder to collect all safe_phases (safe phase combinations) during computation
-    total_safe_phases = [[i] for i in range(n_tls)]
-    
-    # for each tls / tls controlled connection list all others that are no foes of each other
-    # this combines all safe connection combinations which are directly readable from the foe matrix and which don't need further computation
-    safe_phases = []
-    for i in range(n_tls):
-        # pairs of 2: extract from foes
-        for i2 in non_foes_ind[i]:
-            #* condition to not take duplicates e.g. [0, 1] and [1, 0]
-            if i2 > i:
-                safe_phases.append([i, i2])
-            else:
-                continue
-    
-    # add safe phases to collection
-    total_safe_phases += safe_phases
-    
-    # placeholder for computation of next level non-foes
-    curr_non_foes = []
-    
-    # for each safe_phase that was combined in the first step -> get the safe connections of the given safe_phase and intersect those safe connections with the possible safe connections of an connection added to the safe phase
-    # the resulting safe phases contain more connections that can go green in parallel but also leads to less further possibilities to add to that combination
-    for safe_phase in safe_phases:
-        # start with first connection of a safe phase
-        wip_non_foes = non_foes_ind[safe_phase[0]]
-        # for each other connection of a safe phase get the step-wise intersection
-        for connection in safe_phase[1:]:
-            wip_non_foes = np.intersect1d(wip_non_foes, non_foes_ind[connection])
-        curr_non_foes.append(wip_non_foes)
-        
-    # check if non foes exist
-    # this is used as end condition for the loop
-    non_foes_exist = False
-    for non_foe in curr_non_foes:
-        if non_foe.any():
-            non_foes_exist = True
-            break
-    
-    # iteratively look for safe_phases and further non_foes
-    # stop when there are no further connection combinations having no_foe options to add
-    while non_foes_exist: 
-        # get new safe_phases
-        #! duplicates allowed, filter befor appending
-        dupl_safe_phases = []
-        for i in range(len(safe_phases)):
-            for connection in curr_non_foes[i]:
-                dupl_safe_phases.append(safe_phases[i].copy() + [connection])
-        # filter duplicates
-        for safe_phase in dupl_safe_phases:
-            safe_phase.sort()
-        dupl_safe_phases.sort()
-        # these are the newly computed safe phase combinations
-        new_safe_phases = list(k for k,_ in itertools.groupby(dupl_safe_phases))
-    
-        # get new indices of non_foes for the newly computed safe phase combinations
-        # so to speak: for each safe combinations a list of connection indices that could further be added to a given combination
-        new_non_foes = []
-        for i in range(len(new_safe_phases)):
-            wip_non_foes = non_foes_ind[new_safe_phases[i][0]]
-            for connection in new_safe_phases[i][1:]:
-                wip_non_foes = np.intersect1d(wip_non_foes, non_foes_ind[connection])
-            new_non_foes.append(wip_non_foes)
-        
-        # add safe phases to collection
-        total_safe_phases += new_safe_phases
-        
-        # overwrite old values for next iteration
-        curr_non_foes = new_non_foes.copy()
-        # check if further non foes exist and set ending condition accordingly
-        non_foes_exist = False
-        for non_foe in curr_non_foes:
-            if non_foe.any():
-                non_foes_exist = True
-                break
-                
-        safe_phases = new_safe_phases.copy()
-        
+    foes = _read_foes_cached(net_xml_path, junction_id) if use_cache else read_foes(net_xml_path, junction_id)
+
     # return number of connections or number of tls
     # return collection of all connection combinations that can share a green phase and would not lead to collisions
     # list of lists where each inner list contains indices of connections
-    return n_tls, total_safe_phases
+    return foes.shape[0], safe_phases_from_foes(foes, maximal_only)
+
+
+def get_safe_phases_all(net_xml_path: str, maximal_only: bool = False, processes: int = 1, use_cache: bool = False):
+    """Return the safe phase combinations of every traffic-light-controlled junction of a SUMO net.
+
+    The net xml file is read only once. With ``processes`` > 1 the junctions are distributed over a process pool.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :param maximal_only: If True, only return combinations to which no further connection can be added
+    :type maximal_only: bool
+    :param processes: Number of worker processes, 1 computes everything in the calling process
+    :type processes: int
+    :param use_cache: If True, read the foe matrices from the network cache of ``net_cache.py`` instead of the net xml file
+    :type use_cache: bool
+    :return: Dictionary where junction IDs are the keys and the values are tuples as returned by :func:`get_safe_phases`
+    :rtype: dict
+    """
+    if use_cache:
+        from net_cache import load_net
+        net = load_net(net_xml_path)
+        junction_foes = {junction_id: net.get_foes(junction_id) for junction_id in net.foe_junction_ids.tolist()}
+    else:
+        junction_foes = {junction_id: foes for junction_id, _, foes in iter_junction_foes(net_xml_path)}
+    args = [(foes, maximal_only) for foes in junction_foes.values()]
+    if processes > 1:
+        with mp.Pool(processes) as pool:
+            safe_phases = pool.starmap(safe_phases_from_foes, args)
+    else:
+        safe_phases = [safe_phases_from_foes(*arg) for arg in args]
+    return {
+        junction_id: (foes.shape[0], junction_safe_phases)
+        for (junction_id, foes), junction_safe_phases in zip(junction_foes.items(), safe_phases)
+    }
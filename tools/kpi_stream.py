@@ -0,0 +1,230 @@
+"""
+Running KPIs read incrementally from the emission, summary and tripinfo outputs of a running SUMO simulation
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# emission attributes in the order of traci_helpers.get_emissions
+EMISSION_ATTRIBUTES = ("NOx", "PMx", "CO2", "CO", "HC")
+# attributes of the emission output needed for the KPIs, SUMO writes only these
+EMISSION_OUTPUT_ATTRIBUTES = ("id",) + EMISSION_ATTRIBUTES + ("waiting", "lane")
+OUTPUTS = ("emission", "summary", "tripinfo")
+# tripinfo attributes summed over the trips, CO2_abs of the emissions element is in mg
+TRIP_ATTRIBUTES = {"waiting_time": "waitingTime", "time_loss": "timeLoss", "duration": "duration", "co2": "CO2_abs"}
+
+
+class XMLTail:
+    """Parses an XML file that is still being written, every :meth:`poll` continues where the last one stopped.
+    Elements are handed out when they are complete and dropped afterwards, so memory stays bounded.
+
+    :param path: Path of the XML file, it does not need to exist yet
+    :type path: str
+    :param tag: Tag of the elements to hand out, direct children of the root
+    :type tag: str
+    :param block_size: Number of bytes read from the file at once
+    :type block_size: int
+    """
+
+    def __init__(self, path: str, tag: str, block_size: int = 1 << 20):
+        self.path = path
+        self.tag = tag
+        self.block_size = block_size
+        self.file = None
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.root = None
+
+    def poll(self):
+        """Read everything written since the last call.
+
+        :return: Complete elements with the tag of this tail in file order
+        :rtype: list
+        """
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return []
+            self.file = open(self.path, "rb")
+        elements = []
+        while True:
+            block = self.file.read(self.block_size)
+            if not block:
+                break
+            # incomplete elements at the end of a block stay in the parser until the rest arrives
+            self.parser.feed(block)
+            for event, elem in self.parser.read_events():
+                if event == "start":
+                    if self.root is None:
+                        self.root = elem
+                elif elem.tag == self.tag:
+                    elements.append(elem)
+            if self.root is not None:
+                # drop everything parsed so far from the tree, an element that is still open keeps being built
+                del self.root[:]
+        return elements
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class KPIStream:
+    """KPIs of a running simulation from the outputs SUMO writes itself, instead of polling every vehicle through TraCI.
+
+    Start SUMO with :meth:`sumo_args` (e.g. ``SumoGraphEnviroment(sumo_args=stream.sumo_args())``) and call
+    :meth:`update` whenever current values are needed, e.g. after each step. SUMO writes its outputs through file
+    buffers, so the values may lag a few steps behind the simulation, :attr:`time` is the step they belong to.
+    After ``traci.close()`` a final :meth:`update` reads the rest.
+
+    Values of the last complete step of the emission output (with the meaning of the TraCI helpers):
+
+    * :meth:`get_emissions` - mean emissions of all vehicles, like ``traci_helpers.get_emissions``
+    * :meth:`get_network_waiting_time` - mean waiting time of all vehicles, like ``traci_helpers.getnetworkwaitingtime``
+    * :meth:`get_waiting_time` - summed waiting time on lanes, like ``traci_helpers.get_waiting_time``
+
+    Running aggregates:
+
+    * :attr:`total_emissions` - emitted mass in mg of every attribute of ``EMISSION_ATTRIBUTES`` summed over all steps
+    * :attr:`summary` - attributes of the last step of the summary output (running, halting, arrived, meanWaitingTime, ...)
+    * :attr:`halting_sum` / :attr:`summary_steps` - summed halting vehicles and number of steps, see :meth:`mean_queue_length`
+    * :attr:`trips` / :attr:`arrived` - number of tripinfos and of arrived vehicles among them, :attr:`trip_sums` the
+      summed ``TRIP_ATTRIBUTES`` of the trips and :meth:`trip_means` their means
+
+    :param out_dir: Directory the outputs are written to
+    :type out_dir: str
+    :param outputs: Outputs to configure and read, any of ``OUTPUTS``
+    :type outputs: tuple
+    :param write_unfinished: Whether SUMO also writes tripinfos of vehicles still running when it closes
+    :type write_unfinished: bool
+    """
+
+    def __init__(self, out_dir: str, outputs: tuple = OUTPUTS, write_unfinished: bool = False):
+        unknown = set(outputs) - set(OUTPUTS)
+        if unknown:
+            raise ValueError(f"Unknown outputs {sorted(unknown)}, expected any of {OUTPUTS}")
+        self.out_dir = out_dir
+        self.outputs = tuple(outputs)
+        self.write_unfinished = write_unfinished
+        self.paths = {output: os.path.join(out_dir, f"{output}.xml") for output in self.outputs}
+        tags = {"emission": "timestep", "summary": "step", "tripinfo": "tripinfo"}
+        self.tails = {output: XMLTail(path, tags[output]) for output, path in self.paths.items()}
+
+        self.time = None
+        self.vehicle_ids = []
+        self.vehicle_lanes = np.zeros(0, dtype=str)
+        self.vehicle_emissions = np.zeros((0, len(EMISSION_ATTRIBUTES)))
+        self.vehicle_waiting = np.zeros(0)
+        self.total_emissions = np.zeros(len(EMISSION_ATTRIBUTES))
+        self.summary = {}
+        self.halting_sum = 0.
+        self.summary_steps = 0
+        self.trips = 0
+        self.arrived = 0
+        self.trip_sums = dict.fromkeys(TRIP_ATTRIBUTES, 0.)
+
+    def sumo_args(self):
+        """Return the SUMO options writing the outputs into ``out_dir``.
+
+        :return: Command line options
+        :rtype: list
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        args = []
+        if "emission" in self.outputs:
+            args += ["--emission-output", self.paths["emission"], "--emission-output.attributes", ",".join(EMISSION_OUTPUT_ATTRIBUTES)]
+        if "summary" in self.outputs:
+            args += ["--summary-output", self.paths["summary"]]
+        if "tripinfo" in self.outputs:
+            args += ["--tripinfo-output", self.paths["tripinfo"]]
+            if self.write_unfinished:
+                args += ["--tripinfo-output.write-unfinished"]
+            # the emissions of a trip are only written for vehicles with an emissions device,
+            # the emission output covers all vehicles without one
+            args += ["--device.emissions.probability", "1"]
+        return args
+
+    def update(self):
+        """Read everything SUMO has written since the last update and update the KPIs.
+
+        :return: This stream
+        :rtype: KPIStream
+        """
+        if "emission" in self.outputs:
+            for timestep in self.tails["emission"].poll():
+                self._add_timestep(timestep)
+        if "summary" in self.outputs:
+            for step in self.tails["summary"].poll():
+                self.summary = {name: float(value) for name, value in step.attrib.items()}
+                self.halting_sum += self.summary.get("halting", 0.)
+                self.summary_steps += 1
+        if "tripinfo" in self.outputs:
+            for tripinfo in self.tails["tripinfo"].poll():
+                values = dict(tripinfo.attrib)
+                emissions = tripinfo.find("emissions")
+                if emissions is not None:
+                    values.update(emissions.attrib)
+                for name, attribute in TRIP_ATTRIBUTES.items():
+                    self.trip_sums[name] += float(values.get(attribute, 0.))
+                self.trips += 1
+                # unfinished trips are written with arrival -1
+                self.arrived += float(values.get("arrival", -1)) >= 0
+        return self
+
+    def _add_timestep(self, timestep):
+        time = float(timestep.get("time"))
+        vehicles = [vehicle.attrib for vehicle in timestep]
+        self.vehicle_ids = [vehicle["id"] for vehicle in vehicles]
+        self.vehicle_lanes = np.array([vehicle.get("lane", "") for vehicle in vehicles], dtype=str)
+        self.vehicle_emissions = np.array([[vehicle[name] for name in EMISSION_ATTRIBUTES] for vehicle in vehicles],
+                                          dtype=np.float64).reshape(len(vehicles), len(EMISSION_ATTRIBUTES))
+        self.vehicle_waiting = np.array([vehicle["waiting"] for vehicle in vehicles], dtype=np.float64)
+        # the values are per second, the step length is the time since the previous step (1s before the first)
+        step_length = time - self.time if self.time is not None else 1.
+        self.total_emissions += self.vehicle_emissions.sum(axis=0) * step_length
+        self.time = time
+
+    def get_emissions(self):
+        """Return the mean emissions of all vehicles of the last step, see ``traci_helpers.get_emissions``.
+
+        :return: Five return values: mean NOx, PMx, CO2, CO and HC emissions in mg/s
+        :rtype: float, float, float, float, float
+        """
+        means = self.vehicle_emissions.mean(axis=0) if len(self.vehicle_ids) else np.full(len(EMISSION_ATTRIBUTES), np.nan)
+        return tuple(float(mean) for mean in means)
+
+    def get_network_waiting_time(self):
+        """Return the mean waiting time of all vehicles of the last step, see ``traci_helpers.getnetworkwaitingtime``.
+
+        :return: Mean waiting time in seconds
+        :rtype: float
+        """
+        return float(self.vehicle_waiting.mean()) if len(self.vehicle_ids) else np.nan
+
+    def get_waiting_time(self, lanes):
+        """Return the summed waiting time of the vehicles on the given lanes in the last step,
+        see ``traci_helpers.get_waiting_time``.
+
+        :param lanes: List of lane IDs
+        :type lanes: list
+        :return: Sum of the waiting times in seconds
+        :rtype: float
+        """
+        return float(self.vehicle_waiting[np.isin(self.vehicle_lanes, list(lanes))].sum())
+
+    def mean_queue_length(self):
+        """Return the mean number of halting vehicles over all steps of the summary output read so far."""
+        return self.halting_sum / self.summary_steps if self.summary_steps else 0.
+
+    def trip_means(self):
+        """Return the means over the tripinfos read so far.
+
+        :return: Mean of every attribute of ``TRIP_ATTRIBUTES``: waiting time, time loss and duration in seconds and CO2 in mg
+        :rtype: dict
+        """
+        return {name: value / self.trips if self.trips else 0. for name, value in self.trip_sums.items()}
+
+    def close(self):
+        for tail in self.tails.values():
+            tail.close()
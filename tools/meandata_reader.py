@@ -0,0 +1,235 @@
+"""
+Columnar reader for SUMO meandata output (edgeData, laneData)
+"""
+
+import os
+import hashlib
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# increase whenever the stored arrays change, older cache entries are then ignored
+CACHE_VERSION = 2
+
+ARRAY_NAMES = (
+    # (intervals x elements x attributes) float32, NaN where an element has no value in an interval
+    "data",
+    # begin, end and meandata id of every interval
+    "begin", "end", "interval_ids",
+    # IDs of the edges or lanes along the second axis and attribute names along the third axis
+    "ids", "attributes",
+)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def read_meandata(meandata_xml_path: str, element: str = "edge", attributes: list = None, begin: float = None,
+                  end: float = None, interval_id: str = None, element_ids=None):
+    """Read a meandata output file (edgeData or laneData) in one streaming pass into a dense array.
+
+    Only the selected attributes of the selected intervals are converted, all others are skipped while parsing.
+    Reading stops at the first interval beginning at or after ``end``, as SUMO writes intervals in time order.
+
+    :param meandata_xml_path: Path to the meandata xml file
+    :type meandata_xml_path: str
+    :param element: "edge" for edgeData, "lane" for the lanes of laneData
+    :type element: str
+    :param attributes: Names of the attributes to read, defaults to all attributes in the order they appear
+    :type attributes: list
+    :param begin: Only read intervals beginning at or after this time
+    :type begin: float
+    :param end: Only read intervals beginning before this time
+    :type end: float
+    :param interval_id: Only read intervals of the meandata definition with this id
+    :type interval_id: str
+    :param element_ids: IDs the second axis is aligned to, e.g. ``NetTopology.edge_ids``, defaults to the IDs in the
+        order they appear; elements that are not listed are dropped
+    :type element_ids: list
+    :return: Dictionary of the arrays listed in ``ARRAY_NAMES``
+    :rtype: dict
+    """
+    fixed_ids = element_ids is not None
+    id_pos = {element_id: idx for idx, element_id in enumerate(np.asarray(element_ids).tolist())} if fixed_ids else {}
+    fixed_attributes = attributes is not None
+    attribute_names = list(attributes) if fixed_attributes else []
+    # names already in attribute_names and the id, elements may carry any subset of the attributes
+    known_names = set(attribute_names) | {"id"}
+    intervals = []
+    blocks = []
+    rows = cols = None
+    selected = False
+    context = ET.iterparse(meandata_xml_path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event == "start":
+            if elem.tag == "interval":
+                interval_begin = float(elem.get("begin"))
+                if end is not None and interval_begin >= end:
+                    break
+                selected = (begin is None or interval_begin >= begin) and (interval_id is None or elem.get("id") == interval_id)
+                if selected:
+                    intervals.append((interval_begin, float(elem.get("end")), elem.get("id", "")))
+                    rows, cols = [], []
+            continue
+        if elem.tag == element and selected:
+            values = elem.attrib
+            idx = id_pos.get(values.get("id"))
+            if idx is None:
+                if fixed_ids:
+                    continue
+                idx = id_pos[values.get("id")] = len(id_pos)
+            if not fixed_attributes and not known_names.issuperset(values):
+                new_names = [name for name in values if name not in known_names]
+                attribute_names += new_names
+                known_names.update(new_names)
+            cols.append(idx)
+            rows.append([_to_float(values[name]) if name in values else np.nan for name in attribute_names])
+        elif elem.tag == "interval":
+            if selected:
+                width = len(attribute_names)
+                block = np.full((len(rows), width), np.nan, dtype=np.float32)
+                for row_idx, row in enumerate(rows):
+                    block[row_idx, :len(row)] = row
+                blocks.append((np.array(cols, dtype=np.int64), block))
+            selected = False
+            # drop everything that has been processed so far
+            root.clear()
+
+    data = np.full((len(intervals), len(id_pos), len(attribute_names)), np.nan, dtype=np.float32)
+    for interval_idx, (cols, block) in enumerate(blocks):
+        # attributes that appeared later are missing in earlier blocks and stay NaN
+        data[interval_idx, cols, :block.shape[1]] = block
+    ids = np.asarray(element_ids) if fixed_ids else list(id_pos)
+    return {
+        "data": data,
+        "begin": np.array([interval[0] for interval in intervals], dtype=np.float64),
+        "end": np.array([interval[1] for interval in intervals], dtype=np.float64),
+        "interval_ids": np.array([interval[2] for interval in intervals], dtype=str),
+        "ids": np.array(ids, dtype=str),
+        "attributes": np.array(attribute_names, dtype=str),
+    }
+
+
+def select_meandata(meandata: dict, attributes: list = None, begin: float = None, end: float = None,
+                    interval_id: str = None, element_ids=None):
+    """Select attributes, a time window and elements of meandata as returned by :func:`read_meandata`.
+    A contiguous time window of all attributes is a view, so memory-mapped arrays are not read into memory.
+
+    :param meandata: Dictionary of the arrays listed in ``ARRAY_NAMES``
+    :type meandata: dict
+    :param attributes: Names of the attributes to keep in this order, missing attributes are NaN, defaults to all
+    :type attributes: list
+    :param begin: Only keep intervals beginning at or after this time
+    :type begin: float
+    :param end: Only keep intervals beginning before this time
+    :type end: float
+    :param interval_id: Only keep intervals of the meandata definition with this id
+    :type interval_id: str
+    :param element_ids: IDs the second axis is aligned to, missing elements are NaN
+    :type element_ids: list
+    :return: Dictionary of the arrays listed in ``ARRAY_NAMES``
+    :rtype: dict
+    """
+    mask = np.ones(len(meandata["begin"]), dtype=bool)
+    if begin is not None:
+        mask &= meandata["begin"] >= begin
+    if end is not None:
+        mask &= meandata["begin"] < end
+    if interval_id is not None:
+        mask &= meandata["interval_ids"] == interval_id
+    selection = np.flatnonzero(mask)
+    if len(selection) and selection[-1] - selection[0] + 1 == len(selection):
+        selection = slice(selection[0], selection[-1] + 1)
+    data = meandata["data"][selection]
+    result = {name: meandata[name][selection] for name in ("begin", "end", "interval_ids")}
+
+    if element_ids is not None:
+        element_ids = np.asarray(element_ids)
+        id_pos = {element_id: idx for idx, element_id in enumerate(meandata["ids"].tolist())}
+        positions = np.array([id_pos.get(element_id, -1) for element_id in element_ids.tolist()], dtype=np.int64)
+        if (positions < 0).any():
+            # the padding column at index -1 yields NaN for unknown elements
+            data = np.concatenate([data, np.full(data.shape[:1] + (1,) + data.shape[2:], np.nan, dtype=data.dtype)], axis=1)
+        data = data[:, positions]
+        result["ids"] = element_ids.astype(str)
+    else:
+        result["ids"] = meandata["ids"]
+
+    if attributes is not None:
+        attribute_pos = {name: idx for idx, name in enumerate(meandata["attributes"].tolist())}
+        positions = np.array([attribute_pos.get(name, -1) for name in attributes], dtype=np.int64)
+        if (positions < 0).any():
+            data = np.concatenate([data, np.full(data.shape[:2] + (1,), np.nan, dtype=data.dtype)], axis=2)
+        if not np.array_equal(positions, np.arange(len(attribute_pos))):
+            data = data[:, :, positions]
+        result["attributes"] = np.array(attributes, dtype=str)
+    else:
+        result["attributes"] = meandata["attributes"]
+    result["data"] = data
+    return result
+
+
+def cache_path(meandata_xml_path: str, element: str = "edge", cache_dir: str = None):
+    """Return the cache directory of a meandata file.
+    The key is derived from the absolute path, size and modification time of the file and the element,
+    so a new simulation run writing the same file invalidates its entry.
+
+    :param meandata_xml_path: Path to the meandata xml file
+    :type meandata_xml_path: str
+    :param element: "edge" or "lane", see :func:`read_meandata`
+    :type element: str
+    :param cache_dir: Root directory of the cache, defaults to ``$XDG_CACHE_HOME/traffic-simulation/meandata`` (``~/.cache/...``)
+    :type cache_dir: str
+    :return: Path of the cache entry
+    :rtype: str
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser(os.path.join("~", ".cache"))), "traffic-simulation", "meandata")
+    meandata_xml_path = os.path.realpath(meandata_xml_path)
+    stat = os.stat(meandata_xml_path)
+    key = f"{CACHE_VERSION}:{meandata_xml_path}:{stat.st_size}:{stat.st_mtime_ns}:{element}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(meandata_xml_path)}-{digest}")
+
+
+def load_meandata(meandata_xml_path: str, element: str = "edge", attributes: list = None, begin: float = None,
+                  end: float = None, interval_id: str = None, element_ids=None, cache_dir: str = None, mmap: bool = True):
+    """Load a meandata output file, parsing the xml file only if it is not cached yet.
+
+    The first call reads all intervals and attributes with :func:`read_meandata` and stores every array as its own
+    ``.npy`` file, later calls memory-map them and only apply the selection with :func:`select_meandata`.
+
+    :param meandata_xml_path: Path to the meandata xml file
+    :type meandata_xml_path: str
+    :param element: "edge" for edgeData, "lane" for the lanes of laneData
+    :type element: str
+    :param cache_dir: Root directory of the cache, see :func:`cache_path`
+    :type cache_dir: str
+    :param mmap: Whether to memory-map the cached arrays instead of reading them into memory
+    :type mmap: bool
+    :return: Dictionary of the arrays listed in ``ARRAY_NAMES``, see :func:`select_meandata` for the other parameters
+    :rtype: dict
+    """
+    path = cache_path(meandata_xml_path, element, cache_dir)
+    if not os.path.isdir(path):
+        arrays = read_meandata(meandata_xml_path, element)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write into a temporary directory first, so concurrent readers never see a partial entry
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process stored the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    mmap_mode = "r" if mmap else None
+    meandata = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode if name == "data" else None) for name in ARRAY_NAMES}
+    return select_meandata(meandata, attributes, begin, end, interval_id, element_ids)
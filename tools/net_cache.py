@@ -0,0 +1,309 @@
+"""
+Persistent on-disk cache of parsed SUMO network topology
+"""
+
+import os
+import hashlib
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from get_safe_phases import foe_matrix
+
+# increase whenever the stored arrays change, older cache entries are then ignored
+CACHE_VERSION = 2
+
+ARRAY_NAMES = (
+    # junctions
+    "junction_ids", "junction_type", "junction_x", "junction_y",
+    # non-internal edges, edge_from/edge_to index junction_ids
+    "edge_ids", "edge_from", "edge_to", "edge_lane_count", "edge_length",
+    # shapes of non-internal edges as (x, y) points, CSR layout: edge_shape[edge_shape_ptr[i]:edge_shape_ptr[i + 1]]
+    "edge_shape_ptr", "edge_shape",
+    # lanes of non-internal edges, lane_edge indexes edge_ids
+    "lane_ids", "lane_edge", "lane_index", "lane_length", "lane_speed",
+    # controlled lanes of each tls in link index order, CSR layout: tls_lane[tls_lane_ptr[i]:tls_lane_ptr[i + 1]]
+    "tls_ids", "tls_lane_ptr", "tls_lane", "tls_link_index",
+    # foe matrices of traffic light junctions, flattened and concatenated: foe_data[foe_ptr[i]:foe_ptr[i + 1]]
+    "foe_junction_ids", "foe_ptr", "foe_size", "foe_data",
+)
+
+
+def edge_shape(lanes):
+    """Return the shape of an edge like ``sumolib``: the shape of the middle lane for an odd number of lanes,
+    otherwise the point-wise mean of all lane shapes.
+
+    :param lanes: Lane elements of the edge
+    :type lanes: list
+    :return: Points of the shape
+    :rtype: np.ndarray
+    """
+    shapes = [np.array([point.split(",")[:2] for point in lane.get('shape', '').split()], dtype=np.float64).reshape(-1, 2)
+              for lane in lanes]
+    if not shapes:
+        return np.zeros((0, 2))
+    if len(shapes) % 2 == 1:
+        return shapes[len(shapes) // 2]
+    points = min(len(shape) for shape in shapes)
+    return np.mean([shape[:points] for shape in shapes], axis=0)
+
+
+def parse_net(net_xml_path: str):
+    """Parse a SUMO net xml file in a single streaming pass into compact NumPy arrays.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :return: Dictionary of all arrays listed in ``ARRAY_NAMES``
+    :rtype: dict
+    """
+    junctions = []
+    edges = []
+    lanes = []
+    foes = {}
+    tls_links = {}
+    edge_shapes = []
+    context = ET.iterparse(net_xml_path, events=("start", "end"))
+    _, root = next(context)
+    depth = 1
+    for event, elem in context:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == 'junction' and elem.get('type') != 'internal':
+            junctions.append((elem.get('id'), elem.get('type'), float(elem.get('x')), float(elem.get('y'))))
+            if elem.get('type') == 'traffic_light':
+                requests = [(int(request.get('index')), request.get('foes')) for request in elem.iter('request')]
+                foes[elem.get('id')] = foe_matrix(requests)
+        elif elem.tag == 'edge' and elem.get('function') != 'internal':
+            edge_lanes = elem.findall('lane')
+            for lane in edge_lanes:
+                lanes.append((lane.get('id'), len(edges), int(lane.get('index')), float(lane.get('length')), float(lane.get('speed'))))
+            length = np.mean([float(lane.get('length')) for lane in edge_lanes]) if edge_lanes else 0.
+            edges.append((elem.get('id'), elem.get('from'), elem.get('to'), len(edge_lanes), length))
+            edge_shapes.append(edge_shape(edge_lanes))
+        elif elem.tag == 'connection' and elem.get('tl') is not None:
+            lane_id = f"{elem.get('from')}_{elem.get('fromLane')}"
+            tls_links.setdefault(elem.get('tl'), []).append((int(elem.get('linkIndex')), lane_id))
+        # drop everything that has been processed so far
+        root.clear()
+
+    junction_pos = {junction[0]: idx for idx, junction in enumerate(junctions)}
+    lane_pos = {lane[0]: idx for idx, lane in enumerate(lanes)}
+    tls_ids = sorted(tls_links)
+    tls_lane_ptr = np.zeros(len(tls_ids) + 1, dtype=np.int64)
+    tls_lane = []
+    tls_link_index = []
+    for idx, tls in enumerate(tls_ids):
+        links = sorted(tls_links[tls])
+        tls_link_index += [link_index for link_index, _ in links]
+        tls_lane += [lane_pos[lane_id] for _, lane_id in links]
+        tls_lane_ptr[idx + 1] = len(tls_lane)
+    foe_junction_ids = list(foes)
+    foe_size = np.array([foes[junction].shape[0] for junction in foe_junction_ids], dtype=np.int64)
+
+    return {
+        "junction_ids": np.array([junction[0] for junction in junctions], dtype=str),
+        "junction_type": np.array([junction[1] for junction in junctions], dtype=str),
+        "junction_x": np.array([junction[2] for junction in junctions], dtype=np.float64),
+        "junction_y": np.array([junction[3] for junction in junctions], dtype=np.float64),
+        "edge_ids": np.array([edge[0] for edge in edges], dtype=str),
+        # -1 marks edges starting or ending outside of the known junctions
+        "edge_from": np.array([junction_pos.get(edge[1], -1) for edge in edges], dtype=np.int32),
+        "edge_to": np.array([junction_pos.get(edge[2], -1) for edge in edges], dtype=np.int32),
+        "edge_lane_count": np.array([edge[3] for edge in edges], dtype=np.int16),
+        "edge_length": np.array([edge[4] for edge in edges], dtype=np.float64),
+        "edge_shape_ptr": np.concatenate(([0], np.cumsum([len(shape) for shape in edge_shapes]))).astype(np.int64),
+        "edge_shape": np.concatenate(edge_shapes + [np.zeros((0, 2))]).astype(np.float64),
+        "lane_ids": np.array([lane[0] for lane in lanes], dtype=str),
+        "lane_edge": np.array([lane[1] for lane in lanes], dtype=np.int32),
+        "lane_index": np.array([lane[2] for lane in lanes], dtype=np.int16),
+        "lane_length": np.array([lane[3] for lane in lanes], dtype=np.float64),
+        "lane_speed": np.array([lane[4] for lane in lanes], dtype=np.float64),
+        "tls_ids": np.array(tls_ids, dtype=str),
+        "tls_lane_ptr": tls_lane_ptr,
+        "tls_lane": np.array(tls_lane, dtype=np.int32),
+        "tls_link_index": np.array(tls_link_index, dtype=np.int32),
+        "foe_junction_ids": np.array(foe_junction_ids, dtype=str),
+        "foe_ptr": np.concatenate(([0], np.cumsum(foe_size ** 2))).astype(np.int64),
+        "foe_size": foe_size,
+        "foe_data": np.concatenate([foes[junction].ravel() for junction in foe_junction_ids] + [np.zeros(0, dtype=np.uint8)]),
+    }
+
+
+def cache_path(net_xml_path: str, cache_dir: str = None):
+    """Return the cache directory of a net file.
+    The key is derived from the absolute path, size and modification time of the file, so editing the net invalidates its entry.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :param cache_dir: Root directory of the cache, defaults to ``$XDG_CACHE_HOME/traffic-simulation/net`` (``~/.cache/...``)
+    :type cache_dir: str
+    :return: Path of the cache entry
+    :rtype: str
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser(os.path.join("~", ".cache"))), "traffic-simulation", "net")
+    net_xml_path = os.path.realpath(net_xml_path)
+    stat = os.stat(net_xml_path)
+    key = f"{CACHE_VERSION}:{net_xml_path}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{os.path.basename(net_xml_path)}-{digest}")
+
+
+def load_net(net_xml_path: str, cache_dir: str = None, mmap: bool = True):
+    """Load the topology of a SUMO net, parsing the net xml file only if it is not cached yet.
+
+    Each array is stored as its own ``.npy`` file. With ``mmap`` the arrays are memory-mapped read-only,
+    so processes loading the same net share the pages instead of holding their own copies.
+
+    :param net_xml_path: Path to SUMO net xml file
+    :type net_xml_path: str
+    :param cache_dir: Root directory of the cache, see :func:`cache_path`
+    :type cache_dir: str
+    :param mmap: Whether to memory-map the cached arrays instead of reading them into memory
+    :type mmap: bool
+    :return: The network topology
+    :rtype: NetTopology
+    """
+    path = cache_path(net_xml_path, cache_dir)
+    if not os.path.isdir(path):
+        arrays = parse_net(net_xml_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write into a temporary directory first, so concurrent readers never see a partial entry
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process stored the same entry in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    mmap_mode = "r" if mmap else None
+    return NetTopology({name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES})
+
+
+class NetTopology:
+    """Compact array representation of a SUMO net as stored by :func:`load_net`.
+    All arrays listed in ``ARRAY_NAMES`` are available as attributes.
+    """
+
+    def __init__(self, arrays):
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        self._junction_pos = None
+        self._edge_pos = None
+        self._lane_pos = None
+        self._foe_pos = None
+        self._tls_pos = None
+        self._lane_direction = None
+        self._lane_tls = None
+
+    @property
+    def junction_pos(self):
+        """Dictionary mapping junction IDs to their index in ``junction_ids``."""
+        if self._junction_pos is None:
+            self._junction_pos = {junction: idx for idx, junction in enumerate(self.junction_ids.tolist())}
+        return self._junction_pos
+
+    @property
+    def edge_pos(self):
+        """Dictionary mapping edge IDs to their index in ``edge_ids``."""
+        if self._edge_pos is None:
+            self._edge_pos = {edge: idx for idx, edge in enumerate(self.edge_ids.tolist())}
+        return self._edge_pos
+
+    @property
+    def lane_pos(self):
+        """Dictionary mapping lane IDs to their index in ``lane_ids``."""
+        if self._lane_pos is None:
+            self._lane_pos = {lane: idx for idx, lane in enumerate(self.lane_ids.tolist())}
+        return self._lane_pos
+
+    @property
+    def lane_direction(self):
+        """Side from which each lane approaches its downstream junction, derived from the junction coordinates:
+        0 north, 1 east, 2 south, 3 west and -1 for lanes without both junctions.
+        For axis-parallel grids this is exact, otherwise the vertical movement takes precedence.
+        """
+        if self._lane_direction is None:
+            lane_from = self.edge_from[self.lane_edge]
+            lane_to = self.edge_to[self.lane_edge]
+            from_x, from_y = self.junction_x[lane_from], self.junction_y[lane_from]
+            to_x, to_y = self.junction_x[lane_to], self.junction_y[lane_to]
+            direction = np.select([from_y > to_y, from_x > to_x, from_y < to_y, from_x < to_x], [0, 1, 2, 3], -1).astype(np.int8)
+            direction[(lane_from < 0) | (lane_to < 0)] = -1
+            self._lane_direction = direction
+        return self._lane_direction
+
+    @property
+    def lane_tls(self):
+        """Index in ``junction_ids`` of the traffic light junction each lane leads to, -1 if it leads to another junction."""
+        if self._lane_tls is None:
+            lane_to = self.edge_to[self.lane_edge]
+            is_tls = np.append(self.junction_type == "traffic_light", False)
+            self._lane_tls = np.where(is_tls[lane_to], lane_to, -1).astype(np.int32)
+        return self._lane_tls
+
+    def grid_index(self, junction_mask=None):
+        """Return the column and row of junctions in a grid network.
+        Columns are the ranks of the distinct x and rows those of the distinct y coordinates,
+        which reproduces the letter and number of netgenerate junction IDs (e.g. B3 is column 1, row 3).
+
+        :param junction_mask: Boolean mask of the junctions forming the grid, defaults to all junctions
+        :type junction_mask: np.ndarray
+        :return: Columns, rows and the shape (columns, rows) of the grid
+        :rtype: np.ndarray, np.ndarray, tuple
+        """
+        if junction_mask is None:
+            junction_mask = np.ones(len(self.junction_ids), dtype=bool)
+        columns, column_idx = np.unique(self.junction_x[junction_mask], return_inverse=True)
+        rows, row_idx = np.unique(self.junction_y[junction_mask], return_inverse=True)
+        return column_idx.ravel(), row_idx.ravel(), (len(columns), len(rows))
+
+    def get_foes(self, junction_id: str):
+        """Return the foe matrix of a traffic light junction.
+
+        :param junction_id: SUMO junction ID
+        :type junction_id: str
+        :return: Binary foe matrix where entry [i, j] is 1 if connection j is a foe of connection i
+        :rtype: np.ndarray
+        """
+        if self._foe_pos is None:
+            self._foe_pos = {junction: idx for idx, junction in enumerate(self.foe_junction_ids.tolist())}
+        idx = self._foe_pos[junction_id]
+        size = int(self.foe_size[idx])
+        return np.asarray(self.foe_data[self.foe_ptr[idx]:self.foe_ptr[idx + 1]]).reshape(size, size)
+
+    def get_controlled_lanes(self, tls_id: str):
+        """Return the lanes controlled by a tls in link index order, like ``traci.trafficlight.getControlledLanes``.
+
+        :param tls_id: ID of the tls
+        :type tls_id: str
+        :return: List of lane IDs
+        :rtype: list
+        """
+        if self._tls_pos is None:
+            self._tls_pos = {tls: idx for idx, tls in enumerate(self.tls_ids.tolist())}
+        idx = self._tls_pos[tls_id]
+        return self.lane_ids[self.tls_lane[self.tls_lane_ptr[idx]:self.tls_lane_ptr[idx + 1]]].tolist()
+
+    def get_edge_shapes(self):
+        """Return the shape of every non-internal edge, e.g. as segments of a matplotlib ``LineCollection``.
+
+        :return: List of (points, 2) arrays in ``edge_ids`` order
+        :rtype: list
+        """
+        return np.split(np.asarray(self.edge_shape), np.asarray(self.edge_shape_ptr[1:-1]))
+
+    def get_lane_lengths(self):
+        """Return the length of every non-internal lane.
+
+        :return: Dictionary where lane IDs are the keys and lengths are the values
+        :rtype: dict
+        """
+        return dict(zip(self.lane_ids.tolist(), self.lane_length.tolist()))
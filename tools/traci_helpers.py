@@ -10,6 +10,15 @@ import traci
 import numpy as np
 import inspect
 
+# emission variables in the order returned by get_emissions
+EMISSION_VARIABLES = (
+    traci.constants.VAR_NOXEMISSION,
+    traci.constants.VAR_PMXEMISSION,
+    traci.constants.VAR_CO2EMISSION,
+    traci.constants.VAR_COEMISSION,
+    traci.constants.VAR_HCEMISSION,
+)
+
 """
 GET LANE INSIGHTS
 ---
@@ -28,13 +37,15 @@ def get_lane_density(laneID):
     density = num / traci.lane.getLength(laneID)
     return density
 
-def get_state(tlsID):
+def get_state(tlsID, tracker=None):
     """For a given tls return the average lane density for each 
     controlled lane, 
     i.e. number of vehicles in relation to the lane length.
 
     :param tlsID: ID of the SUMO traffic light system for which lanes to calculate the densities.
     :type tlsID: str
+    :param tracker: Tracker of the controlled lanes, its densities of the last update are used instead of querying every lane
+    :type tracker: LaneDensityTracker
     :return: List of lane densities
     :rtype: list
     """
@@ -45,11 +56,14 @@ def get_state(tlsID):
         return density
     
     controlled_lanes = traci.trafficlight.getControlledLanes(tlsID)
+    if tracker is not None:
+        lane_densities = tracker.get_density(controlled_lanes)
+    else:
+        lane_densities = [get_lane_density(lane) for lane in controlled_lanes]
     all_lanes_density = dict()
     lane_state = []
-    for lane in controlled_lanes:
+    for lane, lane_density in zip(controlled_lanes, lane_densities):
         lane_key = lane.split('_')[0]
-        lane_density = get_lane_density(lane)
         if lane not in all_lanes_density.keys():
             all_lanes_density[lane_key] = [lane_density]
         else:
@@ -106,6 +120,122 @@ def getqueuelen(junction):
     return qlen
 
 
+"""
+TRACK LANE INSIGHTS
+---
+Statistics of lanes maintained over the course of a simulation.
+"""
+class LaneDensityTracker:
+    """Tracks the density (vehicles per meter) of a fixed set of lanes over the simulation.
+
+    Lane lengths are fetched once, the vehicle numbers of all lanes are read in one batch from subscriptions
+    (see :func:`get_subscription_values`) on every :meth:`update`.
+    The statistics are updated incrementally, so memory does not grow with the number of steps:
+    running mean and variance, an exponentially weighted moving average, the mean over the last ``window`` updates
+    and a density histogram per lane from which percentiles are read.
+
+    :param lanes: IDs of the lanes to track, defaults to all lanes of the running simulation
+    :type lanes: list
+    :param lengths: Lengths of the lanes (e.g. from ``net_cache.NetTopology.get_lane_lengths``), fetched via TraCI if not given
+    :type lengths: list
+    :param alpha: Smoothing factor of the exponentially weighted moving average
+    :type alpha: float
+    :param window: Number of updates the windowed mean is computed over
+    :type window: int
+    :param max_density: Upper bound of the density histogram, higher densities fall into the last bin
+    :type max_density: float
+    :param bins: Number of histogram bins, i.e. the resolution of the percentiles is ``max_density / bins``
+    :type bins: int
+    """
+
+    def __init__(self, lanes=None, lengths=None, alpha=0.1, window=100, max_density=0.2, bins=200):
+        self.lanes = list(traci.lane.getIDList() if lanes is None else lanes)
+        self.lane_pos = {lane: idx for idx, lane in enumerate(self.lanes)}
+        if lengths is None:
+            lengths = [traci.lane.getLength(lane) for lane in self.lanes]
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.alpha = alpha
+        self.max_density = max_density
+
+        n_lanes = len(self.lanes)
+        self.steps = 0
+        self.density = np.zeros(n_lanes)
+        self.mean = np.zeros(n_lanes)
+        self.ewma = np.zeros(n_lanes)
+        self._m2 = np.zeros(n_lanes)
+        self._window = np.zeros((window, n_lanes))
+        self._window_sum = np.zeros(n_lanes)
+        self._histogram = np.zeros((n_lanes, bins), dtype=np.int64)
+        # running mean over the steps of the mean density of all lanes
+        self.network_mean = 0.
+
+    def update(self, vehicle_numbers=None):
+        """Update the statistics with the vehicle numbers of the current simulation step.
+
+        :param vehicle_numbers: Number of vehicles per lane, read from subscriptions if not given
+        :type vehicle_numbers: np.ndarray
+        :return: Density of each lane
+        :rtype: np.ndarray
+        """
+        if vehicle_numbers is None:
+            vehicle_numbers = get_subscription_values(traci.lane, self.lanes, (traci.constants.LAST_STEP_VEHICLE_NUMBER,))[:, 0]
+        np.divide(vehicle_numbers, self.lengths, out=self.density)
+        density = self.density
+        self.steps += 1
+
+        # Welford's algorithm for the running mean and variance
+        delta = density - self.mean
+        self.mean += delta / self.steps
+        self._m2 += delta * (density - self.mean)
+        if self.steps == 1:
+            self.ewma[:] = density
+        else:
+            self.ewma += self.alpha * (density - self.ewma)
+        slot = (self.steps - 1) % len(self._window)
+        self._window_sum += density - self._window[slot]
+        self._window[slot] = density
+        bins = self._histogram.shape[1]
+        bin_idx = np.minimum((density / self.max_density * bins).astype(np.int64), bins - 1)
+        self._histogram.ravel()[np.arange(len(density)) * bins + bin_idx] += 1
+        self.network_mean += (density.mean() - self.network_mean) / self.steps if len(density) else 0.
+        return density
+
+    @property
+    def variance(self):
+        """Running variance of the density of each lane."""
+        return self._m2 / max(self.steps, 1)
+
+    @property
+    def window_mean(self):
+        """Mean density of each lane over the last ``window`` updates."""
+        return self._window_sum / max(min(self.steps, len(self._window)), 1)
+
+    def percentiles(self, q=(50, 90, 99)):
+        """Return density percentiles of each lane, estimated from the histogram (upper bin edges).
+
+        :param q: Percentiles between 0 and 100
+        :type q: tuple
+        :return: Array of shape (lanes, len(q))
+        :rtype: np.ndarray
+        """
+        bins = self._histogram.shape[1]
+        cumulative = np.cumsum(self._histogram, axis=1)
+        targets = np.ceil(np.asarray(q, dtype=float) / 100. * max(self.steps, 1))
+        # first bin whose cumulative count reaches the target rank
+        bin_idx = np.stack([(cumulative < np.maximum(target, 1)).sum(axis=1) for target in targets], axis=1)
+        return (np.minimum(bin_idx, bins - 1) + 1) * self.max_density / bins
+
+    def get_density(self, lanes):
+        """Return the densities of the last update for the given lanes.
+
+        :param lanes: IDs of tracked lanes
+        :type lanes: list
+        :return: Density of each given lane
+        :rtype: np.ndarray
+        """
+        return self.density[[self.lane_pos[lane] for lane in lanes]]
+
+
 """
 GET Traffic Light Insights
 ---
@@ -200,3 +330,110 @@ def getnetworkwaitingtime(vehicles):
         waiting_time += traci.vehicle.getWaitingTime(vehID)
     return waiting_time/len(vehicles)
 
+"""
+BATCH QUERIES
+---
+Batch variants of the functions above. They accept whole lists of lanes/vehicles and return NumPy arrays.
+The values are read from TraCI variable subscriptions, which SUMO sends along with every simulation step,
+so only objects queried for the first time (e.g. newly departed vehicles) cost a round trip.
+"""
+def get_subscription_results(domain, object_ids, variables):
+    """Return the subscription results of a list of objects of a TraCI domain.
+    Objects that are not subscribed to all given variables are (re)subscribed first, 
+    which covers new objects as well as subscriptions that ended with a restart of SUMO.
+
+    :param domain: TraCI domain, e.g. ``traci.lane`` or ``traci.vehicle``
+    :type domain: traci.domain.Domain
+    :param object_ids: IDs of the objects
+    :type object_ids: list
+    :param variables: TraCI variable constants, e.g. ``traci.constants.VAR_WAITING_TIME``
+    :type variables: tuple
+    :return: Subscription results in the order of ``object_ids``, each a dictionary mapping the variables to their value
+    :rtype: list
+    """
+    results = domain.getAllSubscriptionResults()
+    subscribed = False
+    for object_id in object_ids:
+        values = results.get(object_id, {})
+        if any(variable not in values for variable in variables):
+            # a new subscription replaces the old one, so its variables are kept
+            domain.subscribe(object_id, tuple(set(values) | set(variables)))
+            subscribed = True
+    if subscribed:
+        results = domain.getAllSubscriptionResults()
+    return [results[object_id] for object_id in object_ids]
+
+def get_subscription_values(domain, object_ids, variables):
+    """Return numeric variables of a list of objects of a TraCI domain as array, see :func:`get_subscription_results`.
+
+    :param domain: TraCI domain, e.g. ``traci.lane`` or ``traci.vehicle``
+    :type domain: traci.domain.Domain
+    :param object_ids: IDs of the objects
+    :type object_ids: list
+    :param variables: TraCI variable constants, e.g. ``traci.constants.VAR_WAITING_TIME``
+    :type variables: tuple
+    :return: Array of shape (objects, variables)
+    :rtype: np.ndarray
+    """
+    results = get_subscription_results(domain, object_ids, variables)
+    values = np.zeros((len(object_ids), len(variables)))
+    for idx, result in enumerate(results):
+        values[idx] = [result[variable] for variable in variables]
+    return values
+
+def get_vehicle_numbers_batch(lanes):
+    """Batch variant of :func:`get_vehicle_numbers`, 
+    for each given lane return the number of vehicles further than 10 m on that lane.
+
+    :param lanes: IDs of the SUMO lanes for which to count the number of vehicles.
+    :type lanes: list
+    :return: Number of vehicles per lane in the order of ``lanes``
+    :rtype: np.ndarray
+    """
+    results = get_subscription_results(traci.lane, lanes, (traci.constants.LAST_STEP_VEHICLE_ID_LIST,))
+    lane_vehicles = [result[traci.constants.LAST_STEP_VEHICLE_ID_LIST] for result in results]
+    positions = get_subscription_values(traci.vehicle, [vehicle for vehicles in lane_vehicles for vehicle in vehicles],
+                                        (traci.constants.VAR_LANEPOSITION,))[:, 0]
+    lane_index = np.repeat(np.arange(len(lanes)), [len(vehicles) for vehicles in lane_vehicles])
+    return np.bincount(lane_index[positions > 10], minlength=len(lanes))
+
+def get_waiting_time_batch(lanes):
+    """Batch variant of :func:`get_waiting_time`, 
+    uses the lane aggregate of the waiting time instead of summing up every single vehicle.
+
+    :param lanes: List of lane IDs
+    :type lanes: list
+    :return: Total waiting time of all vehicles on each lane in the order of ``lanes``, its sum equals :func:`get_waiting_time`
+    :rtype: np.ndarray
+    """
+    return get_subscription_values(traci.lane, lanes, (traci.constants.VAR_WAITING_TIME,))[:, 0]
+
+def get_lane_emissions_batch(lanes):
+    """Return the emissions of all vehicles on each given lane, using the lane aggregates of SUMO.
+
+    :param lanes: List of lane IDs
+    :type lanes: list
+    :return: Array of shape (lanes, 5) with the summed NOx, PMx, CO2, CO, HC emissions per lane
+    :rtype: np.ndarray
+    """
+    return get_subscription_values(traci.lane, lanes, EMISSION_VARIABLES)
+
+def get_emissions_batch(vehicles):
+    """Batch variant of :func:`get_emissions`.
+
+    :param vehicles: List of vehicle IDs
+    :type vehicles: list
+    :return: Array of shape (vehicles, 5) with the NOx, PMx, CO2, CO, HC emissions of each vehicle, its column means equal :func:`get_emissions`
+    :rtype: np.ndarray
+    """
+    return get_subscription_values(traci.vehicle, vehicles, EMISSION_VARIABLES)
+
+def getnetworkwaitingtime_batch(vehicles):
+    """Batch variant of :func:`getnetworkwaitingtime`.
+
+    :param vehicles: List of vehicle IDs.
+    :type vehicles: list
+    :return: Waiting time of each vehicle in the order of ``vehicles``, its mean equals :func:`getnetworkwaitingtime`
+    :rtype: np.ndarray
+    """
+    return get_subscription_values(traci.vehicle, vehicles, (traci.constants.VAR_WAITING_TIME,))[:, 0]